@@ -5,40 +5,210 @@ import re
 import hashlib
 import sys
 import time
+from array import array
+from bisect import bisect_left
 from telethon import TelegramClient, events
-from telethon.errors import SessionPasswordNeededError, FloodWaitError
-from telethon.tl.types import PeerChannel, PeerChat, PeerUser, MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage, MessageEntityCustomEmoji
-from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.errors import SessionPasswordNeededError, FloodWaitError, ChatForwardsRestrictedError, MessageNotModifiedError
+from telethon.errors import (
+    ChannelPrivateError, ChannelInvalidError, ChatWriteForbiddenError, ChatAdminRequiredError, ChatRestrictedError,
+    ChatForbiddenError, UserBannedInChannelError, PeerIdInvalidError, ChatIdInvalidError, UserIsBlockedError,
+    InputUserDeactivatedError
+)
+from telethon.tl.types import PeerChat, PeerUser, MessageMediaWebPage, MessageEntityCustomEmoji
 from telethon.tl.functions.messages import GetAllStickersRequest, GetStickerSetRequest
-from telethon.tl.types import InputStickerSetID
-from telethon import utils
+from telethon.tl.functions.upload import SaveFilePartRequest, SaveBigFilePartRequest
+from telethon.tl.types import InputStickerSetID, InputFile, InputFileBig, DocumentAttributeFilename
+from telethon import utils, helpers
 import logging
+import logging.handlers
+import queue
+import atexit
+import signal
+import threading
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from itertools import islice
 from datetime import datetime, timedelta
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('telegram_forwarder.log'),
-        logging.StreamHandler()
-    ]
-)
+# Optional settings from config.py (the script also runs without it)
+try:
+    import config as user_config
+except ImportError:
+    user_config = None
+
+def get_setting(name, default=None):
+    """Read an optional setting from config.py, falling back to a default"""
+    return getattr(user_config, name, default)
+
 logger = logging.getLogger(__name__)
+forward_logger = logging.getLogger(f"{__name__}.forward")  # Per-message forwarding chatter
+emoji_logger = logging.getLogger(f"{__name__}.emoji")  # Premium emoji processing chatter
+console_logger = logging.getLogger(f"{__name__}.console")  # Terminal output from the event handlers
+console_logger.propagate = False
+
+class JsonLogFormatter(logging.Formatter):
+    """Format log records as one JSON object per line"""
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Rate-limit INFO/DEBUG records per logger so hot paths cannot flood the log
+    
+    Each sampled logger may emit `limit` records per `interval` seconds. Dropped
+    records are counted and reported on the next record that gets through.
+    WARNING and above always pass.
+    """
+    
+    def __init__(self, categories, limit=60, interval=60.0):
+        super().__init__()
+        self.categories = set(categories)
+        self.limit = limit
+        self.interval = interval
+        self.windows = {}  # category -> [window_start, emitted, suppressed]
+    
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or record.name not in self.categories:
+            return True
+        now = record.created
+        window = self.windows.get(record.name)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            window = self.windows[record.name] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+        if window[1] >= self.limit:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+    
+    def prepare(self, record):
+        # The stock handler formats here, on the event loop thread. Log arguments in
+        # this script are immutable values, so formatting later gives the same text.
+        return record
+
+log_listener = None
+console_listener = None
+
+def setup_logging():
+    """Route all logging through a queue served by a background thread
+    
+    Honors LOG_LEVEL, LOG_TO_FILE and LOG_FILE_NAME from config.py. The log file
+    gets structured JSON lines, the console keeps the readable format.
+    """
+    global log_listener, console_listener
+    if log_listener:
+        return
+    
+    level = getattr(logging, str(get_setting('LOG_LEVEL', 'INFO')).upper(), logging.INFO)
+    handlers = []
+    
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handlers.append(console_handler)
+    
+    if get_setting('LOG_TO_FILE', True):
+        try:
+            file_handler = logging.FileHandler(get_setting('LOG_FILE_NAME', 'telegram_forwarder.log'), encoding='utf-8')
+            file_handler.setFormatter(JsonLogFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"Could not open log file: {e}")
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    sample_limit = get_setting('LOG_SAMPLE_LIMIT', 60)
+    if sample_limit:
+        queue_handler.addFilter(SamplingFilter(
+            [forward_logger.name, emoji_logger.name],
+            limit=sample_limit,
+            interval=get_setting('LOG_SAMPLE_INTERVAL', 60.0)
+        ))
+    
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    
+    log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+    log_listener.start()
+    
+    # Handler status lines are printed by their own thread so a slow terminal cannot stall forwarding
+    console_queue = queue.SimpleQueue()
+    console_logger.setLevel(logging.INFO)
+    console_logger.addHandler(LazyQueueHandler(console_queue))
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(logging.Formatter('%(message)s'))
+    console_listener = logging.handlers.QueueListener(console_queue, stdout_handler)
+    console_listener.start()
+    
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the logging thread"""
+    global log_listener, console_listener
+    for listener in (console_listener, log_listener):
+        if listener:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+    log_listener = None
+    console_listener = None
 
 class Colors:
-    """ANSI color codes for terminal output"""
+    """ANSI color codes for terminal output
+    
+    Support is checked once, when the instance is created; without it every
+    color is an empty string, so attribute lookups cost nothing extra.
+    """
     # Check if colors are supported
     _colors_supported = None
     
+    CODES = {
+        'RESET': '\033[0m', 'BOLD': '\033[1m', 'DIM': '\033[2m', 'UNDERLINE': '\033[4m',
+        # Regular colors
+        'BLACK': '\033[30m', 'RED': '\033[31m', 'GREEN': '\033[32m', 'YELLOW': '\033[33m',
+        'BLUE': '\033[34m', 'MAGENTA': '\033[35m', 'CYAN': '\033[36m', 'WHITE': '\033[37m',
+        # Bright colors
+        'BRIGHT_BLACK': '\033[90m', 'BRIGHT_RED': '\033[91m', 'BRIGHT_GREEN': '\033[92m', 'BRIGHT_YELLOW': '\033[93m',
+        'BRIGHT_BLUE': '\033[94m', 'BRIGHT_MAGENTA': '\033[95m', 'BRIGHT_CYAN': '\033[96m', 'BRIGHT_WHITE': '\033[97m',
+        # Background colors
+        'BG_BLACK': '\033[40m', 'BG_RED': '\033[41m', 'BG_GREEN': '\033[42m', 'BG_YELLOW': '\033[43m',
+        'BG_BLUE': '\033[44m', 'BG_MAGENTA': '\033[45m', 'BG_CYAN': '\033[46m', 'BG_WHITE': '\033[47m',
+    }
+    
+    def __init__(self):
+        supported = self.supports_color()
+        for name, code in self.CODES.items():
+            setattr(self, name, code if supported else '')
+    
     @classmethod
     def supports_color(cls):
         """Check if terminal supports ANSI colors"""
         if cls._colors_supported is not None:
             return cls._colors_supported
         
+        # Redirected output (service logs, pipes) and NO_COLOR get plain text
+        if os.environ.get('NO_COLOR') or not sys.stdout.isatty():
+            cls._colors_supported = False
         # Check if we're in a supported terminal
-        if os.name == 'nt':  # Windows
+        elif os.name == 'nt':  # Windows
             try:
                 # Try to enable ANSI support on Windows
                 import ctypes
@@ -53,79 +223,1417 @@ class Colors:
             cls._colors_supported = True
         
         return cls._colors_supported
-    
-    @classmethod
-    def get_color(cls, color_code):
-        """Get color code if supported, otherwise return empty string"""
-        return color_code if cls.supports_color() else ""
-    
-    # Color codes - will return empty string if not supported
-    @property
-    def RESET(self): return self.get_color('\033[0m')
-    @property
-    def BOLD(self): return self.get_color('\033[1m')
-    @property
-    def DIM(self): return self.get_color('\033[2m')
-    @property
-    def UNDERLINE(self): return self.get_color('\033[4m')
-    
-    # Regular colors
-    @property
-    def BLACK(self): return self.get_color('\033[30m')
-    @property
-    def RED(self): return self.get_color('\033[31m')
-    @property
-    def GREEN(self): return self.get_color('\033[32m')
-    @property
-    def YELLOW(self): return self.get_color('\033[33m')
-    @property
-    def BLUE(self): return self.get_color('\033[34m')
-    @property
-    def MAGENTA(self): return self.get_color('\033[35m')
-    @property
-    def CYAN(self): return self.get_color('\033[36m')
-    @property
-    def WHITE(self): return self.get_color('\033[37m')
-    
-    # Bright colors
-    @property
-    def BRIGHT_BLACK(self): return self.get_color('\033[90m')
-    @property
-    def BRIGHT_RED(self): return self.get_color('\033[91m')
-    @property
-    def BRIGHT_GREEN(self): return self.get_color('\033[92m')
-    @property
-    def BRIGHT_YELLOW(self): return self.get_color('\033[93m')
-    @property
-    def BRIGHT_BLUE(self): return self.get_color('\033[94m')
-    @property
-    def BRIGHT_MAGENTA(self): return self.get_color('\033[95m')
-    @property
-    def BRIGHT_CYAN(self): return self.get_color('\033[96m')
-    @property
-    def BRIGHT_WHITE(self): return self.get_color('\033[97m')
-    
-    # Background colors
-    @property
-    def BG_BLACK(self): return self.get_color('\033[40m')
-    @property
-    def BG_RED(self): return self.get_color('\033[41m')
-    @property
-    def BG_GREEN(self): return self.get_color('\033[42m')
-    @property
-    def BG_YELLOW(self): return self.get_color('\033[43m')
-    @property
-    def BG_BLUE(self): return self.get_color('\033[44m')
-    @property
-    def BG_MAGENTA(self): return self.get_color('\033[45m')
-    @property
-    def BG_CYAN(self): return self.get_color('\033[46m')
-    @property
-    def BG_WHITE(self): return self.get_color('\033[47m')
 
 # Create a global instance
 colors = Colors()
 
+class RollingCounter:
+    """Sum of values over the last `window` seconds, kept in one-second buckets"""
+    __slots__ = ('window', 'buckets', 'stamps')
+    
+    def __init__(self, window=60):
+        self.window = window
+        self.buckets = [0] * window
+        self.stamps = [0] * window
+    
+    def add(self, value=1, now=None):
+        """Add a value to the current second (O(1))"""
+        second = int(time.monotonic() if now is None else now)
+        index = second % self.window
+        if self.stamps[index] != second:
+            self.stamps[index] = second
+            self.buckets[index] = 0
+        self.buckets[index] += value
+    
+    def total(self, now=None):
+        """Sum over the window"""
+        second = int(time.monotonic() if now is None else now)
+        return sum(
+            value for value, stamp in zip(self.buckets, self.stamps)
+            if second - stamp < self.window
+        )
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms with Prometheus text export"""
+    # Histogram bucket upper bounds in seconds
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    
+    HELP = {
+        'events_received_total': ('counter', 'Events received from Telegram by kind'),
+        'keyword_matches_total': ('counter', 'New messages from source channels that matched a keyword'),
+        'dedup_hits_total': ('counter', 'New messages skipped as duplicates'),
+        'filter_rejects_total': ('counter', 'New messages dropped before dedup and rendering, by filter'),
+        'media_dedup_hits_total': ('counter', 'New messages whose media was already forwarded within the TTL'),
+        'digest_items_total': ('counter', 'Messages added to digests per target'),
+        'forwards_total': ('counter', 'Forward attempts per target and result'),
+        'edits_total': ('counter', 'Edits of forwarded messages per target and result'),
+        'deletes_total': ('counter', 'Deletes of forwarded messages per target and result'),
+        'flood_waits_total': ('counter', 'FloodWaitError responses from Telegram'),
+        'flood_wait_seconds_total': ('counter', 'Seconds Telegram asked us to wait'),
+        'source_messages_total': ('counter', 'New messages received per source channel'),
+        'cache_lookups_total': ('counter', 'Cache lookups by cache and result'),
+        'config_reloads_total': ('counter', 'Hot reloads of channels and keywords by result'),
+        'queue_depth': ('gauge', 'Outbound sends waiting or in progress'),
+        'lane_depth': ('gauge', 'Outbound requests waiting in each priority lane'),
+        'send_limit': ('gauge', 'Learned concurrent sends per target'),
+        'circuit_open': ('gauge', '1 while sends to a target are skipped after permanent errors'),
+        'event_loop_lag_seconds': ('gauge', 'How late the event loop woke up on the last check'),
+        'loop_stalls_total': ('counter', 'Times the event loop was blocked longer than LOOP_STALL_SECONDS'),
+        'slow_handlers_total': ('counter', 'Handler calls that ran longer than SLOW_HANDLER_SECONDS'),
+        'warmup_seconds': ('gauge', 'Duration of each startup warm-up step'),
+        'structure_items': ('gauge', 'Entries in each in-memory structure at the last memory report'),
+        'structure_bytes': ('gauge', 'Approximate bytes held by each in-memory structure at the last memory report'),
+        'render_paths_total': ('counter', 'Rendered messages by path: fast skips the premium emoji enhancement'),
+        'render_seconds': ('histogram', 'Time spent preparing text and entities for sending'),
+        'send_seconds': ('histogram', 'Send latency per target'),
+        'handler_seconds': ('histogram', 'Event handler duration by handler'),
+        'receive_to_send_seconds': ('histogram', 'Time from message date to the last target send'),
+        'lane_wait_seconds': ('histogram', 'Time outbound requests waited for a worker, by lane'),
+    }
+    
+    # Counters that also keep a rolling one-minute window for the live dashboard
+    ROLLING = {
+        'events_received_total', 'source_messages_total', 'keyword_matches_total', 'dedup_hits_total',
+        'forwards_total', 'flood_wait_seconds_total', 'cache_lookups_total', 'filter_rejects_total',
+        'media_dedup_hits_total'
+    }
+    
+    def __init__(self, prefix='nifty'):
+        self.prefix = prefix
+        self.counters = {}    # name -> {labels: value}
+        self.gauges = {}      # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: [bucket_counts, sum, count]}
+        self.rolling = {}     # (name, labels) -> RollingCounter
+        self.started = time.time()
+    
+    @staticmethod
+    def _key(labels):
+        """Turn keyword labels into a hashable, ordered key"""
+        return tuple(sorted(labels.items())) if labels else ()
+    
+    def inc(self, name, value=1, **labels):
+        """Increase a counter"""
+        series = self.counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+        if name in self.ROLLING:
+            counter = self.rolling.get((name, key))
+            if counter is None:
+                counter = self.rolling[(name, key)] = RollingCounter()
+            counter.add(value)
+    
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to an absolute value"""
+        self.gauges.setdefault(name, {})[self._key(labels)] = value
+    
+    def add_gauge(self, name, delta, **labels):
+        """Move a gauge up or down"""
+        series = self.gauges.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + delta
+    
+    def observe(self, name, value, **labels):
+        """Record a histogram observation"""
+        series = self.histograms.setdefault(name, {})
+        key = self._key(labels)
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = [[0] * (len(self.DEFAULT_BUCKETS) + 1), 0.0, 0]
+        entry[0][bisect_left(self.DEFAULT_BUCKETS, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+    
+    def value(self, name, **labels):
+        """Current value of a counter or gauge series"""
+        key = self._key(labels)
+        if name in self.counters:
+            return self.counters[name].get(key, 0)
+        return self.gauges.get(name, {}).get(key, 0)
+    
+    def total(self, name):
+        """Sum of a counter or gauge across all label sets"""
+        series = self.counters.get(name) or self.gauges.get(name) or {}
+        return sum(series.values())
+    
+    def mean(self, name, **labels):
+        """Mean of a histogram series, 0.0 before the first observation"""
+        entry = self.histograms.get(name, {}).get(self._key(labels))
+        return entry[1] / entry[2] if entry and entry[2] else 0.0
+    
+    def recent(self, name, **labels):
+        """Sum of a rolling counter over the last minute, across series matching the labels"""
+        wanted = set(labels.items())
+        return sum(
+            counter.total() for (series_name, key), counter in list(self.rolling.items())
+            if series_name == name and wanted.issubset(key)
+        )
+    
+    def recent_by(self, name, label):
+        """Last-minute sums of a rolling counter grouped by one label"""
+        grouped = {}
+        for (series_name, key), counter in list(self.rolling.items()):
+            if series_name != name:
+                continue
+            value = dict(key).get(label)
+            grouped[value] = grouped.get(value, 0) + counter.total()
+        return grouped
+    
+    @staticmethod
+    def _format_labels(key, extra=None):
+        """Format a label key in Prometheus exposition syntax"""
+        pairs = list(key) + (extra or [])
+        if not pairs:
+            return ''
+        escaped = []
+        for label, val in pairs:
+            val = str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{label}="{val}"')
+        return '{' + ','.join(escaped) + '}'
+    
+    def render(self):
+        """Render all series in the Prometheus text format"""
+        lines = []
+        for kind, store in (('counter', self.counters), ('gauge', self.gauges)):
+            for name, series in sorted(store.items()):
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full_name} {self.HELP.get(name, ('', name))[1]}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                for key, val in series.items():
+                    lines.append(f"{full_name}{self._format_labels(key)} {val}")
+        for name, series in sorted(self.histograms.items()):
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {self.HELP.get(name, ('', name))[1]}")
+            lines.append(f"# TYPE {full_name} histogram")
+            for key, (buckets, total, count) in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.DEFAULT_BUCKETS, buckets):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{self._format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{full_name}_bucket{self._format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{full_name}_sum{self._format_labels(key)} {total}")
+                lines.append(f"{full_name}_count{self._format_labels(key)} {count}")
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    """Minimal local HTTP endpoint that serves a MetricsRegistry on /metrics"""
+    
+    def __init__(self, registry, host='127.0.0.1', port=9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+    
+    async def start(self):
+        """Start listening for scrape requests"""
+        self.server = await asyncio.start_server(self.handle_request, self.host, self.port)
+        logger.info("Metrics endpoint listening on http://%s:%s/metrics", self.host, self.port)
+    
+    async def stop(self):
+        """Stop the endpoint"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    async def handle_request(self, reader, writer):
+        """Answer a single HTTP request"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Skip the request headers
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else '/'
+            if path in ('/', '/metrics'):
+                status = '200 OK'
+                body = self.registry.render().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'Not found\n'
+            
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug("Metrics request failed: %s", e)
+        finally:
+            writer.close()
+
+def normalize_peer_id(peer):
+    """Positive id for a Peer object or a (possibly marked) integer chat id
+    
+    Source ids are stored positive, while events carry either Peer objects or marked
+    ids (-100... for channels, -... for basic groups), so every handler uses this.
+    """
+    if peer is None:
+        return None
+    if isinstance(peer, int):
+        return utils.resolve_id(peer)[0] if peer < 0 else peer
+    for attribute in ('channel_id', 'chat_id', 'user_id'):
+        value = getattr(peer, attribute, None)
+        if value is not None:
+            return abs(value)
+    return None
+
+def compile_keywords(keywords):
+    """Compile keywords into one case-insensitive pattern, or None when there are none"""
+    keywords = [keyword for keyword in keywords if keyword]
+    if not keywords:
+        return None
+    # Longest first so overlapping keywords cannot shadow each other
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(keyword) for keyword in ordered), re.IGNORECASE)
+
+def peer_type(message):
+    """'channel', 'group' or 'private' from the peer alone (no requests)"""
+    peer = message.peer_id
+    if isinstance(peer, PeerUser):
+        return 'private'
+    if isinstance(peer, PeerChat):
+        return 'group'
+    # Broadcast channel posts carry the post flag; supergroup messages do not
+    return 'channel' if getattr(message, 'post', False) else 'group'
+
+def sent_by_bot(message):
+    """Whether a bot sent the message, from the message and the client's entity cache (no requests)
+    
+    Telethon only sets message.sender when the update carried the user, so the
+    cache the client fills from earlier updates is checked as well. Channel posts
+    have no sender at all: a bot posting as the channel itself is not detected.
+    """
+    if getattr(message, 'via_bot_id', None):
+        return True
+    sender = getattr(message, 'sender', None)
+    if sender is not None:
+        return bool(getattr(sender, 'bot', False))
+    from_id = getattr(message, 'from_id', None)
+    if not isinstance(from_id, PeerUser):
+        return False
+    cache = getattr(getattr(message, '_client', None), '_mb_entity_cache', None)
+    entity = cache.get(from_id.user_id) if cache is not None else None
+    return entity is not None and entity.ty == ord('B')  # Telethon's EntityType.BOT
+
+def build_message_filters():
+    """Ordered (name, rejects) checks from config.py, cheapest first
+    
+    Each check only inspects attributes already on the message, so rejected
+    messages never reach hashing, emoji processing or sending. Disabled
+    settings add no check at all. Keywords are matched last, per route.
+    """
+    filters = []
+    
+    allowed_types = {
+        peer for peer, setting in (
+            ('channel', 'FORWARD_FROM_CHANNELS'),
+            ('group', 'FORWARD_FROM_GROUPS'),
+            ('private', 'FORWARD_FROM_PRIVATE_CHATS'),
+        ) if get_setting(setting, True)
+    }
+    if len(allowed_types) < 3:
+        filters.append(('peer_type', lambda message: peer_type(message) not in allowed_types))
+    
+    if get_setting('IGNORE_BOTS', False):
+        filters.append(('bot', sent_by_bot))
+    
+    if get_setting('IGNORE_FORWARDS', False):
+        filters.append(('forward', lambda message: getattr(message, 'fwd_from', None) is not None))
+    
+    if get_setting('IGNORE_MEDIA', False):
+        # Link previews are not media the user sent
+        filters.append(('media', lambda message: message.media is not None
+                        and not isinstance(message.media, MessageMediaWebPage)))
+    
+    min_length = get_setting('MIN_MESSAGE_LENGTH', 0)
+    max_length = get_setting('MAX_MESSAGE_LENGTH', 0)
+    if min_length:
+        filters.append(('min_length', lambda message: len(message.message or '') < min_length))
+    if max_length:
+        filters.append(('max_length', lambda message: len(message.message or '') > max_length))
+    
+    return tuple(filters)
+
+class Route:
+    """Compiled keyword matcher and target list for one source channel"""
+    __slots__ = ('keyword_pattern', 'targets')
+    
+    def __init__(self, keyword_pattern, targets):
+        self.keyword_pattern = keyword_pattern
+        self.targets = targets
+    
+    def matches(self, text):
+        """Check if text contains any of this route's keywords"""
+        if not text or self.keyword_pattern is None:
+            return False
+        return self.keyword_pattern.search(text) is not None
+
+class ForwardingRules:
+    """Immutable snapshot of the compiled keyword matchers, source ids and targets
+    
+    Every source channel maps to a Route. Sources listed in `routes` get their own
+    keywords and/or targets; all others use the global keywords and every target.
+    Sources marked "group" are basic groups, whose deletes arrive without a chat id.
+    Targets listed in `digests` receive batched digest messages instead.
+    Handlers read `forwarder.rules` once per event, so a reload swaps the whole
+    snapshot in a single assignment while in-flight events finish on the old one.
+    """
+    __slots__ = ('keywords', 'keyword_pattern', 'source_ids', 'group_ids', 'sources', 'targets', 'routes', 'filters', 'digests')
+    
+    def __init__(self, source_channels=(), target_channels=(), keywords=(), routes=None, digests=None):
+        self.filters = build_message_filters()
+        self.keywords = tuple(keywords)
+        self.keyword_pattern = compile_keywords(self.keywords)
+        self.targets = tuple(target_channels)
+        
+        targets_by_id = {abs(ch['id']): ch for ch in self.targets}
+        default_route = Route(self.keyword_pattern, self.targets)
+        patterns = {self.keywords: self.keyword_pattern}  # Sources with the same keywords share one regex
+        self.routes = {}
+        self.sources = {}  # Normalized id -> source channel record
+        for ch in source_channels:
+            source_id = abs(ch['id'])
+            self.sources[source_id] = ch
+            custom = (routes or {}).get(str(source_id)) or (routes or {}).get(str(ch['id']))
+            if not custom:
+                self.routes[source_id] = default_route
+                continue
+            
+            route_keywords = tuple(custom.get('keywords', self.keywords))
+            if route_keywords not in patterns:
+                patterns[route_keywords] = compile_keywords(route_keywords)
+            if 'targets' in custom:
+                route_targets = []
+                for target_id in custom['targets']:
+                    target = targets_by_id.get(abs(int(target_id)))
+                    if target:
+                        route_targets.append(target)
+                    else:
+                        logger.warning("Route for source %s names unknown target %s, ignoring it", source_id, target_id)
+                route_targets = tuple(route_targets)
+            else:
+                route_targets = self.targets
+            self.routes[source_id] = Route(patterns[route_keywords], route_targets)
+        self.source_ids = frozenset(self.routes)
+        self.group_ids = frozenset(abs(ch['id']) for ch in source_channels if ch.get('group'))
+        
+        self.digests = {}  # Target id -> (seconds, max items) for targets in digest mode
+        for target_id, settings in (digests or {}).items():
+            target_id = abs(int(target_id))
+            if target_id not in targets_by_id:
+                logger.warning("Digest settings name unknown target %s, ignoring them", target_id)
+                continue
+            self.digests[target_id] = (float(settings.get('interval', 60)), max(1, int(settings.get('max_items', 10))))
+    
+    def matches(self, text):
+        """Check if text contains any of the global keywords"""
+        if not text or self.keyword_pattern is None:
+            return False
+        return self.keyword_pattern.search(text) is not None
+    
+    def route_for(self, channel_id):
+        """Route for a source channel id, or None if it is not a source"""
+        return self.routes.get(channel_id)
+    
+    def rejected_by(self, message):
+        """Name of the first filter that rejects the message, or None"""
+        for name, rejects in self.filters:
+            if rejects(message):
+                return name
+        return None
+
+class MessageMap:
+    """Source message -> forwarded copies, stored compactly for long uptimes
+    
+    Keys pack (source id, message id) into one int and each value is an
+    array('q') of [stamp, target id, target message id, ...], a fraction of the
+    size of a string key plus a list of dicts. Above its 32 bits, a target
+    message id carries a hash of the text and entities sent there (0 = unknown),
+    so edits can skip copies that already show the new text. A negative target
+    message id marks a digest message shared by several sources. With max_age set, the oldest
+    entries are evicted in insertion order; with a spill file they are moved to
+    SQLite so edits and deletes of old messages still find their copies.
+    The spill methods block on disk and run on the forwarder's I/O thread.
+    
+    Saving does not copy the map: every change is also noted in `changes`, and
+    the I/O thread applies those to `saved`, its own copy, before writing it.
+    
+    Telegram sends deletes in basic groups and private chats without a chat id.
+    Message ids there are unique per account, so `group_messages` maps the message
+    ids of in-memory entries from basic-group sources to their source. Only those
+    sources are indexed, so a private-chat delete matches nothing.
+    """
+    MESSAGE_BITS = 32  # Telegram message ids fit in 32 bits
+    MESSAGE_MASK = (1 << MESSAGE_BITS) - 1
+    
+    def __init__(self, max_age=0, spill_path=None):
+        self.entries = {}  # Packed key -> array('q'), oldest first
+        self.max_age = max_age  # Seconds before an entry is evicted (0 = never)
+        self.spill_path = spill_path  # SQLite file for evicted entries (None = drop them)
+        self.spill_db = None
+        self.spilled = bool(spill_path) and os.path.exists(spill_path)
+        self.changes = {}  # Packed key -> new record, or None if removed, since the last take_changes()
+        self.saved = {}  # The entries as last written; only changed under saved_lock
+        self.saved_lock = threading.Lock()
+        self.group_ids = frozenset()  # Basic-group sources, set by index_groups()
+        self.group_messages = {}  # Message id -> basic-group source id
+    
+    @classmethod
+    def pack(cls, channel_id, message_id):
+        return (channel_id << cls.MESSAGE_BITS) | message_id
+    
+    @classmethod
+    def pack_copy(cls, target_message_id, payload=0):
+        """Target message id with the payload hash above it; digest copies carry none"""
+        if target_message_id < 0 or not payload:
+            return target_message_id
+        return (payload << cls.MESSAGE_BITS) | target_message_id
+    
+    @classmethod
+    def copies(cls, record, payloads=False):
+        """(target id, target message id) pairs of a record, plus the payload hash if asked"""
+        mask, bits = cls.MESSAGE_MASK, cls.MESSAGE_BITS
+        values = zip(record[1::2], record[2::2])
+        if payloads:
+            return [(target_id, value, 0) if value < 0 else (target_id, value & mask, value >> bits)
+                    for target_id, value in values]
+        return [(target_id, value if value < 0 else value & mask) for target_id, value in values]
+    
+    def add(self, channel_id, message_id, copies, stamp=None):
+        """Remember the copies of a source message, as (target id, message id[, payload hash])"""
+        record = array('q', [int(time.time()) if stamp is None else stamp])
+        for copy in copies:
+            record.append(copy[0])
+            record.append(self.pack_copy(*copy[1:]))
+        key = self.pack(channel_id, message_id)
+        self.entries.pop(key, None)  # Keep insertion order equal to age order
+        self.entries[key] = record
+        self.changes[key] = record
+        if channel_id in self.group_ids:
+            self.group_messages[message_id] = channel_id
+    
+    def extend(self, channel_id, message_id, copies):
+        """Add copies of a source message, keeping those already recorded"""
+        existing = self.get(channel_id, message_id, payloads=True) or []
+        self.add(channel_id, message_id, existing + list(copies))
+    
+    def get(self, channel_id, message_id, payloads=False):
+        record = self.entries.get(self.pack(channel_id, message_id))
+        return None if record is None else self.copies(record, payloads)
+    
+    def set_payload(self, channel_id, message_id, target_ids, payload):
+        """Record that the copies in target_ids now show the payload with this hash"""
+        key = self.pack(channel_id, message_id)
+        record = self.entries.get(key)
+        if record is None:
+            return  # Spilled: its next edit is sent without comparing
+        record = array('q', record)  # A new array: snapshots may still hold the old one
+        for index in range(1, len(record), 2):
+            if record[index] in target_ids and record[index + 1] >= 0:
+                record[index + 1] = self.pack_copy(record[index + 1] & self.MESSAGE_MASK, payload)
+        self.entries[key] = record
+        self.changes[key] = record
+    
+    def pop(self, channel_id, message_id):
+        key = self.pack(channel_id, message_id)
+        record = self.entries.pop(key, None)
+        if record is None:
+            return None
+        self.changes[key] = None
+        self.unindex(key)
+        return self.copies(record)
+    
+    def index_groups(self, group_ids):
+        """Index the message ids of these basic-group sources, if they changed"""
+        if group_ids == self.group_ids:
+            return
+        self.group_ids = group_ids
+        self.group_messages = {}
+        if not group_ids:
+            return
+        for key in self.entries:
+            if key >> self.MESSAGE_BITS in group_ids:
+                self.group_messages[key & self.MESSAGE_MASK] = key >> self.MESSAGE_BITS
+    
+    def unindex(self, key):
+        message_id = key & self.MESSAGE_MASK
+        if self.group_messages.get(message_id) == key >> self.MESSAGE_BITS:
+            del self.group_messages[message_id]
+    
+    def __contains__(self, source):
+        return self.pack(*source) in self.entries
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def take_changes(self):
+        """Changes since the last call, to pass to saved_json; O(1) on the event loop"""
+        changes, self.changes = self.changes, {}
+        return changes
+    
+    def restore_changes(self, changes):
+        """Put back changes whose snapshot was not written; newer changes win"""
+        changes.update(self.changes)
+        self.changes = changes
+    
+    def saved_json(self, changes):
+        """Apply changes to the saved copy and serialize it as
+        {"<source id>_<message id>": [stamp, target id, target message id, ...]}
+        
+        Records are never modified in place, so the saved copy can share them.
+        """
+        with self.saved_lock:
+            saved = self.saved
+            for key, record in changes.items():
+                previous = saved.get(key)
+                if record is None or (previous is not None and previous[0] != record[0]):
+                    saved.pop(key, None)  # Re-added entries move to the end, as in entries
+                if record is not None:
+                    saved[key] = record
+            return {
+                f"{key >> self.MESSAGE_BITS}_{key & self.MESSAGE_MASK}": record.tolist()
+                for key, record in saved.items()
+            }
+    
+    def load_json(self, data):
+        """Replace the entries with saved ones, accepting the old list-of-dicts format"""
+        self.entries = {}
+        self.group_messages = {}
+        for key, value in data.items():
+            try:
+                channel_id, message_id = (int(part) for part in key.rsplit('_', 1))
+                if value and isinstance(value[0], dict):
+                    self.add(channel_id, message_id, [(copy['channel_id'], copy['message_id']) for copy in value])
+                elif value:
+                    self.add(channel_id, message_id, zip(value[1::2], value[2::2]), stamp=value[0])
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning("Skipping unreadable message map entry %r: %s", key, e)
+        self.changes = {}
+        with self.saved_lock:
+            self.saved = dict(self.entries)
+    
+    def evict_older_than(self, cutoff):
+        """Remove entries stamped before cutoff and return them as (key, record)"""
+        evicted = []
+        for key, record in self.entries.items():
+            if record[0] >= cutoff:
+                break
+            evicted.append((key, record))
+        for key, _ in evicted:
+            del self.entries[key]
+            self.changes[key] = None
+            self.unindex(key)
+        return evicted
+    
+    def open_spill(self):
+        if self.spill_db is None:
+            import sqlite3
+            self.spill_db = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self.spill_db.execute(
+                "CREATE TABLE IF NOT EXISTS message_map ("
+                "source_id INTEGER, message_id INTEGER, record BLOB NOT NULL, "
+                "PRIMARY KEY (source_id, message_id)) WITHOUT ROWID"
+            )
+        return self.spill_db
+    
+    def spill(self, evicted):
+        """Store evicted entries in the spill file"""
+        db = self.open_spill()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO message_map VALUES (?, ?, ?)",
+                ((key >> self.MESSAGE_BITS, key & self.MESSAGE_MASK, record.tobytes()) for key, record in evicted)
+            )
+        self.spilled = True
+    
+    def load_spilled(self, channel_id, message_id, remove=False, payloads=False):
+        """Copies of a spilled entry, or None"""
+        db = self.open_spill()
+        row = db.execute(
+            "SELECT record FROM message_map WHERE source_id = ? AND message_id = ?", (channel_id, message_id)
+        ).fetchone()
+        if row is None:
+            return None
+        if remove:
+            with db:
+                db.execute("DELETE FROM message_map WHERE source_id = ? AND message_id = ?", (channel_id, message_id))
+        record = array('q')
+        record.frombytes(row[0])
+        return self.copies(record, payloads)
+    
+    def close_spill(self):
+        if self.spill_db is not None:
+            self.spill_db.close()
+            self.spill_db = None
+
+def payload_hash(text, entities):
+    """31-bit hash of the text and formatting entities sent for a message, never 0"""
+    digest = hashlib.blake2b((text or '').encode('utf-8', 'surrogatepass'), digest_size=4)
+    for entity in entities or ():
+        # TLObjects have no __repr__ of their own; to_dict() holds the type and every field
+        digest.update(str(entity.to_dict()).encode('utf-8', 'surrogatepass'))
+    return (int.from_bytes(digest.digest(), 'big') >> 1) or 1
+
+class DigestItem:
+    """One source message inside a digest"""
+    __slots__ = ('source_id', 'message_id', 'title', 'text')
+    
+    def __init__(self, source_id, message_id, title, text):
+        self.source_id = source_id
+        self.message_id = message_id
+        self.title = title
+        self.text = text
+    
+    def render(self):
+        return f"📢 {self.title}\n{self.text}"
+
+class Digest:
+    """Source messages combined into one message for a target in digest mode"""
+    MAX_LENGTH = 4096  # Telegram's limit for the text of one message
+    SEPARATOR = '\n\n'
+    __slots__ = ('target_id', 'message_id', 'items')
+    
+    def __init__(self, target_id, message_id=None, items=None):
+        self.target_id = target_id
+        self.message_id = message_id  # Set once the digest has been sent
+        self.items = items or []
+    
+    def render(self):
+        return self.SEPARATOR.join(item.render() for item in self.items)
+    
+    def fits(self, item):
+        """Whether one more item keeps the digest within a single message"""
+        if not self.items:
+            return True
+        return len(self.render()) + len(self.SEPARATOR) + len(item.render()) <= self.MAX_LENGTH
+    
+    def find(self, source_id, message_id):
+        return next((item for item in self.items
+                     if item.source_id == source_id and item.message_id == message_id), None)
+    
+    def overflow(self):
+        """Remove and return the items that do not fit in one message (only a requeued digest has any)"""
+        length = 0
+        for index, item in enumerate(self.items):
+            length += len(item.render()) + (len(self.SEPARATOR) if index else 0)
+            if index and length > self.MAX_LENGTH:
+                rest = self.items[index:]
+                del self.items[index:]
+                return rest
+        return []
+    
+    def remove(self, source_id, message_id):
+        """Drop an item; True if it was there"""
+        item = self.find(source_id, message_id)
+        if item is None:
+            return False
+        self.items.remove(item)
+        return True
+    
+    def to_json(self):
+        return [[item.source_id, item.message_id, item.title, item.text] for item in self.items]
+
+class MediaDedupIndex:
+    """Recently forwarded media by file identity, so reposts are not transferred again
+    
+    Photos and documents are keyed by their id. Large documents are also keyed by
+    size, MIME type and duration, which catches the same file uploaded again
+    under a new id. Entries expire after `ttl` seconds; since the TTL is fixed,
+    insertion order is expiry order and pruning only looks at the oldest entries.
+    """
+    REUPLOAD_MIN_SIZE = 1024 * 1024  # Smaller files are too likely to collide by size
+    
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.expiry = {}  # Key -> monotonic expiry time, oldest first
+    
+    @classmethod
+    def keys_for(cls, media):
+        """Identity keys of a photo or document, empty for other media"""
+        photo = getattr(media, 'photo', None)
+        if photo is not None:
+            return (('photo', photo.id),)
+        document = getattr(media, 'document', None)
+        if document is None:
+            return ()
+        keys = [('document', document.id)]
+        size = getattr(document, 'size', 0) or 0
+        if size >= cls.REUPLOAD_MIN_SIZE:
+            duration = next((attribute.duration for attribute in getattr(document, 'attributes', None) or ()
+                             if hasattr(attribute, 'duration')), None)
+            keys.append(('upload', size, getattr(document, 'mime_type', None), duration))
+        return tuple(keys)
+    
+    def prune(self, now):
+        while self.expiry:
+            key, expires = next(iter(self.expiry.items()))
+            if expires > now:
+                break
+            del self.expiry[key]
+    
+    def check_and_add(self, media):
+        """True if this media was forwarded within the TTL; remembers it otherwise"""
+        keys = self.keys_for(media)
+        if not keys:
+            return False
+        now = time.monotonic()
+        self.prune(now)
+        if any(key in self.expiry for key in keys):
+            return True
+        for key in keys:
+            self.expiry[key] = now + self.ttl
+        return False
+    
+    def discard(self, media):
+        """Forget media whose forward failed, so the next repost is sent"""
+        for key in self.keys_for(media):
+            self.expiry.pop(key, None)
+    
+    def __len__(self):
+        return len(self.expiry)
+
+class MediaCache:
+    """Size-capped directory of downloaded media, keyed by photo/document id
+    
+    Files are downloaded under a `.part` name and renamed into place, so a crash
+    never leaves a truncated entry, and open() deletes leftover `.part` files.
+    Once the directory grows past max_bytes, the least recently used files are
+    deleted, except files with an upload in progress. open(), store() and
+    evict() touch the disk and run on the forwarder's I/O thread.
+    """
+    
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # Key -> (path, size), least recently used first
+        self.total_bytes = 0
+        self.pinned = {}  # Key -> uploads in progress
+        self.lock = threading.Lock()  # Lookups run on the event loop, writes on the I/O thread
+    
+    @staticmethod
+    def key_for(media):
+        """Cache key for a photo or document, None for media without a file id"""
+        photo = getattr(media, 'photo', None)
+        if photo is not None and getattr(photo, 'id', None):
+            return f"photo-{photo.id}"
+        document = getattr(media, 'document', None)
+        if document is not None and getattr(document, 'id', None):
+            return f"document-{document.id}"
+        return None
+    
+    def open(self):
+        """Create the directory, drop interrupted downloads and index what is left"""
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.part'):
+                TelegramForwarder.remove_file_quietly(entry.path)
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            # Oldest first, so files written long ago are evicted first
+            for _, name, path, size in sorted(found):
+                self.entries[os.path.splitext(name)[0]] = (path, size)
+                self.total_bytes += size
+        self.evict()
+    
+    def temp_path(self, key):
+        return os.path.join(self.directory, f"{key}.{time.monotonic_ns()}.part")
+    
+    def acquire(self, key):
+        """Path of a cached file, pinned until release(), or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+            return entry[0]
+    
+    def release(self, key):
+        with self.lock:
+            count = self.pinned.get(key, 0) - 1
+            if count > 0:
+                self.pinned[key] = count
+            else:
+                self.pinned.pop(key, None)
+    
+    def store(self, key, temp_path, extension):
+        """Move a finished download into place and return its path, pinned"""
+        path = os.path.join(self.directory, f"{key}{extension}")
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self.entries[key] = (path, size)
+            self.total_bytes += size
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+        self.evict()
+        return path
+    
+    def evict(self):
+        """Delete least recently used files until the cache fits its budget"""
+        removed = []
+        with self.lock:
+            for key in list(self.entries):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if self.pinned.get(key):
+                    continue
+                path, size = self.entries.pop(key)
+                self.total_bytes -= size
+                removed.append(path)
+        for path in removed:
+            TelegramForwarder.remove_file_quietly(path)
+
+class OutboundScheduler:
+    """Limits outbound requests in flight and queues the rest in priority lanes
+    
+    While a slot is free, requests run right away. Otherwise they wait in their
+    lane, and a finished request hands its slot on by weighted round robin in
+    priority order: the first lane with work and credit left in the current
+    round goes next. Deletes therefore go first, but every lane with work gets
+    its weight in turns per round, so none can starve. Inside a lane,
+    destinations take turns, so one busy target cannot hold up the others.
+    """
+    LANES = ('delete', 'edit', 'new', 'backfill')
+    WEIGHTS = {'delete': 8, 'edit': 4, 'new': 2, 'backfill': 1}
+    
+    def __init__(self, metrics, limit=8):
+        self.metrics = metrics
+        self.limit = max(1, limit)
+        self.active = 0  # Requests in flight
+        self.waiting = 0  # Requests queued in any lane
+        self.queues = {lane: OrderedDict() for lane in self.LANES}  # Lane -> destination -> deque of (queued at, turn)
+        self.credits = dict(self.WEIGHTS)
+    
+    async def run(self, lane, destination, func, *args, **kwargs):
+        """`await func(*args, **kwargs)` once a slot is free and return its result"""
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+        else:
+            turn = asyncio.get_running_loop().create_future()
+            queue = self.queues[lane].get(destination)
+            if queue is None:
+                queue = self.queues[lane][destination] = deque()
+            queue.append((time.monotonic(), turn))
+            self.waiting += 1
+            self.metrics.add_gauge('lane_depth', 1, lane=lane)
+            try:
+                await turn  # Resolved by release() with the slot of a finished request
+            except asyncio.CancelledError:
+                if turn.done() and not turn.cancelled():
+                    self.release()  # Got the slot just as we were cancelled: pass it on
+                raise
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.release()
+    
+    def release(self):
+        """Hand the slot of a finished request to the next waiter, or free it"""
+        while self.waiting:
+            lane, (queued_at, turn) = self.next_waiter()
+            if not turn.done():  # Skip callers that stopped waiting
+                self.metrics.observe('lane_wait_seconds', time.monotonic() - queued_at, lane=lane)
+                turn.set_result(None)
+                return
+        self.active -= 1
+    
+    def next_waiter(self):
+        """Take the next waiter by lane credit, then destination turn"""
+        waiting = [lane for lane in self.LANES if self.queues[lane]]
+        lane = next((lane for lane in waiting if self.credits[lane] > 0), None)
+        if lane is None:
+            # Every lane with work has used its turns: start a new round
+            self.credits = dict(self.WEIGHTS)
+            lane = waiting[0]
+        self.credits[lane] -= 1
+        
+        destinations = self.queues[lane]
+        destination, queue = next(iter(destinations.items()))
+        waiter = queue.popleft()
+        if queue:
+            destinations.move_to_end(destination)
+        else:
+            del destinations[destination]
+        self.waiting -= 1
+        self.metrics.add_gauge('lane_depth', -1, lane=lane)
+        return lane, waiter
+
+class SendLimiter:
+    """Concurrent sends per destination, learned by additive increase and multiplicative decrease
+    
+    A destination starts at its saved limit, or `initial`. Each send that finishes
+    within `slow_seconds` adds 1/limit, so the limit grows by about one per round
+    of clean sends, up to `maximum`. A flood wait or a slower send halves it, at
+    most once per `slow_seconds`, because one flood wait usually hits every send
+    in flight. Telethon sleeps through short flood waits on its own, which shows
+    up here as a slow send.
+    
+    Callers hold slot() around the whole send and wrap each request in
+    measure(). The slot is taken before an OutboundScheduler slot, so sends
+    waiting for a throttled target never hold one of the global slots.
+    """
+    
+    def __init__(self, metrics, initial=2, maximum=8, slow_seconds=3.0):
+        self.metrics = metrics
+        self.initial = initial
+        self.maximum = max(1, maximum)
+        self.slow_seconds = slow_seconds
+        self.limits = {}  # Destination -> learned limit
+        self.active = {}  # Destination -> sends in flight
+        self.waiters = {}  # Destination -> deque of futures waiting for a free slot
+        self.backed_off = {}  # Destination -> monotonic time of the last decrease
+    
+    def limit(self, destination):
+        return self.limits.get(destination, self.initial)
+    
+    def load(self, data):
+        """Restore limits saved by to_json()"""
+        for destination, limit in data.items():
+            try:
+                self.limits[int(destination)] = min(self.maximum, max(1.0, float(limit)))
+            except (ValueError, TypeError):
+                continue
+    
+    def to_json(self):
+        return {str(destination): round(limit, 2) for destination, limit in self.limits.items()}
+    
+    @asynccontextmanager
+    async def slot(self, destination):
+        """Hold one of the destination's concurrent sends, waiting while it is at its limit"""
+        active = self.active.get(destination, 0)
+        if active < int(self.limit(destination)) and not self.waiters.get(destination):
+            self.active[destination] = active + 1
+        else:
+            turn = asyncio.get_running_loop().create_future()
+            self.waiters.setdefault(destination, deque()).append(turn)
+            try:
+                await turn  # Resolved by wake(), which counts us as active
+            except asyncio.CancelledError:
+                if turn.done() and not turn.cancelled():
+                    self.active[destination] -= 1
+                    self.wake(destination)
+                raise
+        try:
+            yield
+        finally:
+            self.active[destination] -= 1
+            self.wake(destination)
+    
+    async def measure(self, destination, func, *args, **kwargs):
+        """`await func(*args, **kwargs)` inside slot(), learning the limit from how long it took"""
+        started = time.monotonic()
+        flooded = False
+        try:
+            return await func(*args, **kwargs)
+        except FloodWaitError:
+            flooded = True
+            raise
+        finally:
+            self.adjust(destination, flooded or time.monotonic() - started > self.slow_seconds)
+            self.wake(destination)  # The limit may have grown
+    
+    def adjust(self, destination, congested):
+        limit = self.limit(destination)
+        if congested:
+            now = time.monotonic()
+            last = self.backed_off.get(destination)
+            if last is not None and now - last < self.slow_seconds:
+                return
+            self.backed_off[destination] = now
+            limit = max(1.0, limit / 2)
+        else:
+            limit = min(self.maximum, limit + 1 / limit)
+        self.limits[destination] = limit
+        self.metrics.set_gauge('send_limit', round(limit, 2), target=str(destination))
+    
+    def wake(self, destination):
+        """Let waiting sends start while the destination is below its limit"""
+        waiters = self.waiters.get(destination)
+        while waiters and self.active.get(destination, 0) < int(self.limit(destination)):
+            turn = waiters.popleft()
+            if not turn.done():  # Skip callers that stopped waiting
+                self.active[destination] += 1
+                turn.set_result(None)
+        if waiters is not None and not waiters:
+            del self.waiters[destination]
+
+# Characters the premium enhancement can replace with custom emojis
+EMOJI_PATTERN = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002600-\U000027BF\U0001F900-\U0001F9FF]')
+
+# Errors that retrying will not fix: the target is gone or we may no longer post there
+PERMANENT_SEND_ERRORS = (
+    ChannelPrivateError, ChannelInvalidError, ChatWriteForbiddenError, ChatAdminRequiredError, ChatRestrictedError,
+    ChatForbiddenError, UserBannedInChannelError, PeerIdInvalidError, ChatIdInvalidError, UserIsBlockedError,
+    InputUserDeactivatedError
+)
+
+class CircuitBreaker:
+    """Stops sending to targets that keep failing with permanent errors
+    
+    After `threshold` permanent errors in a row the circuit of a target opens and
+    sends to it are skipped. Once every `probe_seconds` a single send goes
+    through as a probe: success closes the circuit, anything else keeps it open
+    for another interval. Other errors neither count nor reset the count.
+    """
+    
+    def __init__(self, metrics, threshold=3, probe_seconds=300):
+        self.metrics = metrics
+        self.threshold = max(1, threshold)
+        self.probe_seconds = probe_seconds
+        self.failures = {}  # Destination -> permanent errors in a row
+        self.opened = {}  # Destination -> monotonic time of opening or of the last probe
+        self.probing = set()  # Open destinations with a probe in flight
+    
+    def is_open(self, destination):
+        return destination in self.opened
+    
+    def allow(self, destination):
+        """Whether to send now; while open, lets one probe through per interval"""
+        opened = self.opened.get(destination)
+        if opened is None:
+            return True
+        if destination in self.probing or time.monotonic() - opened < self.probe_seconds:
+            return False
+        self.probing.add(destination)
+        return True
+    
+    def success(self, destination):
+        """Record a successful send; True if this closed the circuit"""
+        self.failures.pop(destination, None)
+        if self.opened.pop(destination, None) is None:
+            return False
+        self.probing.discard(destination)
+        self.metrics.set_gauge('circuit_open', 0, target=str(destination))
+        return True
+    
+    def cancel_probe(self, destination):
+        """A probe was cancelled before it finished: let the next one through"""
+        self.probing.discard(destination)
+    
+    def failure(self, destination, permanent):
+        """Record a failed send; True if this opened the circuit"""
+        if destination in self.opened:
+            # A failed probe: wait another interval before the next one
+            self.probing.discard(destination)
+            self.opened[destination] = time.monotonic()
+            return False
+        if not permanent:
+            return False
+        count = self.failures[destination] = self.failures.get(destination, 0) + 1
+        if count < self.threshold:
+            return False
+        self.opened[destination] = time.monotonic()
+        self.metrics.set_gauge('circuit_open', 1, target=str(destination))
+        return True
+
+def append_report(path, title, lines):
+    """Append one titled report to a diagnostics file; errors are logged, never raised"""
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(f"===== {datetime.now().isoformat(timespec='seconds')} {title}\n")
+            f.writelines(lines)
+            f.write("\n")
+    except OSError as e:
+        logger.warning("Could not write report to %s: %s", path, e)
+
+def awaiting_stack(coro):
+    """Formatted stack of a suspended coroutine, down to the await it is waiting on
+    
+    Task.get_stack() only shows the outermost frame; this follows cr_await.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return traceback.format_list(traceback.StackSummary.extract(frames))
+
+class LoopWatchdog:
+    """Thread that notices when the event loop is blocked and records where
+    
+    The loop bumps a heartbeat every `interval` seconds. While the heartbeat is
+    older than `threshold`, the thread samples the loop thread's stack every
+    `interval`; once the loop runs again, the samples go to `path`, most frequent
+    stack first. This finds synchronous work (file writes, long regexes) that an
+    asyncio-level timer can only see after the fact. Cost while the loop is
+    healthy: one callback and one thread wake-up per interval.
+    """
+    MAX_SAMPLES = 100  # Per stall
+    
+    def __init__(self, path, metrics, threshold=1.0, interval=0.1):
+        self.path = path
+        self.metrics = metrics
+        self.threshold = threshold
+        self.interval = interval
+        self.loop = None
+        self.loop_thread = None
+        self.beat = time.monotonic()
+        self.handle = None
+        self.thread = None
+        self.stopped = threading.Event()
+    
+    def start(self):
+        """Start watching the running loop; call from the loop thread"""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.stopped.clear()
+        self.heartbeat()
+        self.thread = threading.Thread(target=self.watch, name='loop-watchdog', daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+    
+    def heartbeat(self):
+        self.beat = time.monotonic()
+        if not self.stopped.is_set():
+            self.handle = self.loop.call_later(self.interval, self.heartbeat)
+    
+    def watch(self):
+        samples = []
+        stalled = 0.0
+        while not self.stopped.wait(self.interval):
+            behind = time.monotonic() - self.beat - self.interval
+            if behind >= self.threshold:
+                stalled = behind
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None and len(samples) < self.MAX_SAMPLES:
+                    samples.append(tuple(traceback.format_stack(frame)))
+                del frame
+            elif samples:
+                self.report(stalled, samples)
+                samples = []
+        if samples:
+            self.report(stalled, samples)
+    
+    def report(self, stalled, samples):
+        counts = {}
+        for stack in samples:
+            counts[stack] = counts.get(stack, 0) + 1
+        lines = []
+        for stack, count in sorted(counts.items(), key=lambda item: -item[1]):
+            lines.append(f"--- {count}/{len(samples)} samples\n")
+            lines.extend(stack)
+        append_report(self.path, f"event loop blocked for {stalled:.2f}s", lines)
+        logger.warning("Event loop was blocked for %.2fs, stacks written to %s", stalled, self.path)
+        try:
+            self.loop.call_soon_threadsafe(self.metrics.inc, 'loop_stalls_total')
+        except RuntimeError:
+            pass  # Loop already closed
+
+def approximate_size(container, sample=1000):
+    """Bytes held by a dict, set or list plus its direct keys and values (nested objects not followed)
+    
+    Only the first `sample` items are measured and the rest are assumed to be
+    the same size, so large maps do not stall the event loop.
+    """
+    size = sys.getsizeof(container)
+    if isinstance(container, dict):
+        items = [sys.getsizeof(key) + sys.getsizeof(value) for key, value in islice(container.items(), sample)]
+    else:
+        items = [sys.getsizeof(item) for item in islice(container, sample)]
+    if items:
+        size += sum(items) * len(container) // len(items)
+    return size
+
+class MemoryProfiler:
+    """tracemalloc snapshots on request, each compared with the previous and the first one
+    
+    Tracing slows down every allocation and adds memory per live block, so it
+    only runs when MEMORY_TRACE_FRAMES is set. The previous and the first
+    snapshot are kept for the comparisons.
+    """
+    TOP = 15  # Allocation sites per section
+    
+    def __init__(self, frames=1):
+        self.frames = max(1, frames)
+        self.first = None
+        self.previous = None
+        self.started_tracing = False
+    
+    def start(self):
+        import tracemalloc  # Only needed when tracing is on
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+    
+    def stop(self):
+        import tracemalloc
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.first = self.previous = None
+    
+    def format_stats(self, stats):
+        lines = []
+        for stat in stats[:self.TOP]:
+            lines.append(f"{stat}\n")
+            if self.frames > 1:
+                lines.extend(f"    {line}\n" for line in stat.traceback.format(most_recent_first=True))
+        return lines
+    
+    def report(self):
+        """Traced memory now, then the allocation sites that grew since the earlier reports"""
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return []
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+            tracemalloc.Filter(False, '*/linecache.py'),  # Source lines read while formatting reports
+        ))
+        key = 'traceback' if self.frames > 1 else 'lineno'
+        lines = [f"traced: {current / 1048576:.1f} MB now, {peak / 1048576:.1f} MB peak\n"]
+        if self.previous is None:
+            lines.append("--- largest allocation sites\n")
+            lines.extend(self.format_stats(snapshot.statistics(key)))
+        else:
+            lines.append("--- growth since the previous report\n")
+            lines.extend(self.format_stats(snapshot.compare_to(self.previous, key)))
+            if self.first is not self.previous:
+                lines.append("--- growth since the first report\n")
+                lines.extend(self.format_stats(snapshot.compare_to(self.first, key)))
+        if self.first is None:
+            self.first = snapshot
+        self.previous = snapshot
+        return lines
+
+class EventRecorder:
+    """Opt-in recorder that writes incoming events to a compact gzip JSON-lines file
+    
+    Each line is one event; replay it with benchmarks/replay.py. With hash_text
+    enabled, message text is replaced by a short digest plus its length so the
+    file can be shared without leaking content.
+    """
+    FLUSH_EVERY = 200  # Buffered records per write
+    
+    def __init__(self, path, hash_text=True, executor=None):
+        self.path = path
+        self.executor = executor  # Writes happen here when given
+        self.hash_text = hash_text
+        self.started = time.monotonic()
+        self.buffer = []
+        self.count = 0
+        self.buffer.append({'v': 1, 'started': time.time(), 'hashed': hash_text})
+    
+    @staticmethod
+    def describe_media(media):
+        """Small JSON description of a message's media"""
+        if not media:
+            return None
+        if hasattr(media, 'photo') and media.photo is not None:
+            return {'t': 'photo', 'id': getattr(media.photo, 'id', None)}
+        if hasattr(media, 'document') and media.document is not None:
+            document = media.document
+            return {
+                't': 'document',
+                'id': getattr(document, 'id', None),
+                'size': getattr(document, 'size', None),
+                'mime': getattr(document, 'mime_type', None)
+            }
+        if isinstance(media, MessageMediaWebPage):
+            return {'t': 'webpage', 'url': getattr(media.webpage, 'url', None)}
+        return {'t': type(media).__name__}
+    
+    def describe_message(self, message, keyword_check=None):
+        """Serialize the parts of a message the handlers look at
+        
+        keyword_check is the source's keyword matcher; whether the text matched
+        at record time is stored, so replays can keep the same messages.
+        """
+        text = message.text or ''
+        record = {
+            'c': utils.get_peer_id(message.peer_id, add_mark=False) if message.peer_id else None,
+            'm': message.id,
+            'n': len(text),
+            'kw': bool(keyword_check(text)) if keyword_check else None,
+            'g': getattr(message, 'grouped_id', None),
+            'f': bool(getattr(message, 'fwd_from', None)),
+            'd': message.date.timestamp() if message.date else None,
+            'ed': message.edit_date.timestamp() if getattr(message, 'edit_date', None) else None,
+        }
+        if self.hash_text:
+            record['h'] = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16] if text else None
+        else:
+            record['x'] = text
+        if message.entities:
+            record['e'] = [
+                [type(entity).__name__, entity.offset, entity.length, getattr(entity, 'document_id', None)]
+                for entity in message.entities
+            ]
+        media = self.describe_media(message.media)
+        if media:
+            record['md'] = media
+        return record
+    
+    def record(self, kind, event, keyword_check=None):
+        """Append one event; never raises into the handler"""
+        try:
+            if kind == 'delete':
+                record = {'ids': list(event.deleted_ids), 'c': event.chat_id}
+            else:
+                record = self.describe_message(event.message, keyword_check)
+            record['k'] = kind
+            record['t'] = round(time.monotonic() - self.started, 4)
+            self.buffer.append(record)
+            self.count += 1
+            if len(self.buffer) >= self.FLUSH_EVERY:
+                self.flush()
+        except Exception as e:
+            logger.warning("Could not record %s event: %s", kind, e)
+    
+    def flush(self):
+        """Append buffered records to the file, on the executor if there is one"""
+        if not self.buffer:
+            return None
+        lines = ''.join(json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n' for record in self.buffer)
+        self.buffer = []
+        if self.executor:
+            return self.executor.submit(self.write_lines, lines)
+        self.write_lines(lines)
+        return None
+    
+    def write_lines(self, lines):
+        """Append already serialized lines to the gzip file"""
+        import gzip  # Only needed when recording is on
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            f.write(lines)
+    
+    def close(self):
+        """Flush what is left and wait for pending writes"""
+        try:
+            pending = self.flush()
+            if pending:
+                pending.result()
+            logger.info("Recorded %s events to %s", self.count, self.path)
+        except Exception as e:
+            logger.error("Error writing event recording: %s", e)
+
 class TelegramForwarder:
     def __init__(self):
         self.client = None
@@ -135,18 +1643,70 @@ class TelegramForwarder:
         self.source_channels = []
         self.target_channels = []
         self.keywords = []
+        self.routes = {}  # Per-source overrides: {"<source id>": {"keywords": [...], "targets": [ids]}}
+        self.digests = {}  # Targets in digest mode: {"<target id>": {"interval": seconds, "max_items": n}}
+        self.digest_pending = {}  # Target id -> Digest being collected
+        self.digest_timers = {}  # Target id -> task that sends the pending digest when its interval ends
+        self.digest_sent = OrderedDict()  # (target id, message id) -> sent Digest, oldest first
         self.config_file = 'forwarder_config.json'
+        self.headless = False  # Started with --start: no menu, no prompts
+        self.animations = sys.stdout.isatty()  # Spinners and typing effects only on a real terminal
         self.session_file = 'NiftyForwarder_session'
-        self.message_map = {}  # Maps source_msg_id to target_msg_ids
+        self.message_map = MessageMap(  # Maps source messages to their forwarded copies
+            max_age=get_setting('MESSAGE_MAP_MAX_AGE_DAYS', 0) * 86400,
+            spill_path=get_setting('MESSAGE_MAP_SPILL_FILE', 'message_map.sqlite')
+        )
         self.message_hashes = set()  # Set to store message hashes to prevent duplicates
         self.is_premium = False
         # Hardcoded formatting settings for optimal premium emoji support
         self.use_markdown = True  # Always enable Markdown formatting (HARDCODED)
         self.preserve_formatting = True  # Always preserve original formatting (HARDCODED)
         self.custom_emoji_cache = {}  # Cache for custom emoji document IDs
+        self.emoji_index = None  # Emoji -> document id from the installed sticker sets, built once
+        self.emoji_index_task = None
+        self.metrics = MetricsRegistry()  # Always collected, exported only when METRICS_ENABLED
+        self.metrics_server = None
+        self.entity_cache = {}  # Resolved target entities by channel id
+        self.background_tasks = []  # Tasks that live as long as the forwarder runs
+        self.io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='nifty-io')  # Disk writes, in order
+        self.state_dirty = False  # Unsaved changes waiting for the write-behind flush
+        self.rules = ForwardingRules()  # Rebuilt by rebuild_rules() whenever channels or keywords change
+        self.config_mtime = None  # mtime of the config file as we last read or wrote it
+        self.handlers_registered = False
+        self.recorder = None  # EventRecorder when RECORD_EVENTS_FILE is set
+        self.watchdog = None  # LoopWatchdog while the forwarder runs, unless LOOP_STALL_SECONDS is 0
+        self.stall_file = get_setting('STALL_REPORT_FILE', 'stalls.txt')
+        self.running_handlers = {}  # Handler task -> [kind, started, event, reported as slow]
+        self.pending_forwards = {}  # (source id, message id) -> ([target ids not sent yet], text only)
+        self.stopping = False  # Shutdown started: new messages are saved for after the restart
+        self.stop_reason = None
+        self.shutdown_event = None
+        self.memory_file = get_setting('MEMORY_REPORT_FILE', 'memory.txt')
+        self.memory_profiler = None  # MemoryProfiler while the forwarder runs, when MEMORY_TRACE_FRAMES is set
+        self.media_dedup = str(get_setting('MEDIA_DEDUP', 'off')).lower()  # 'off', 'skip' or 'text'
+        self.media_index = MediaDedupIndex(get_setting('MEDIA_DEDUP_TTL_HOURS', 24) * 3600)
+        cache_megabytes = get_setting('MEDIA_CACHE_MAX_MB', 256)
+        self.media_cache = MediaCache(  # Downloads shared by targets and retries (None = disabled)
+            get_setting('MEDIA_CACHE_DIR', 'media_cache'), cache_megabytes * 1024 * 1024
+        ) if cache_megabytes else None
+        self.media_cache_ready = False
+        self.scheduler = OutboundScheduler(self.metrics, get_setting('OUTBOUND_CONCURRENCY', 8))
+        self.send_limiter = SendLimiter(
+            self.metrics,
+            initial=get_setting('SEND_CONCURRENCY_START', 2),
+            maximum=get_setting('SEND_CONCURRENCY_MAX', 8),
+            slow_seconds=get_setting('SEND_SLOW_SECONDS', 3)
+        )
+        self.breaker = CircuitBreaker(
+            self.metrics,
+            threshold=get_setting('CIRCUIT_BREAKER_THRESHOLD', 3),
+            probe_seconds=get_setting('CIRCUIT_PROBE_SECONDS', 300)
+        )
         
     def safe_input(self, prompt, default=""):
         """Safe input function that handles EOFError gracefully"""
+        if self.headless:
+            return default
         try:
             return input(prompt)
         except EOFError:
@@ -169,10 +1729,8 @@ class TelegramForwarder:
     
     def print_loading_animation(self, text="Loading", duration=2):
         """Print a loading animation"""
-        if not colors.supports_color():
-            print(f"🔄 {text}...")
-            time.sleep(duration)
-            print(f"✓ {text} complete!")
+        if not self.animations:
+            print(f"✓ {text}")
             return
             
         frames = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
@@ -219,7 +1777,7 @@ class TelegramForwarder:
     
     def animate_text(self, text, delay=0.05):
         """Animate text character by character"""
-        if not colors.supports_color():
+        if not self.animations:
             print(text)
             return
             
@@ -252,14 +1810,93 @@ class TelegramForwarder:
                     self.source_channels = config.get('source_channels', [])
                     self.target_channels = config.get('target_channels', [])
                     self.keywords = config.get('keywords', [])
-                    self.message_map = config.get('message_map', {})
+                    self.routes = config.get('routes', {})
+                    self.digests = config.get('digests', {})
+                    self.load_sent_digests(config.get('digest_messages', {}))
+                    self.message_map.load_json(config.get('message_map', {}))
                     self.message_hashes = set(config.get('message_hashes', []))
                     self.custom_emoji_cache = config.get('custom_emoji_cache', {})
+                    self.send_limiter.load(config.get('send_limits', {}))
+                    self.load_pending_forwards(config.get('pending_forwards', {}))
                     # Note: use_markdown and preserve_formatting are now hardcoded
+                self.config_mtime = os.stat(self.config_file).st_mtime_ns
                 logger.info("Configuration loaded successfully")
-                logger.info(f"Loaded {len(self.message_hashes)} message hashes for duplicate prevention")
+                logger.info("Loaded %s message hashes for duplicate prevention", len(self.message_hashes))
             except Exception as e:
-                logger.error(f"Error loading config: {e}")
+                logger.error("Error loading config: %s", e)
+        self.rebuild_rules()
+    
+    def rebuild_rules(self):
+        """Compile the current channels and keywords into a new rules snapshot"""
+        self.rules = ForwardingRules(self.source_channels, self.target_channels, self.keywords, self.routes, self.digests)
+        self.message_map.index_groups(self.rules.group_ids)
+    
+    def mark_basic_group(self, channel_id):
+        """Remember that a source is a basic group; saved, so restarts index it too"""
+        for ch in self.source_channels:
+            if abs(ch['id']) == channel_id:
+                ch['group'] = True
+        self.rebuild_rules()
+        self.request_save()
+    
+    def read_config_file(self):
+        """Read the config file and its mtime (runs on the I/O thread)"""
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return config, os.stat(self.config_file).st_mtime_ns
+    
+    async def reload_config(self):
+        """Re-read channels and keywords from the config file and swap in new rules
+        
+        Event handlers stay registered and the client stays connected; runtime state
+        (message map, hashes, caches) is owned by the running process and not reloaded.
+        """
+        try:
+            config, mtime = await asyncio.get_running_loop().run_in_executor(self.io_executor, self.read_config_file)
+            source_channels = config.get('source_channels', [])
+            target_channels = config.get('target_channels', [])
+            keywords = config.get('keywords', [])
+            routes = config.get('routes', {})
+            digests = config.get('digests', {})
+            if not isinstance(source_channels, list) or not isinstance(target_channels, list) or not isinstance(keywords, list):
+                raise ValueError("source_channels, target_channels and keywords must be lists")
+            if not isinstance(routes, dict):
+                raise ValueError("routes must be an object keyed by source channel id")
+            if not isinstance(digests, dict):
+                raise ValueError("digests must be an object keyed by target channel id")
+            
+            rules = ForwardingRules(source_channels, target_channels, keywords, routes, digests)
+            self.source_channels = source_channels
+            self.target_channels = target_channels
+            self.keywords = keywords
+            self.routes = routes
+            self.digests = digests
+            self.rules = rules
+            self.message_map.index_groups(rules.group_ids)
+            self.config_mtime = mtime
+            self.metrics.inc('config_reloads_total', result='ok')
+            logger.info("Configuration reloaded: %s sources, %s targets, %s keywords", len(source_channels), len(target_channels), len(keywords))
+            self.live_print(f"{colors.BRIGHT_CYAN}🔄 Configuration reloaded ({len(source_channels)} sources, {len(target_channels)} targets, {len(keywords)} keywords){colors.RESET}")
+            return True
+        except Exception as e:
+            self.metrics.inc('config_reloads_total', result='error')
+            logger.error("Error reloading config, keeping the current rules: %s", e)
+            return False
+    
+    def config_changed_on_disk(self):
+        """Check whether someone else has modified the config file since we last read or wrote it"""
+        try:
+            return os.stat(self.config_file).st_mtime_ns != self.config_mtime
+        except OSError:
+            return False
+    
+    async def watch_config_file(self, interval):
+        """Reload when the config file changes on disk"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if await loop.run_in_executor(self.io_executor, self.config_changed_on_disk):
+                await self.reload_config()
     
     def generate_message_hash(self, message):
         """Generate a unique hash for a message based on its content"""
@@ -296,11 +1933,11 @@ class TelegramForwarder:
             # Generate MD5 hash
             message_hash = hashlib.md5(hash_content.encode('utf-8')).hexdigest()
             
-            logger.debug(f"Generated hash {message_hash} for message content: {hash_content[:100]}...")
+            forward_logger.debug("Generated hash %s for message content: %s...", message_hash, hash_content[:100])
             return message_hash
             
         except Exception as e:
-            logger.error(f"Error generating message hash: {e}")
+            forward_logger.error("Error generating message hash: %s", e)
             # Return a timestamp-based fallback hash
             return hashlib.md5(str(datetime.now().timestamp()).encode()).hexdigest()
     
@@ -311,14 +1948,14 @@ class TelegramForwarder:
             is_duplicate = message_hash in self.message_hashes
             
             if is_duplicate:
-                logger.info(f"Duplicate message detected with hash: {message_hash}")
+                forward_logger.info("Duplicate message detected with hash: %s", message_hash)
                 return True
             else:
-                logger.debug(f"New message with hash: {message_hash}")
+                forward_logger.debug("New message with hash: %s", message_hash)
                 return False
                 
         except Exception as e:
-            logger.error(f"Error checking duplicate message: {e}")
+            forward_logger.error("Error checking duplicate message: %s", e)
             return False  # If error, assume it's not a duplicate
     
     def add_message_hash(self, message):
@@ -326,17 +1963,17 @@ class TelegramForwarder:
         try:
             message_hash = self.generate_message_hash(message)
             self.message_hashes.add(message_hash)
-            logger.debug(f"Added message hash: {message_hash}")
+            forward_logger.debug("Added message hash: %s", message_hash)
             
             # Clean up old hashes if set gets too large (keep last 10000 hashes)
             if len(self.message_hashes) > 10000:
                 # Convert to list, remove oldest 1000, convert back to set
                 hash_list = list(self.message_hashes)
                 self.message_hashes = set(hash_list[-9000:])  # Keep last 9000
-                logger.info(f"Cleaned up old message hashes, now have {len(self.message_hashes)} hashes")
+                forward_logger.info("Cleaned up old message hashes, now have %s hashes", len(self.message_hashes))
             
         except Exception as e:
-            logger.error(f"Error adding message hash: {e}")
+            forward_logger.error("Error adding message hash: %s", e)
     
     def clear_message_hashes(self):
         """Clear all message hashes (useful for testing or reset)"""
@@ -385,56 +2022,22 @@ class TelegramForwarder:
         """Automatically find document_id for custom emoji"""
         try:
             # Check cache first
+            self.metrics.inc('cache_lookups_total', cache='emoji', result='hit' if emoji_text in self.custom_emoji_cache else 'miss')
             if emoji_text in self.custom_emoji_cache:
                 cached_id = self.custom_emoji_cache[emoji_text]
                 # Validate cached ID is within bounds
                 if not (-9223372036854775808 <= cached_id <= 9223372036854775807):
-                    logger.warning(f"Cached document ID {cached_id} for emoji '{emoji_text}' is out of bounds, removing from cache")
+                    emoji_logger.warning("Cached document ID %s for emoji '%s' is out of bounds, removing from cache", cached_id, emoji_text)
                     del self.custom_emoji_cache[emoji_text]
                 else:
                     return cached_id
             
             # Try to find custom emoji from user's available stickers/emojis
-            try:
-                # Get user's installed sticker sets
-                from telethon.tl.functions.messages import GetAllStickersRequest
-                from telethon.tl.functions.messages import GetStickerSetRequest
-                from telethon.tl.types import InputStickerSetID
-                
-                # Get all installed sticker sets
-                all_stickers = await self.client(GetAllStickersRequest(hash=0))
-                
-                # Search through sticker sets for matching emoji
-                for sticker_set in all_stickers.sets:
-                    try:
-                        # Get sticker set details
-                        sticker_set_full = await self.client(GetStickerSetRequest(
-                            stickerset=InputStickerSetID(
-                                id=sticker_set.id,
-                                access_hash=sticker_set.access_hash
-                            ),
-                            hash=0
-                        ))
-                        
-                        # Check if any documents match our emoji
-                        for document in sticker_set_full.documents:
-                            if hasattr(document, 'attributes'):
-                                for attr in document.attributes:
-                                    if hasattr(attr, 'alt') and attr.alt == emoji_text:
-                                        # Found a matching custom emoji!
-                                        # Validate document ID is within bounds
-                                        if -9223372036854775808 <= document.id <= 9223372036854775807:
-                                            self.custom_emoji_cache[emoji_text] = document.id
-                                            logger.info(f"Found real document_id {document.id} for emoji '{emoji_text}'")
-                                            return document.id
-                                        else:
-                                            logger.warning(f"Found document ID {document.id} for emoji '{emoji_text}' but it's out of bounds")
-                    except Exception as e:
-                        # Skip problematic sticker sets
-                        continue
-                        
-            except Exception as e:
-                logger.warning(f"Could not access sticker API: {e}")
+            document_id = (await self.get_emoji_index()).get(emoji_text)
+            if document_id is not None:
+                self.custom_emoji_cache[emoji_text] = document_id
+                emoji_logger.info("Found real document_id %s for emoji '%s'", document_id, emoji_text)
+                return document_id
             
             # If no real custom emoji found, generate a placeholder document ID
             # Use a more conservative approach for generating placeholder IDs
@@ -444,14 +2047,64 @@ class TelegramForwarder:
             
             # Cache the result
             self.custom_emoji_cache[emoji_text] = document_id
-            logger.info(f"Generated safe placeholder document_id {document_id} for emoji '{emoji_text}'")
+            emoji_logger.info("Generated safe placeholder document_id %s for emoji '%s'", document_id, emoji_text)
             
             return document_id
             
         except Exception as e:
-            logger.error(f"Error getting custom emoji document ID: {e}")
+            emoji_logger.error("Error getting custom emoji document ID: %s", e)
             return None
     
+    async def build_emoji_index(self, concurrency=4):
+        """Map each emoji to the first matching document in the installed sticker sets"""
+        all_stickers = await self.client(GetAllStickersRequest(hash=0))
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def fetch(sticker_set):
+            async with semaphore:
+                try:
+                    return await self.client(GetStickerSetRequest(
+                        stickerset=InputStickerSetID(
+                            id=sticker_set.id,
+                            access_hash=sticker_set.access_hash
+                        ),
+                        hash=0
+                    ))
+                except Exception as e:
+                    # Skip problematic sticker sets
+                    emoji_logger.debug("Skipping sticker set %s: %s", sticker_set.id, e)
+                    return None
+        
+        index = {}
+        for sticker_set_full in await asyncio.gather(*(fetch(sticker_set) for sticker_set in all_stickers.sets)):
+            if sticker_set_full is None:
+                continue
+            for document in sticker_set_full.documents:
+                if not -9223372036854775808 <= document.id <= 9223372036854775807:
+                    continue
+                for attr in getattr(document, 'attributes', None) or ():
+                    alt = getattr(attr, 'alt', None)
+                    if alt and alt not in index:
+                        index[alt] = document.id
+        emoji_logger.info("Indexed %s emojis from %s sticker sets", len(index), len(all_stickers.sets))
+        return index
+    
+    async def get_emoji_index(self):
+        """The emoji index, built on first use unless warm-up already built it"""
+        if self.emoji_index is None:
+            if self.emoji_index_task is None:
+                self.emoji_index_task = asyncio.ensure_future(self.build_emoji_index())
+            try:
+                # Shielded: one caller giving up must not cancel the build for the others
+                self.emoji_index = await asyncio.shield(self.emoji_index_task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                emoji_logger.warning("Could not access sticker API: %s", e)
+                self.emoji_index_task = None  # Try again on the next miss
+                return {}
+        return self.emoji_index
+    
     async def create_custom_emoji_entity(self, text, emoji_char, offset=0):
         """Create MessageEntityCustomEmoji entity automatically"""
         try:
@@ -462,11 +2115,11 @@ class TelegramForwarder:
                     length=len(emoji_char),
                     document_id=document_id
                 )
-                logger.info(f"Created custom emoji entity for '{emoji_char}' at offset {offset}")
+                emoji_logger.info("Created custom emoji entity for '%s' at offset %s", emoji_char, offset)
                 return entity
             return None
         except Exception as e:
-            logger.error(f"Error creating custom emoji entity: {e}")
+            emoji_logger.error("Error creating custom emoji entity: %s", e)
             return None
     
     async def enhance_message_with_custom_emojis(self, message_text):
@@ -475,15 +2128,11 @@ class TelegramForwarder:
             if not self.is_premium or not message_text:
                 return message_text, []
             
-            # Find potential emoji characters (this is simplified - you'd want better emoji detection)
-            import re
-            emoji_pattern = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002600-\U000027BF\U0001F900-\U0001F9FF]')
-            
             entities = []
             enhanced_text = message_text
             
-            # Find all emoji matches
-            for match in emoji_pattern.finditer(message_text):
+            # Find all emoji matches (this is simplified - you'd want better emoji detection)
+            for match in EMOJI_PATTERN.finditer(message_text):
                 emoji_char = match.group()
                 offset = match.start()
                 
@@ -491,7 +2140,7 @@ class TelegramForwarder:
                 entity = await self.create_custom_emoji_entity(enhanced_text, emoji_char, offset)
                 if entity:
                     entities.append(entity)
-                    logger.info(f"Added custom emoji entity for '{emoji_char}' at position {offset}")
+                    emoji_logger.info("Added custom emoji entity for '%s' at position %s", emoji_char, offset)
             
             # Clean up markdown tags for better display
             clean_text = self.clean_markdown_tags(enhanced_text)
@@ -499,7 +2148,7 @@ class TelegramForwarder:
             return clean_text, entities
             
         except Exception as e:
-            logger.error(f"Error enhancing message with custom emojis: {e}")
+            emoji_logger.error("Error enhancing message with custom emojis: %s", e)
             return message_text, []
     
     def clean_markdown_tags(self, text):
@@ -532,40 +2181,136 @@ class TelegramForwarder:
             return text
             
         except Exception as e:
-            logger.error(f"Error cleaning markdown tags: {e}")
+            logger.error("Error cleaning markdown tags: %s", e)
             return text
     
+    def build_config_snapshot(self):
+        """Copy the persisted state so it can be written from another thread"""
+        return {
+            'api_id': self.api_id,
+            'api_hash': self.api_hash,
+            'phone_number': self.phone_number,
+            'source_channels': list(self.source_channels),
+            'target_channels': list(self.target_channels),
+            'keywords': list(self.keywords),
+            'routes': dict(self.routes),
+            'digests': dict(self.digests),
+            'digest_messages': {
+                f"{target_id}_{message_id}": digest.to_json()
+                for (target_id, message_id), digest in self.digest_sent.items()
+            },
+            'message_map': self.message_map.take_changes(),  # Applied and serialized by write_config_file
+            'message_hashes': list(self.message_hashes),  # Save as list for JSON
+            'custom_emoji_cache': dict(self.custom_emoji_cache),
+            'send_limits': self.send_limiter.to_json(),
+            'pending_forwards': {
+                f"{channel_id}_{message_id}": {'targets': list(target_ids), 'text_only': text_only}
+                for (channel_id, message_id), (target_ids, text_only) in self.pending_forwards.items()
+                if target_ids
+            }
+            # Note: use_markdown and preserve_formatting are hardcoded and not saved
+        }
+    
+    def write_config_file(self, config):
+        """Write a config snapshot atomically (temp file, fsync, rename)"""
+        config = dict(config, message_map=self.message_map.saved_json(config['message_map']))
+        temp_file = f"{self.config_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.config_file)
+        self.config_mtime = os.stat(self.config_file).st_mtime_ns
+    
     def save_config(self):
         """Save configuration to file"""
+        snapshot = self.build_config_snapshot()
         try:
-            config = {
-                'api_id': self.api_id,
-                'api_hash': self.api_hash,
-                'phone_number': self.phone_number,
-                'source_channels': self.source_channels,
-                'target_channels': self.target_channels,
-                'keywords': self.keywords,
-                'message_map': self.message_map,
-                'message_hashes': list(self.message_hashes),  # Save as list for JSON
-                'custom_emoji_cache': self.custom_emoji_cache
-                # Note: use_markdown and preserve_formatting are hardcoded and not saved
-            }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
+            self.write_config_file(snapshot)
+            self.state_dirty = False
             logger.info("Configuration saved successfully")
         except Exception as e:
-            logger.error(f"Error saving config: {e}")
+            self.message_map.restore_changes(snapshot['message_map'])
+            logger.error("Error saving config: %s", e)
+    
+    def request_save(self):
+        """Mark state as changed; the write-behind flush persists it off the event loop"""
+        self.state_dirty = True
+    
+    async def flush_state(self):
+        """Write pending state changes on the I/O thread"""
+        if not self.state_dirty:
+            return
+        # Pick up hand edits first so the snapshot we write does not undo them
+        if await asyncio.get_running_loop().run_in_executor(self.io_executor, self.config_changed_on_disk):
+            await self.reload_config()
+        self.state_dirty = False
+        snapshot = self.build_config_snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.io_executor, self.write_config_file, snapshot)
+            logger.debug("State flushed to disk")
+        except asyncio.CancelledError:
+            # Stopped mid-write (e.g. at shutdown): the final flush must still write it
+            self.state_dirty = True
+            self.message_map.restore_changes(snapshot['message_map'])
+            raise
+        except Exception as e:
+            self.state_dirty = True  # Try again on the next flush
+            self.message_map.restore_changes(snapshot['message_map'])
+            logger.error("Error saving config: %s", e)
+    
+    async def flush_state_periodically(self, interval):
+        """Write-behind loop: persist state at most once per interval"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.evict_old_mappings()
+            await self.flush_state()
+    
+    async def evict_old_mappings(self):
+        """Move message mappings older than MESSAGE_MAP_MAX_AGE_DAYS out of memory"""
+        message_map = self.message_map
+        if not message_map.max_age:
+            return
+        evicted = message_map.evict_older_than(time.time() - message_map.max_age)
+        if not evicted:
+            return
+        self.request_save()
+        if message_map.spill_path:
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.io_executor, message_map.spill, evicted)
+            except Exception as e:
+                logger.error("Error spilling message map entries: %s", e)
+                return
+        logger.info("Evicted %s old message mappings, %s remain in memory", len(evicted), len(message_map))
+    
+    async def lookup_forwarded(self, channel_id, message_id, remove=False, payloads=False):
+        """Forwarded copies of a source message, checking the spill file on a miss"""
+        message_map = self.message_map
+        copies = message_map.pop(channel_id, message_id) if remove else message_map.get(channel_id, message_id, payloads)
+        if copies is None and message_map.spilled:
+            try:
+                copies = await asyncio.get_running_loop().run_in_executor(
+                    self.io_executor, message_map.load_spilled, channel_id, message_id, remove, payloads
+                )
+            except Exception as e:
+                logger.error("Error reading spilled message map: %s", e)
+        return copies
+    
+    @staticmethod
+    def remove_file_quietly(path):
+        """Delete a temporary file, ignoring errors"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    def live_print(self, text):
+        """Print a status line from an event handler without blocking the event loop"""
+        console_logger.info(text)
     
     def contains_keyword(self, text):
         """Check if text contains any of the keywords"""
-        if not text or not self.keywords:
-            return False
-        
-        text_lower = text.lower()
-        for keyword in self.keywords:
-            if keyword.lower() in text_lower:
-                return True
-        return False
+        return self.rules.matches(text)
     
     def get_parse_mode(self):
         """Get the appropriate parse mode - HARDCODED to use markdown"""
@@ -585,12 +2330,12 @@ class TelegramForwarder:
         ]
         
         if existing_custom_emojis:
-            logger.info(f"Found {len(existing_custom_emojis)} existing custom emojis in message")
+            emoji_logger.info("Found %s existing custom emojis in message", len(existing_custom_emojis))
             for entity in existing_custom_emojis:
                 start = entity.offset
                 end = entity.offset + entity.length
                 emoji_char = existing_text[start:end]
-                logger.info(f"Preserving existing custom emoji '{emoji_char}' with ID {entity.document_id}")
+                emoji_logger.info("Preserving existing custom emoji '%s' with ID %s", emoji_char, entity.document_id)
             
             # Clean the text for better display but keep entities
             clean_text = self.clean_markdown_tags(existing_text)
@@ -598,7 +2343,7 @@ class TelegramForwarder:
         
         # If no existing custom emojis and user is premium, try to enhance the message
         if self.is_premium:
-            logger.info("No existing custom emojis found, attempting to enhance message")
+            emoji_logger.info("No existing custom emojis found, attempting to enhance message")
             # This will be handled by the async enhancement method
             return existing_text, existing_entities
         
@@ -621,7 +2366,7 @@ class TelegramForwarder:
             return formatted_text
             
         except Exception as e:
-            logger.error(f"Error formatting message with markdown: {e}")
+            logger.error("Error formatting message with markdown: %s", e)
             return message.text
     
     def create_premium_emoji_text(self, emoji_char, emoji_id):
@@ -689,11 +2434,88 @@ class TelegramForwarder:
             return True
             
         except Exception as e:
-            logger.error(f"Login error: {e}")
+            logger.error("Login error: %s", e)
             self.print_error(f"Login failed: {e}")
             self.safe_input(f"\n{colors.BRIGHT_RED}Press Enter to continue...{colors.RESET}")
             return False
     
+    async def warm_up(self, deadline):
+        """Fill caches before the handlers are registered, so the first forwards are not late
+        
+        Steps run concurrently and are timed. At the deadline the handlers are
+        registered anyway; unfinished steps keep running in the background.
+        """
+        loop = asyncio.get_running_loop()
+        timings = {}
+        
+        async def compile_rules():
+            self.rebuild_rules()
+        
+        async def load_state():
+            # Pick up hand edits made while we were stopped, then open the files we read from
+            if await loop.run_in_executor(self.io_executor, self.config_changed_on_disk):
+                await self.reload_config()
+            if self.media_cache and not self.media_cache_ready:
+                await loop.run_in_executor(self.io_executor, self.media_cache.open)
+                self.media_cache_ready = True
+            if self.message_map.spilled:
+                await loop.run_in_executor(self.io_executor, self.message_map.open_spill)
+        
+        async def resolve_targets():
+            channel_ids = [channel['id'] for channel in self.target_channels]
+            results = await asyncio.gather(*(self.resolve_entity(channel_id) for channel_id in channel_ids),
+                                           return_exceptions=True)
+            missing = [channel_id for channel_id, result in zip(channel_ids, results) if isinstance(result, ValueError)]
+            if missing:
+                # Not in the session cache yet: loading the dialogs caches every chat we are in
+                await self.client.get_dialogs()
+                results = await asyncio.gather(*(self.resolve_entity(channel_id) for channel_id in missing),
+                                               return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning("Could not resolve a target channel during warm-up: %s", result)
+        
+        async def timed(name, step):
+            started = time.perf_counter()
+            try:
+                await step
+            except Exception as e:
+                logger.warning("Warm-up step '%s' failed: %s", name, e)
+            finally:
+                timings[name] = time.perf_counter() - started
+                self.metrics.set_gauge('warmup_seconds', timings[name], step=name)
+        
+        steps = {
+            'rules': compile_rules(),
+            'state': load_state(),
+            'entities': resolve_targets(),
+        }
+        if self.is_premium:
+            steps['emoji index'] = self.get_emoji_index()
+        
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(timed(name, step)) for name, step in steps.items()]
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        self.background_tasks.extend(pending)
+        
+        report = ', '.join(
+            f"{name} {timings[name] * 1000:.0f} ms" if name in timings else f"{name} still running"
+            for name in steps
+        )
+        logger.info("Warm-up took %.2fs: %s", time.perf_counter() - started, report)
+        print(f"{colors.BRIGHT_CYAN}🔥 Warm-up ({time.perf_counter() - started:.2f}s): {report}{colors.RESET}")
+    
+    async def resolve_entity(self, channel_id):
+        """Get a target entity, caching it so repeated sends skip the lookup"""
+        entity = self.entity_cache.get(channel_id)
+        if entity is not None:
+            self.metrics.inc('cache_lookups_total', cache='entity', result='hit')
+            return entity
+        self.metrics.inc('cache_lookups_total', cache='entity', result='miss')
+        entity = await self.client.get_entity(channel_id)
+        self.entity_cache[channel_id] = entity
+        return entity
+    
     async def get_channel_id(self, channel_input):
         """Get channel ID from username or invite link"""
         try:
@@ -707,7 +2529,7 @@ class TelegramForwarder:
             
             return entity.id, entity.title
         except Exception as e:
-            logger.error(f"Error getting channel {channel_input}: {e}")
+            logger.error("Error getting channel %s: %s", channel_input, e)
             return None, None
     
     async def set_source_channels(self):
@@ -743,6 +2565,7 @@ class TelegramForwarder:
                 channel_count -= 1  # Don't increment if failed
         
         self.source_channels = new_channels
+        self.rebuild_rules()
         self.save_config()
         
         if len(self.source_channels) > 0:
@@ -785,6 +2608,7 @@ class TelegramForwarder:
                 channel_count -= 1  # Don't increment if failed
         
         self.target_channels = new_channels
+        self.rebuild_rules()
         self.save_config()
         
         if len(self.target_channels) > 0:
@@ -810,6 +2634,7 @@ class TelegramForwarder:
         
         if keywords_input:
             self.keywords = [kw.strip() for kw in keywords_input.split(',') if kw.strip()]
+            self.rebuild_rules()
             self.save_config()
             self.print_success(f"✅ {len(self.keywords)} keywords set: {', '.join(self.keywords)}")
         else:
@@ -817,51 +2642,371 @@ class TelegramForwarder:
         
         self.safe_input(f"\n{colors.BRIGHT_GREEN}Press Enter to continue...{colors.RESET}")
     
-    async def send_message_without_forward_tag(self, source_message, target_channel_id):
-        """Send message without forward tag with premium emoji and formatting support"""
+    def note_rpc_error(self, error):
+        """Record flood waits and other RPC errors in the metrics registry"""
+        if isinstance(error, FloodWaitError):
+            self.metrics.inc('flood_waits_total')
+            self.metrics.inc('flood_wait_seconds_total', error.seconds)
+    
+    DIGEST_HISTORY = 1000  # Sent digests kept for edits and deletes
+    
+    def load_pending_forwards(self, data):
+        """Restore unfinished fan-outs saved by build_config_snapshot"""
+        self.pending_forwards = {}
+        for key, entry in data.items():
+            try:
+                channel_id, message_id = (int(part) for part in key.rsplit('_', 1))
+                self.pending_forwards[(channel_id, message_id)] = (
+                    [int(target_id) for target_id in entry['targets']], bool(entry.get('text_only'))
+                )
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning("Skipping unreadable pending forward %r: %s", key, e)
+    
+    def load_sent_digests(self, data):
+        """Restore sent digests saved by build_config_snapshot"""
+        self.digest_sent = OrderedDict()
+        for key, items in data.items():
+            try:
+                target_id, message_id = (int(part) for part in key.rsplit('_', 1))
+                self.digest_sent[(target_id, message_id)] = Digest(
+                    target_id, message_id, [DigestItem(*item) for item in items]
+                )
+            except (ValueError, TypeError) as e:
+                logger.warning("Skipping unreadable digest entry %r: %s", key, e)
+    
+    async def add_to_digest(self, target_id, settings, source_id, message, title):
+        """Buffer a matched message for a target in digest mode"""
+        interval, max_items = settings
+        item = DigestItem(source_id, message.id, title, message.text or '')
+        digest = self.digest_pending.get(target_id)
+        if digest is not None and not digest.fits(item):
+            await self.flush_digest(target_id)
+            digest = None
+        if digest is None:
+            digest = self.digest_pending[target_id] = Digest(target_id)
+            self.digest_timers[target_id] = asyncio.create_task(self.flush_digest_later(target_id, interval))
+        digest.items.append(item)
+        self.metrics.inc('digest_items_total', target=str(target_id))
+        if len(digest.items) >= max_items:
+            await self.flush_digest(target_id)
+    
+    async def flush_digest_later(self, target_id, interval):
+        await asyncio.sleep(interval)
+        self.digest_timers.pop(target_id, None)
+        await self.flush_digest(target_id)
+    
+    async def flush_digest(self, target_id):
+        """Send the pending digest for a target as one message"""
+        digest = self.digest_pending.pop(target_id, None)
+        timer = self.digest_timers.pop(target_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        if digest is None or not digest.items:
+            return
+        rest = digest.overflow()
+        if rest:
+            self.digest_pending[target_id] = Digest(target_id, items=rest)  # Sent next by flush_all_digests()
+        
+        target_label = str(target_id)
+        send_start = time.perf_counter()
+        self.metrics.add_gauge('queue_depth', 1)
         try:
-            target_entity = await self.client.get_entity(target_channel_id)
-            
-            # Process custom emojis and formatting
-            message_text, entities = self.process_custom_emojis(source_message)
-            
-            # For premium users, enhance the message with auto-generated custom emojis
-            if self.is_premium and message_text:
-                # Check if we need to enhance the message (no existing custom emojis)
-                existing_custom_emojis = [
-                    entity for entity in entities 
-                    if hasattr(entity, 'document_id') and isinstance(entity, MessageEntityCustomEmoji)
-                ] if entities else []
-                
-                if not existing_custom_emojis:
+            target_entity = await self.resolve_entity(target_id)
+            # Digests are late by design, so they wait behind live traffic
+            sent_message = await self.scheduler.run(
+                'backfill', target_id,
+                self.client.send_message,
+                target_entity,
+                digest.render(),
+                parse_mode='markdown',
+                link_preview=False
+            )
+            self.metrics.observe('send_seconds', time.perf_counter() - send_start, target=target_label)
+            self.metrics.inc('forwards_total', target=target_label, result='ok')
+        except asyncio.CancelledError:
+            # Stopped mid-send (shutdown drain): put the items back, flush_all_digests() sends them
+            newer = self.digest_pending.get(target_id)
+            if newer is not None:
+                digest.items.extend(newer.items)
+            self.digest_pending[target_id] = digest
+            raise
+        except Exception as e:
+            self.note_rpc_error(e)
+            self.metrics.inc('forwards_total', target=target_label, result='error')
+            forward_logger.error("Error sending digest of %s messages to %s: %s", len(digest.items), target_id, e)
+            self.live_print(f"{colors.BRIGHT_RED}❌ Error sending digest: {e}{colors.RESET}")
+            return
+        finally:
+            self.metrics.add_gauge('queue_depth', -1)
+        
+        digest.message_id = sent_message.id
+        self.digest_sent[(target_id, digest.message_id)] = digest
+        while len(self.digest_sent) > self.DIGEST_HISTORY:
+            self.digest_sent.popitem(last=False)
+        for item in digest.items:
+            self.message_map.extend(item.source_id, item.message_id, [(target_id, -digest.message_id)])
+        self.request_save()
+        forward_logger.info("Digest of %s messages sent to %s", len(digest.items), target_id)
+        self.live_print(f"{colors.BRIGHT_GREEN}📰 Digest of {len(digest.items)} messages sent{colors.RESET}")
+    
+    async def flush_all_digests(self):
+        # Each flush removes its digest; one that was too long leaves the rest for the next round
+        while self.digest_pending:
+            await self.flush_digest(next(iter(self.digest_pending)))
+    
+    def pending_digest_items(self, source_id, message_id):
+        """Buffered digest items for a source message, across targets"""
+        return [item for digest in self.digest_pending.values()
+                for item in digest.items if item.source_id == source_id and item.message_id == message_id]
+    
+    async def update_digest(self, target_id, digest_message_id, source_id, message_id, text=None):
+        """Re-render a sent digest after one of its messages was edited (text) or deleted (None)"""
+        digest = self.digest_sent.get((target_id, digest_message_id))
+        if digest is None:
+            forward_logger.info("Digest %s in %s is no longer tracked, leaving it as is", digest_message_id, target_id)
+            return
+        if text is None:
+            if not digest.remove(source_id, message_id):
+                return
+        else:
+            item = digest.find(source_id, message_id)
+            if item is None or item.text == text:
+                return
+            item.text = text
+        self.request_save()
+        
+        target_label = str(target_id)
+        try:
+            target_entity = await self.resolve_entity(target_id)
+            if digest.items:
+                await self.scheduler.run(
+                    'edit', target_id,
+                    self.client.edit_message,
+                    target_entity,
+                    digest_message_id,
+                    digest.render(),
+                    parse_mode='markdown',
+                    link_preview=False
+                )
+                self.metrics.inc('edits_total', target=target_label, result='ok')
+                self.live_print(f"{colors.BRIGHT_GREEN}✅ Digest updated{colors.RESET}")
+            else:
+                # Every message in the digest is gone
+                await self.scheduler.run('delete', target_id, self.client.delete_messages, target_entity, digest_message_id)
+                del self.digest_sent[(target_id, digest_message_id)]
+                self.metrics.inc('deletes_total', target=target_label, result='ok')
+                self.live_print(f"{colors.BRIGHT_GREEN}✅ Empty digest deleted{colors.RESET}")
+        except Exception as e:
+            self.note_rpc_error(e)
+            self.metrics.inc('edits_total' if digest.items else 'deletes_total', target=target_label, result='error')
+            forward_logger.error("Error updating digest %s in %s: %s", digest_message_id, target_id, e)
+    
+    async def stream_reupload(self, document, workers=4, part_size=512 * 1024):
+        """Copy a document into a new upload without writing it to disk
+        
+        `workers` ranged downloads run in parallel (iter_download with a stride) and
+        each part is uploaded as soon as it arrives, so at most one part per worker
+        (`part_size`, the largest Telegram accepts) is held in memory.
+        """
+        size = document.size
+        total_parts = max(1, -(-size // part_size))
+        is_big = size > 10 * 1024 * 1024  # Telegram requires the big-file API above 10 MB
+        workers = max(1, min(workers, total_parts))
+        file_id = helpers.generate_random_long()
+        
+        async def transfer(first_part):
+            part = first_part
+            async for chunk in self.client.iter_download(
+                document,
+                offset=first_part * part_size,
+                stride=workers * part_size,
+                request_size=part_size,
+                limit=len(range(first_part, total_parts, workers)),
+                file_size=size
+            ):
+                if is_big:
+                    request = SaveBigFilePartRequest(file_id, part, total_parts, chunk)
+                else:
+                    request = SaveFilePartRequest(file_id, part, chunk)
+                if not await self.client(request):
+                    raise RuntimeError(f"Upload of part {part}/{total_parts} was rejected")
+                part += workers
+        
+        tasks = [asyncio.ensure_future(transfer(first_part)) for first_part in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        name = next((attribute.file_name for attribute in document.attributes
+                     if isinstance(attribute, DocumentAttributeFilename)), 'file')
+        if is_big:
+            return InputFileBig(file_id, total_parts, name)
+        return InputFile(file_id, total_parts, name, '')
+    
+    async def download_to_cache(self, media, key):
+        """Path of media in the media cache, downloading it on a miss; release() when done"""
+        cache = self.media_cache
+        loop = asyncio.get_running_loop()
+        if not self.media_cache_ready:
+            await loop.run_in_executor(self.io_executor, cache.open)
+            self.media_cache_ready = True
+        
+        path = cache.acquire(key)
+        self.metrics.inc('cache_lookups_total', cache='media', result='hit' if path else 'miss')
+        if path:
+            return path
+        
+        temp_path = cache.temp_path(key)
+        try:
+            downloaded = await self.client.download_media(media, file=temp_path)
+            if not downloaded:
+                return None
+            return await loop.run_in_executor(
+                self.io_executor, cache.store, key, downloaded, utils.get_extension(media)
+            )
+        finally:
+            # Only left behind if the download or the rename failed
+            self.io_executor.submit(self.remove_file_quietly, temp_path)
+    
+    async def reupload_media(self, media, target_entity, message_text, parse_mode, formatting_entities):
+        """Send media that cannot be sent by reference by transferring it again
+        
+        Documents of STREAM_TRANSFER_MIN_SIZE bytes or more are streamed part by part.
+        Smaller photos and documents are downloaded once into the media cache; other
+        media goes through a temporary file. Falls back to text only.
+        """
+        try:
+            document = getattr(media, 'document', None)
+            if document is not None and (document.size or 0) >= get_setting('STREAM_TRANSFER_MIN_SIZE', 10 * 1024 * 1024):
+                input_file = await self.stream_reupload(document, workers=get_setting('STREAM_TRANSFER_WORKERS', 4))
+                return await self.client.send_file(
+                    target_entity,
+                    input_file,
+                    caption=message_text,
+                    parse_mode=parse_mode,
+                    formatting_entities=formatting_entities,
+                    attributes=document.attributes,
+                    mime_type=document.mime_type
+                )
+            
+            cache_key = self.media_cache and self.media_cache.key_for(media)
+            if cache_key:
+                # Every target (and later retries) reads the same local copy
+                file_path = await self.download_to_cache(media, cache_key)
+                if file_path:
                     try:
-                        # Enhance message with auto-generated custom emoji entities
-                        enhanced_text, enhanced_entities = await self.enhance_message_with_custom_emojis(message_text)
-                        if enhanced_entities:
-                            # Validate all custom emoji document IDs
-                            valid_entities = []
-                            for entity in enhanced_entities:
-                                if isinstance(entity, MessageEntityCustomEmoji):
-                                    try:
-                                        # Check if document ID is within valid range
-                                        if -9223372036854775808 <= entity.document_id <= 9223372036854775807:
-                                            valid_entities.append(entity)
-                                        else:
-                                            logger.warning(f"Skipping custom emoji entity with invalid document ID: {entity.document_id}")
-                                    except Exception as e:
-                                        logger.warning(f"Error validating custom emoji entity: {e}")
-                                else:
-                                    valid_entities.append(entity)
-                            
-                            if valid_entities:
-                                message_text = enhanced_text
-                                entities = valid_entities
-                                logger.info(f"Enhanced message with {len(valid_entities)} valid auto-generated custom emoji entities")
-                    except Exception as e:
-                        logger.error(f"Error enhancing message with custom emojis: {e}")
-                        # Fall back to original text and entities
-                        message_text = source_message.text
-                        entities = source_message.entities
+                        return await self.client.send_file(
+                            target_entity,
+                            file_path,
+                            caption=message_text,
+                            parse_mode=parse_mode,
+                            formatting_entities=formatting_entities
+                        )
+                    finally:
+                        self.media_cache.release(cache_key)
+            else:
+                file_path = await self.client.download_media(media)
+                if file_path:
+                    try:
+                        return await self.client.send_file(
+                            target_entity,
+                            file_path,
+                            caption=message_text,
+                            parse_mode=parse_mode,
+                            formatting_entities=formatting_entities
+                        )
+                    finally:
+                        # Clean up downloaded file on the I/O thread
+                        self.io_executor.submit(self.remove_file_quietly, file_path)
+        except Exception as download_error:
+            self.note_rpc_error(download_error)
+            forward_logger.error("Download/upload failed: %s", download_error)
+        
+        # Fall back to text only
+        return await self.client.send_message(
+            target_entity,
+            message_text,
+            parse_mode=parse_mode,
+            formatting_entities=formatting_entities
+        )
+    
+    def takes_fast_path(self, message):
+        """Whether rendering leaves the message as it is: no custom emojis to keep, nothing to enhance"""
+        if any(isinstance(entity, MessageEntityCustomEmoji) for entity in message.entities or ()):
+            return False
+        return not (self.is_premium and message.text and EMOJI_PATTERN.search(message.text))
+    
+    async def render_message(self, message):
+        """Text and entities to send for a source message, with premium emoji enhancement"""
+        render_start = time.perf_counter()
+        
+        # Fast path: the original text and entities are sent as they are
+        if self.takes_fast_path(message):
+            self.metrics.inc('render_paths_total', path='fast')
+            self.metrics.observe('render_seconds', time.perf_counter() - render_start)
+            return message.text, message.entities
+        self.metrics.inc('render_paths_total', path='full')
+        
+        # Process custom emojis and formatting
+        message_text, entities = self.process_custom_emojis(message)
+        
+        # For premium users, enhance the message with auto-generated custom emojis
+        if self.is_premium and message_text:
+            # Check if we need to enhance the message (no existing custom emojis)
+            existing_custom_emojis = [
+                entity for entity in entities 
+                if hasattr(entity, 'document_id') and isinstance(entity, MessageEntityCustomEmoji)
+            ] if entities else []
+            
+            if not existing_custom_emojis:
+                try:
+                    # Enhance message with auto-generated custom emoji entities
+                    enhanced_text, enhanced_entities = await self.enhance_message_with_custom_emojis(message_text)
+                    if enhanced_entities:
+                        # Validate all custom emoji document IDs
+                        valid_entities = []
+                        for entity in enhanced_entities:
+                            if isinstance(entity, MessageEntityCustomEmoji):
+                                try:
+                                    # Check if document ID is within valid range
+                                    if -9223372036854775808 <= entity.document_id <= 9223372036854775807:
+                                        valid_entities.append(entity)
+                                    else:
+                                        emoji_logger.warning("Skipping custom emoji entity with invalid document ID: %s", entity.document_id)
+                                except Exception as e:
+                                    emoji_logger.warning("Error validating custom emoji entity: %s", e)
+                            else:
+                                valid_entities.append(entity)
+                        
+                        if valid_entities:
+                            message_text = enhanced_text
+                            entities = valid_entities
+                            emoji_logger.info("Enhanced message with %s valid auto-generated custom emoji entities", len(valid_entities))
+                except Exception as e:
+                    emoji_logger.error("Error enhancing message with custom emojis: %s", e)
+                    # Fall back to original text and entities
+                    message_text = message.text
+                    entities = message.entities
+        
+        self.metrics.observe('render_seconds', time.perf_counter() - render_start)
+        return message_text, entities
+    
+    async def send_message_without_forward_tag(self, source_message, target_channel_id, text_only=False, rendered=None):
+        """Send message without forward tag with premium emoji and formatting support
+        
+        text_only sends just the text, for media that was already forwarded recently.
+        rendered is render_message()'s result, when the caller already has it.
+        Call it inside send_limiter.slot(target_channel_id).
+        Permanent errors (PERMANENT_SEND_ERRORS) are raised instead of retried.
+        """
+        target_entity = None
+        message_text = None
+        try:
+            target_entity = await self.resolve_entity(target_channel_id)
+            message_text, entities = rendered or await self.render_message(source_message)
             
             # Determine parse mode based on custom emoji presence
             custom_emoji_entities = []
@@ -874,25 +3019,27 @@ class TelegramForwarder:
                         and -9223372036854775808 <= entity.document_id <= 9223372036854775807
                     ]
                 except Exception as e:
-                    logger.error(f"Error filtering custom emoji entities: {e}")
+                    emoji_logger.error("Error filtering custom emoji entities: %s", e)
                     entities = [e for e in entities if not isinstance(e, MessageEntityCustomEmoji)]
             
             # If custom emojis are present and valid, use entities instead of parse_mode
             if custom_emoji_entities:
                 parse_mode = None  # Don't use markdown parsing for custom emojis
                 formatting_entities = entities  # Use original/enhanced entities
-                logger.info(f"Using entity-based formatting for {len(custom_emoji_entities)} valid custom emojis")
+                emoji_logger.info("Using entity-based formatting for %s valid custom emojis", len(custom_emoji_entities))
             else:
                 parse_mode = self.get_parse_mode()  # Use markdown
                 formatting_entities = [e for e in entities if not isinstance(e, MessageEntityCustomEmoji)] if entities else None
             
             # Method 1: Try to use send_file for media or send_message for text
-            if source_message.media:
+            if source_message.media and not text_only:
                 try:
                     # Handle different media types
                     if hasattr(source_message.media, 'photo'):
                         # Photo message
-                        sent_message = await self.client.send_file(
+                        sent_message = await self.send_limiter.measure(
+                            target_channel_id,
+                            self.client.send_file,
                             target_entity,
                             source_message.media.photo,
                             caption=message_text,
@@ -902,7 +3049,9 @@ class TelegramForwarder:
                         )
                     elif hasattr(source_message.media, 'document'):
                         # Document, video, audio, etc.
-                        sent_message = await self.client.send_file(
+                        sent_message = await self.send_limiter.measure(
+                            target_channel_id,
+                            self.client.send_file,
                             target_entity,
                             source_message.media.document,
                             caption=message_text,
@@ -912,7 +3061,9 @@ class TelegramForwarder:
                         )
                     elif isinstance(source_message.media, MessageMediaWebPage):
                         # Web page preview - send as text with link preview
-                        sent_message = await self.client.send_message(
+                        sent_message = await self.send_limiter.measure(
+                            target_channel_id,
+                            self.client.send_message,
                             target_entity,
                             message_text,
                             parse_mode=parse_mode,
@@ -921,43 +3072,25 @@ class TelegramForwarder:
                         )
                     else:
                         # Try to download and re-upload
-                        try:
-                            file_path = await self.client.download_media(source_message.media, thumb=-1)
-                            if file_path:
-                                sent_message = await self.client.send_file(
-                                    target_entity,
-                                    file_path,
-                                    caption=message_text,
-                                    parse_mode=parse_mode,
-                                    formatting_entities=formatting_entities
-                                )
-                                # Clean up downloaded file
-                                try:
-                                    os.remove(file_path)
-                                except:
-                                    pass
-                            else:
-                                # Fall back to text only
-                                sent_message = await self.client.send_message(
-                                    target_entity,
-                                    message_text,
-                                    parse_mode=parse_mode,
-                                    formatting_entities=formatting_entities
-                                )
-                        except Exception as download_error:
-                            logger.error(f"Download/upload failed: {download_error}")
-                            # Fall back to text only
-                            sent_message = await self.client.send_message(
-                                target_entity,
-                                message_text,
-                                parse_mode=parse_mode,
-                                formatting_entities=formatting_entities
-                            )
-                            
+                        sent_message = await self.reupload_media(
+                            source_message.media, target_entity, message_text, parse_mode, formatting_entities
+                        )
+                
+                except ChatForwardsRestrictedError:
+                    # Protected source chat: its files cannot be sent by reference, so copy them
+                    forward_logger.info("Source chat restricts forwarding, re-uploading media")
+                    sent_message = await self.reupload_media(
+                        source_message.media, target_entity, message_text, parse_mode, formatting_entities
+                    )
+                except PERMANENT_SEND_ERRORS:
+                    raise
                 except Exception as media_error:
-                    logger.error(f"Media sending failed: {media_error}")
+                    self.note_rpc_error(media_error)
+                    forward_logger.error("Media sending failed: %s", media_error)
                     # Fall back to text only without custom emojis
-                    sent_message = await self.client.send_message(
+                    sent_message = await self.send_limiter.measure(
+                        target_channel_id,
+                        self.client.send_message,
                         target_entity,
                         message_text,
                         parse_mode='markdown',  # Always use markdown for fallback
@@ -966,16 +3099,23 @@ class TelegramForwarder:
             else:
                 # Text only message
                 try:
-                    sent_message = await self.client.send_message(
+                    sent_message = await self.send_limiter.measure(
+                        target_channel_id,
+                        self.client.send_message,
                         target_entity,
                         message_text,
                         parse_mode=parse_mode,
                         formatting_entities=formatting_entities
                     )
+                except PERMANENT_SEND_ERRORS:
+                    raise
                 except Exception as text_error:
-                    logger.error(f"Error sending text message: {text_error}")
+                    self.note_rpc_error(text_error)
+                    forward_logger.error("Error sending text message: %s", text_error)
                     # Fall back to sending without custom emojis
-                    sent_message = await self.client.send_message(
+                    sent_message = await self.send_limiter.measure(
+                        target_channel_id,
+                        self.client.send_message,
                         target_entity,
                         message_text,
                         parse_mode='markdown',  # Always use markdown for fallback
@@ -983,310 +3123,529 @@ class TelegramForwarder:
                     )
             
             return sent_message
-            
+        
+        except PERMANENT_SEND_ERRORS:
+            raise
         except Exception as e:
-            logger.error(f"Error sending message without forward tag: {e}")
+            self.note_rpc_error(e)
+            forward_logger.error("Error sending message without forward tag: %s", e)
+            if target_entity is None or not message_text:
+                return None
             # Final fallback: try to send just the text with minimal formatting
             try:
-                return await self.client.send_message(
+                return await self.send_limiter.measure(
+                    target_channel_id,
+                    self.client.send_message,
                     target_entity,
-                    message_text if message_text else "Failed to forward message",
+                    message_text,
                     parse_mode='markdown'
                 )
-            except:
-                logger.error("Failed to send even the fallback message")
+            except PERMANENT_SEND_ERRORS:
+                raise
+            except Exception as fallback_error:
+                self.note_rpc_error(fallback_error)
+                forward_logger.error("Failed to send even the fallback message: %s", fallback_error)
                 return None
     
+    async def forward_to_targets(self, message, channel_id, targets, source_title, text_only=False):
+        """Send one source message to each target and record every copy as soon as it is sent"""
+        forwarded_messages = []
+        # Targets not done yet; a shutdown that cancels us leaves the rest here for after the restart
+        key = (channel_id, message.id)
+        remaining = [target['id'] for target in targets]
+        self.pending_forwards[key] = (remaining, text_only)
+        # Targets in digest mode collect text messages and get them in batches
+        digest_targets = self.rules.digests if not message.media or isinstance(message.media, MessageMediaWebPage) else None
+        # Rendered once for every target; the hash lets edits skip copies that already match
+        rendered = await self.render_message(message)
+        payload = payload_hash(*rendered)
+        self.metrics.add_gauge('queue_depth', len(targets))
+        for target_channel in targets:
+            target_label = str(target_channel['id'])
+            send_start = time.perf_counter()
+            remaining.remove(target_channel['id'])
+            probe = False
+            try:
+                digest_settings = digest_targets and digest_targets.get(abs(target_channel['id']))
+                if digest_settings:
+                    await self.add_to_digest(target_channel['id'], digest_settings, channel_id, message, source_title)
+                    continue
+                probe = self.breaker.is_open(target_channel['id'])
+                if not self.breaker.allow(target_channel['id']):
+                    # Target keeps failing permanently: skip it until the next probe
+                    self.metrics.inc('forwards_total', target=target_label, result='skipped')
+                    continue
+                # Wait for the target's own limit first, so a throttled target does not hold global slots
+                async with self.send_limiter.slot(target_channel['id']):
+                    forwarded_msg = await self.scheduler.run(
+                        'new', target_channel['id'],
+                        self.send_message_without_forward_tag, message, target_channel['id'],
+                        text_only=text_only, rendered=rendered
+                    )
+                self.metrics.observe('send_seconds', time.perf_counter() - send_start, target=target_label)
+                self.metrics.inc('forwards_total', target=target_label, result='ok' if forwarded_msg else 'failed')
+                if forwarded_msg:
+                    if self.breaker.success(target_channel['id']):
+                        forward_logger.warning("Target '%s' accepts messages again, circuit closed", target_channel['title'])
+                        self.live_print(f"{colors.BRIGHT_GREEN}🔌 '{target_channel['title']}' is back, resuming forwards{colors.RESET}")
+                    copy = (target_channel['id'], forwarded_msg.id if hasattr(forwarded_msg, 'id') else forwarded_msg[0].id, payload)
+                    forwarded_messages.append(copy)
+                    # Recorded right away, so edits and deletes reach it even if the fan-out is cut short
+                    self.message_map.extend(channel_id, message.id, [copy])
+                    self.request_save()
+                    self.live_print(f"{colors.BRIGHT_GREEN}✅ Forwarded to '{target_channel['title']}' with formatting{colors.RESET}")
+                    forward_logger.info("Message forwarded to '%s'", target_channel['title'])
+                else:
+                    self.breaker.failure(target_channel['id'], permanent=False)
+                    self.live_print(f"{colors.BRIGHT_RED}❌ Failed to forward to '{target_channel['title']}'{colors.RESET}")
+                    forward_logger.error("Failed to forward to '%s'", target_channel['title'])
+            except asyncio.CancelledError:
+                # Stopped mid-send: we cannot tell whether it arrived, so send it again after the restart
+                remaining.insert(0, target_channel['id'])
+                self.metrics.add_gauge('queue_depth', 1 - len(remaining))  # The finally below counts this one
+                if probe:
+                    self.breaker.cancel_probe(target_channel['id'])
+                raise
+            except Exception as forward_error:
+                self.note_rpc_error(forward_error)
+                self.metrics.inc('forwards_total', target=target_label, result='error')
+                self.live_print(f"{colors.BRIGHT_RED}❌ Error forwarding to '{target_channel['title']}': {forward_error}{colors.RESET}")
+                forward_logger.error("Error forwarding to '%s': %s", target_channel['title'], forward_error)
+                if self.breaker.failure(target_channel['id'], permanent=isinstance(forward_error, PERMANENT_SEND_ERRORS)):
+                    forward_logger.error("Target '%s' keeps failing permanently, skipping it (probing every %ss)",
+                                         target_channel['title'], self.breaker.probe_seconds)
+                    self.live_print(f"{colors.BRIGHT_RED}🔌 Skipping '{target_channel['title']}' until it accepts messages again{colors.RESET}")
+            finally:
+                self.metrics.add_gauge('queue_depth', -1)
+        
+        if message.date:
+            self.metrics.observe('receive_to_send_seconds', max(0.0, time.time() - message.date.timestamp()))
+        
+        if not forwarded_messages and message.media and not text_only:
+            self.media_index.discard(message.media)
+        
+        self.pending_forwards.pop(key, None)
+        self.request_save()
+        if forwarded_messages:
+            self.live_print(f"{colors.BRIGHT_YELLOW}📊 Message forwarded to {len(forwarded_messages)} channels{colors.RESET}")
+    
+    async def resume_pending_forwards(self):
+        """Finish the fan-outs a shutdown cut short, with the current text of each source message"""
+        # Counts as a running handler, so another shutdown waits for it too
+        task = asyncio.current_task()
+        self.running_handlers[task] = ['resume', time.perf_counter(), None, False]
+        try:
+            for key, (target_ids, text_only) in list(self.pending_forwards.items()):
+                if self.stopping:
+                    break  # The rest stays saved for the next start
+                channel_id, message_id = key
+                source = self.rules.sources.get(channel_id)
+                wanted = {abs(target_id) for target_id in target_ids}
+                targets = [target for target in self.rules.targets if abs(target['id']) in wanted]
+                message = None
+                if source is not None and targets:
+                    try:
+                        message = await self.client.get_messages(source['id'], ids=message_id)
+                    except Exception as e:
+                        logger.warning("Could not fetch message %s from '%s' to resume forwarding: %s", message_id, source['title'], e)
+                if message is None:
+                    # No longer configured, deleted meanwhile, or unreadable
+                    self.pending_forwards.pop(key, None)
+                    self.request_save()
+                    continue
+                logger.info("Resuming forward of message %s from '%s' to %s targets", message_id, source['title'], len(targets))
+                await self.forward_to_targets(message, channel_id, targets, source['title'], text_only)
+        finally:
+            self.running_handlers.pop(task, None)
+    
+    def request_shutdown(self, reason):
+        """Signal handler: the first signal starts an orderly shutdown, a second one skips the wait"""
+        if self.stopping:
+            logger.warning("%s again: not waiting for messages in flight", reason)
+            for task in list(self.running_handlers):
+                task.cancel()
+            return
+        logger.info("%s received, shutting down", reason)
+        self.stopping = True
+        self.stop_reason = reason
+        if self.shutdown_event is not None:
+            self.shutdown_event.set()
+    
+    async def drain_handlers(self, timeout):
+        """Wait up to timeout for running handlers, then cancel the rest
+        
+        A cancelled fan-out keeps the targets it did not reach in pending_forwards,
+        which is saved and finished after the restart.
+        """
+        self.stopping = True
+        tasks = [task for task in self.running_handlers if task is not asyncio.current_task()]
+        if not tasks:
+            return
+        print(f"{colors.BRIGHT_YELLOW}⏳ Finishing {len(tasks)} messages in flight (up to {timeout}s)...{colors.RESET}")
+        _, unfinished = await asyncio.wait(tasks, timeout=timeout)
+        if unfinished:
+            logger.warning("%s handlers still running after %ss, saving their remaining sends for the restart", len(unfinished), timeout)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.wait(unfinished)
+    
     async def handle_new_message(self, event):
         """Handle new messages from source channels"""
+        handler_start = time.perf_counter()
+        rules = self.rules  # One snapshot for the whole event, even if a reload happens meanwhile
+        handler_task = asyncio.current_task()
+        self.running_handlers[handler_task] = ['new', handler_start, event, False]
         try:
             message = event.message
             
-            # Get channel/chat ID - handle different peer types
-            channel_id = None
-            if hasattr(message.peer_id, 'channel_id'):
-                channel_id = message.peer_id.channel_id
-            elif hasattr(message.peer_id, 'chat_id'):
-                channel_id = message.peer_id.chat_id
-            elif hasattr(message.peer_id, 'user_id'):
-                channel_id = message.peer_id.user_id
-            
-            # Convert negative channel_id to positive (Telegram API quirk)
-            if channel_id and channel_id < 0:
-                channel_id = abs(channel_id)
-            
-            # Check if message is from a source channel
-            source_channel_ids = [abs(ch['id']) if ch['id'] < 0 else ch['id'] for ch in self.source_channels]
-            if channel_id not in source_channel_ids:
+            # Check if message is from a source channel (O(1) lookups on the rules snapshot)
+            channel_id = normalize_peer_id(message.peer_id)
+            route = rules.route_for(channel_id)
+            if route is None:
+                self.metrics.inc('filter_rejects_total', filter='source')
                 return
+            # Handlers see every chat: only source events are counted and recorded
+            self.metrics.inc('events_received_total', kind='new')
+            if self.recorder:
+                self.recorder.record('new', event, route.matches)
+            self.metrics.inc('source_messages_total', source=str(channel_id))
+            if isinstance(message.peer_id, PeerChat) and channel_id not in rules.group_ids:
+                self.mark_basic_group(channel_id)
             
-            # Check if message contains keywords
-            if not self.contains_keyword(message.text):
+            # Cheap attribute checks from config.py, then this source's keywords
+            rejected = rules.rejected_by(message)
+            if rejected:
+                self.metrics.inc('filter_rejects_total', filter=rejected)
+                return
+            if not route.matches(message.text):
+                self.metrics.inc('filter_rejects_total', filter='keywords')
                 return
+            self.metrics.inc('keyword_matches_total')
             
             # Check for duplicate message
             if self.is_duplicate_message(message):
-                logger.info(f"Skipping duplicate message from channel {channel_id}")
-                print(f"{colors.BRIGHT_YELLOW}🛡️ Duplicate message skipped (prevents spam){colors.RESET}")
+                self.metrics.inc('dedup_hits_total')
+                forward_logger.info("Skipping duplicate message from channel %s", channel_id)
+                self.live_print(f"{colors.BRIGHT_YELLOW}🛡️ Duplicate message skipped (prevents spam){colors.RESET}")
                 return
             
             # Add message hash to the set
             self.add_message_hash(message)
-
+            
+            # Same photo or video reposted (possibly by another source) within the TTL
+            text_only = False
+            if self.media_dedup != 'off' and message.media and self.media_index.check_and_add(message.media):
+                self.metrics.inc('media_dedup_hits_total')
+                if self.media_dedup == 'skip' or not message.text:
+                    forward_logger.info("Skipping repost of already forwarded media from channel %s", channel_id)
+                    self.live_print(f"{colors.BRIGHT_YELLOW}🛡️ Media already forwarded recently, skipped{colors.RESET}")
+                    return
+                text_only = True
+                forward_logger.info("Media from channel %s already forwarded recently, sending text only", channel_id)
+                self.live_print(f"{colors.BRIGHT_YELLOW}🛡️ Media already forwarded recently, sending text only{colors.RESET}")
+            
             # Get source channel info
-            source_channel = next((ch for ch in self.source_channels if abs(ch['id']) == channel_id), None)
+            source_channel = rules.sources.get(channel_id)
             if source_channel:
-                logger.info(f"Keyword found in message from '{source_channel['title']}' (ID: {channel_id})")
-                print(f"{colors.BRIGHT_GREEN}📨 Forwarding message from '{source_channel['title']}'{colors.RESET}")
+                forward_logger.info("Keyword found in message from '%s' (ID: %s)", source_channel['title'], channel_id)
+                self.live_print(f"{colors.BRIGHT_GREEN}📨 Forwarding message from '{source_channel['title']}'{colors.RESET}")
                 
                 # Show premium emoji info if available
+                has_emoji = self.is_premium and bool(message.text) and EMOJI_PATTERN.search(message.text) is not None
                 if self.is_premium and message.entities:
                     custom_emojis = [e for e in message.entities if isinstance(e, MessageEntityCustomEmoji)]
                     if custom_emojis:
-                        print(f"{colors.BRIGHT_MAGENTA}🎉 Message contains {len(custom_emojis)} premium emojis - preserving original entities{colors.RESET}")
-                        logger.info(f"Premium emojis detected: {len(custom_emojis)} custom emojis will be preserved")
-                    else:
-                        print(f"{colors.BRIGHT_CYAN}✨ Premium user - will enhance regular emojis to premium format{colors.RESET}")
-                        logger.info("No existing custom emojis found, will attempt enhancement")
-                elif self.is_premium:
-                    print(f"{colors.BRIGHT_CYAN}✨ Premium user - will enhance regular emojis to premium format{colors.RESET}")
-                    logger.info("Premium user with no entities, will attempt enhancement")
+                        self.live_print(f"{colors.BRIGHT_MAGENTA}🎉 Message contains {len(custom_emojis)} premium emojis - preserving original entities{colors.RESET}")
+                        forward_logger.info("Premium emojis detected: %s custom emojis will be preserved", len(custom_emojis))
+                    elif has_emoji:
+                        self.live_print(f"{colors.BRIGHT_CYAN}✨ Premium user - will enhance regular emojis to premium format{colors.RESET}")
+                        forward_logger.info("No existing custom emojis found, will attempt enhancement")
+                elif has_emoji:
+                    self.live_print(f"{colors.BRIGHT_CYAN}✨ Premium user - will enhance regular emojis to premium format{colors.RESET}")
+                    forward_logger.info("Premium user with no entities, will attempt enhancement")
                 
                 # Process the message to show what will be forwarded
-                processed_text, processed_entities = self.process_custom_emojis(message)
+                if self.takes_fast_path(message):
+                    processed_text, processed_entities = message.text, message.entities
+                else:
+                    processed_text, processed_entities = self.process_custom_emojis(message)
                 display_text = processed_text if processed_text else message.text
                 
                 if len(display_text) > 150:
-                    print(f"{colors.BRIGHT_WHITE}📝 Message: {display_text[:150]}...{colors.RESET}")
+                    self.live_print(f"{colors.BRIGHT_WHITE}📝 Message: {display_text[:150]}...{colors.RESET}")
                 else:
-                    print(f"{colors.BRIGHT_WHITE}📝 Message: {display_text}{colors.RESET}")
+                    self.live_print(f"{colors.BRIGHT_WHITE}📝 Message: {display_text}{colors.RESET}")
                 
                 # Show if custom emojis are being preserved or enhanced
                 if self.is_premium and processed_entities:
                     custom_emojis = [e for e in processed_entities if isinstance(e, MessageEntityCustomEmoji)]
                     if custom_emojis:
-                        print(f"{colors.BRIGHT_GREEN}✨ Premium emojis will be forwarded using original entities{colors.RESET}")
-                    else:
-                        print(f"{colors.BRIGHT_BLUE}🚀 Regular emojis will be enhanced to premium format during forwarding{colors.RESET}")
-                elif self.is_premium:
-                    print(f"{colors.BRIGHT_BLUE}🚀 Regular emojis will be enhanced to premium format during forwarding{colors.RESET}")
+                        self.live_print(f"{colors.BRIGHT_GREEN}✨ Premium emojis will be forwarded using original entities{colors.RESET}")
+                    elif has_emoji:
+                        self.live_print(f"{colors.BRIGHT_BLUE}🚀 Regular emojis will be enhanced to premium format during forwarding{colors.RESET}")
+                elif has_emoji:
+                    self.live_print(f"{colors.BRIGHT_BLUE}🚀 Regular emojis will be enhanced to premium format during forwarding{colors.RESET}")
             
-            # Forward to all target channels
-            forwarded_messages = []
-            for target_channel in self.target_channels:
-                try:
-                    forwarded_msg = await self.send_message_without_forward_tag(message, target_channel['id'])
-                    if forwarded_msg:
-                        forwarded_messages.append({
-                            'channel_id': target_channel['id'],
-                            'message_id': forwarded_msg.id if hasattr(forwarded_msg, 'id') else forwarded_msg[0].id
-                        })
-                        print(f"{colors.BRIGHT_GREEN}✅ Forwarded to '{target_channel['title']}' with formatting{colors.RESET}")
-                        logger.info(f"Message forwarded to '{target_channel['title']}'")
-                    else:
-                        print(f"{colors.BRIGHT_RED}❌ Failed to forward to '{target_channel['title']}'{colors.RESET}")
-                        logger.error(f"Failed to forward to '{target_channel['title']}'")
-                except Exception as forward_error:
-                    print(f"{colors.BRIGHT_RED}❌ Error forwarding to '{target_channel['title']}': {forward_error}{colors.RESET}")
-                    logger.error(f"Error forwarding to '{target_channel['title']}': {forward_error}")
-            
-            # Store message mapping for edits/deletions
-            if forwarded_messages:
-                self.message_map[f"{channel_id}_{message.id}"] = forwarded_messages
-                self.save_config()
-                print(f"{colors.BRIGHT_YELLOW}📊 Message forwarded to {len(forwarded_messages)} channels{colors.RESET}")
+            if self.stopping:
+                # Shutting down: the sends happen after the restart instead
+                self.pending_forwards[(channel_id, message.id)] = ([target['id'] for target in route.targets], text_only)
+                self.request_save()
+                return
+            
+            title = source_channel['title'] if source_channel else str(channel_id)
+            await self.forward_to_targets(message, channel_id, route.targets, title, text_only)
             
         except Exception as e:
-            logger.error(f"Error handling new message: {e}")
-            print(f"{colors.BRIGHT_RED}❌ Error handling message: {e}{colors.RESET}")
+            forward_logger.error("Error handling new message: %s", e)
+            self.live_print(f"{colors.BRIGHT_RED}❌ Error handling message: {e}{colors.RESET}")
+        finally:
+            self.running_handlers.pop(handler_task, None)
+            self.metrics.observe('handler_seconds', time.perf_counter() - handler_start, handler='new')
     
     async def handle_message_edit(self, event):
         """Handle message edits with formatting preservation"""
+        handler_start = time.perf_counter()
+        rules = self.rules
+        if self.stopping:
+            return
+        handler_task = asyncio.current_task()
+        self.running_handlers[handler_task] = ['edit', handler_start, event, False]
         try:
             message = event.message
             
+            # Handlers see every chat, so drop non-source edits before making any request
+            channel_id = normalize_peer_id(message.peer_id)
+            route = rules.route_for(channel_id)
+            if route is None:
+                return
+            self.metrics.inc('events_received_total', kind='edit')
+            if self.recorder:
+                self.recorder.record('edit', event, route.matches)
+            
             # First verify if this is actually an edit
             if not hasattr(message, 'edit_date') or not message.edit_date:
-                logger.debug("Received edit event but message has no edit_date, skipping")
+                forward_logger.debug("Received edit event but message has no edit_date, skipping")
                 return
             
-            # Get the original message to compare
-            try:
-                original_msg = await self.client.get_messages(message.peer_id, ids=message.id)
-                if original_msg and original_msg.text == message.text:
-                    logger.debug("Message content unchanged, skipping edit")
-                    return
-            except Exception as e:
-                logger.warning(f"Could not verify original message content: {e}")
-                # Continue processing if we can't verify, better to process than miss an edit
-            
-            # Get channel/chat ID - handle different peer types
-            channel_id = None
-            if hasattr(message.peer_id, 'channel_id'):
-                channel_id = message.peer_id.channel_id
-            elif hasattr(message.peer_id, 'chat_id'):
-                channel_id = message.peer_id.chat_id
-            elif hasattr(message.peer_id, 'user_id'):
-                channel_id = message.peer_id.user_id
-            
-            # Convert negative channel_id to positive
-            if channel_id and channel_id < 0:
-                channel_id = abs(channel_id)
-            
             # Check if we have forwarded this message
-            message_key = f"{channel_id}_{message.id}"
-            if message_key not in self.message_map:
+            forwarded_messages = await self.lookup_forwarded(channel_id, message.id, payloads=True)
+            pending_items = self.pending_digest_items(channel_id, message.id)
+            if not forwarded_messages and not pending_items:
+                return
+            
+            # Check if edited message still contains this source's keywords
+            if not route.matches(message.text):
                 return
             
-            # Check if edited message still contains keywords
-            if not self.contains_keyword(message.text):
+            # Digests hold the source text: update waiting ones, re-render sent ones
+            for item in pending_items:
+                item.text = message.text or ''
+            for target_id, target_message_id, _ in forwarded_messages or ():
+                if target_message_id < 0:
+                    await self.update_digest(target_id, -target_message_id, channel_id, message.id, message.text or '')
+            forwarded_messages = [copy for copy in forwarded_messages or () if copy[1] > 0]
+            if not forwarded_messages:
                 return
             
-            logger.info(f"Processing confirmed edit for message {message.id} from channel {channel_id}")
-            print(f"{colors.BRIGHT_YELLOW}✏️ Processing confirmed message edit...{colors.RESET}")
+            # Render once and edit only the copies whose stored payload differs. Telegram also
+            # sends edit events for changes we do not copy (reactions, link previews, media).
+            edited_text, entities = await self.render_message(message)
+            payload = payload_hash(edited_text, entities)
+            unchanged = [copy for copy in forwarded_messages if copy[2] == payload]
+            for target_id, _, _ in unchanged:
+                self.metrics.inc('edits_total', target=str(target_id), result='unchanged')
+            forwarded_messages = [copy for copy in forwarded_messages if copy[2] != payload]
+            if not forwarded_messages:
+                forward_logger.debug("Forwarded copies of message %s already show this text, skipping edit", message.id)
+                return
             
-            # Process message formatting
-            edited_text, entities = self.process_custom_emojis(message)
+            forward_logger.info("Processing confirmed edit for message %s from channel %s", message.id, channel_id)
+            self.live_print(f"{colors.BRIGHT_YELLOW}✏️ Processing confirmed message edit...{colors.RESET}")
             
-            # For premium users, enhance the message with auto-generated custom emojis
-            if self.is_premium and edited_text:
-                # Check if we need to enhance the message (no existing custom emojis)
-                existing_custom_emojis = [
-                    entity for entity in entities 
-                    if hasattr(entity, 'document_id') and isinstance(entity, MessageEntityCustomEmoji)
-                ] if entities else []
-                
-                if not existing_custom_emojis:
-                    try:
-                        # Enhance message with auto-generated custom emoji entities
-                        enhanced_text, enhanced_entities = await self.enhance_message_with_custom_emojis(edited_text)
-                        if enhanced_entities:
-                            # Validate all custom emoji document IDs
-                            valid_entities = []
-                            for entity in enhanced_entities:
-                                if isinstance(entity, MessageEntityCustomEmoji):
-                                    try:
-                                        # Check if document ID is within valid range
-                                        if -9223372036854775808 <= entity.document_id <= 9223372036854775807:
-                                            valid_entities.append(entity)
-                                    except Exception as e:
-                                        logger.warning(f"Error validating custom emoji entity: {e}")
-                                else:
-                                    valid_entities.append(entity)
-                            
-                            if valid_entities:
-                                edited_text = enhanced_text
-                                entities = valid_entities
-                                logger.info(f"Enhanced edited message with {len(valid_entities)} valid auto-generated custom emoji entities")
-                    except Exception as e:
-                        logger.error(f"Error enhancing edited message with custom emojis: {e}")
-                        # Fall back to original text and entities
-                        edited_text = message.text
-                        entities = message.entities
-        
             # Edit all forwarded messages
-            forwarded_messages = self.message_map[message_key]
-            for forwarded_msg in forwarded_messages:
+            edited = set()  # Targets that show the new payload now
+            for target_id, target_message_id, _ in forwarded_messages:
+                target_label = str(target_id)
+                if self.breaker.is_open(target_id):
+                    self.metrics.inc('edits_total', target=target_label, result='skipped')
+                    continue
                 try:
-                    target_entity = await self.client.get_entity(forwarded_msg['channel_id'])
+                    target_entity = await self.resolve_entity(target_id)
                     
                     # First try: Edit with full formatting
                     try:
-                        await self.client.edit_message(
+                        await self.scheduler.run(
+                            'edit', target_id,
+                            self.client.edit_message,
                             target_entity,
-                            forwarded_msg['message_id'],
+                            target_message_id,
                             edited_text,
                             formatting_entities=entities
                         )
-                        print(f"{colors.BRIGHT_GREEN}✅ Message edited with full formatting{colors.RESET}")
+                        self.live_print(f"{colors.BRIGHT_GREEN}✅ Message edited with full formatting{colors.RESET}")
+                        self.metrics.inc('edits_total', target=target_label, result='ok')
+                        edited.add(target_id)
                         continue  # Success, move to next message
+                    except MessageNotModifiedError:
+                        raise  # Same content: another formatting attempt will not change that
                     except Exception as full_format_error:
-                        logger.warning(f"Could not edit with full formatting: {full_format_error}")
+                        self.note_rpc_error(full_format_error)
+                        forward_logger.warning("Could not edit with full formatting: %s", full_format_error)
                     
                     # Second try: Edit without custom emojis but with other formatting
                     try:
                         filtered_entities = [e for e in entities if not isinstance(e, MessageEntityCustomEmoji)] if entities else None
-                        await self.client.edit_message(
+                        await self.scheduler.run(
+                            'edit', target_id,
+                            self.client.edit_message,
                             target_entity,
-                            forwarded_msg['message_id'],
+                            target_message_id,
                             edited_text,
                             parse_mode='markdown',
                             formatting_entities=filtered_entities
                         )
-                        print(f"{colors.BRIGHT_YELLOW}⚠️ Message edited without custom emojis{colors.RESET}")
+                        self.live_print(f"{colors.BRIGHT_YELLOW}⚠️ Message edited without custom emojis{colors.RESET}")
+                        self.metrics.inc('edits_total', target=target_label, result='ok')
+                        edited.add(target_id)
                         continue  # Success, move to next message
+                    except MessageNotModifiedError:
+                        raise  # Same content: another formatting attempt will not change that
                     except Exception as partial_format_error:
-                        logger.warning(f"Could not edit with partial formatting: {partial_format_error}")
+                        self.note_rpc_error(partial_format_error)
+                        forward_logger.warning("Could not edit with partial formatting: %s", partial_format_error)
                     
                     # Final try: Edit with just text and markdown
                     try:
-                        await self.client.edit_message(
+                        await self.scheduler.run(
+                            'edit', target_id,
+                            self.client.edit_message,
                             target_entity,
-                            forwarded_msg['message_id'],
+                            target_message_id,
                             edited_text,
                             parse_mode='markdown'
                         )
-                        print(f"{colors.BRIGHT_YELLOW}⚠️ Message edited with basic formatting only{colors.RESET}")
+                        self.live_print(f"{colors.BRIGHT_YELLOW}⚠️ Message edited with basic formatting only{colors.RESET}")
+                        self.metrics.inc('edits_total', target=target_label, result='ok')
+                        edited.add(target_id)
+                    except MessageNotModifiedError:
+                        raise  # Same content: another formatting attempt will not change that
                     except Exception as basic_format_error:
+                        self.note_rpc_error(basic_format_error)
                         # If all attempts fail, try one last time with just plain text
                         try:
-                            await self.client.edit_message(
+                            await self.scheduler.run(
+                                'edit', target_id,
+                                self.client.edit_message,
                                 target_entity,
-                                forwarded_msg['message_id'],
+                                target_message_id,
                                 edited_text
                             )
-                            print(f"{colors.BRIGHT_RED}⚠️ Message edited without formatting{colors.RESET}")
+                            self.live_print(f"{colors.BRIGHT_RED}⚠️ Message edited without formatting{colors.RESET}")
+                            self.metrics.inc('edits_total', target=target_label, result='ok')
+                            edited.add(target_id)
                         except Exception as plain_text_error:
-                            logger.error(f"Failed to edit message even without formatting: {plain_text_error}")
-                            print(f"{colors.BRIGHT_RED}❌ Failed to edit message{colors.RESET}")
+                            self.note_rpc_error(plain_text_error)
+                            self.metrics.inc('edits_total', target=target_label, result='failed')
+                            forward_logger.error("Failed to edit message even without formatting: %s", plain_text_error)
+                            self.live_print(f"{colors.BRIGHT_RED}❌ Failed to edit message{colors.RESET}")
                 
                 except Exception as edit_error:
-                    if "Content of the message was not modified" in str(edit_error):
-                        logger.info(f"Message content unchanged, skipping edit")
+                    self.note_rpc_error(edit_error)
+                    if isinstance(edit_error, MessageNotModifiedError) or "Content of the message was not modified" in str(edit_error):
+                        self.metrics.inc('edits_total', target=target_label, result='unchanged')
+                        edited.add(target_id)  # It already shows this payload
+                        forward_logger.info("Message content unchanged, skipping edit")
                     else:
-                        logger.error(f"Error editing message: {edit_error}")
-                        print(f"{colors.BRIGHT_RED}❌ Error editing message: {edit_error}{colors.RESET}")
+                        self.metrics.inc('edits_total', target=target_label, result='error')
+                        forward_logger.error("Error editing message: %s", edit_error)
+                        self.live_print(f"{colors.BRIGHT_RED}❌ Error editing message: {edit_error}{colors.RESET}")
+            
+            if edited:
+                self.message_map.set_payload(channel_id, message.id, edited, payload)
+                self.request_save()
             
         except Exception as e:
-            logger.error(f"Error handling message edit: {e}")
+            forward_logger.error("Error handling message edit: %s", e)
+        finally:
+            self.running_handlers.pop(handler_task, None)
+            self.metrics.observe('handler_seconds', time.perf_counter() - handler_start, handler='edit')
     
     async def handle_message_delete(self, event):
         """Handle message deletions"""
+        handler_start = time.perf_counter()
+        rules = self.rules
+        if self.stopping:
+            return
+        handler_task = asyncio.current_task()
+        self.running_handlers[handler_task] = ['delete', handler_start, event, False]
         try:
-            for deleted_id in event.deleted_ids:
-                # Find the message in our map
-                message_key = None
-                for key in self.message_map:
-                    if key.endswith(f"_{deleted_id}"):
-                        message_key = key
-                        break
+            if event.chat_id is None:
+                # Basic groups and private chats omit the chat: look the ids up among basic-group sources only
+                if not rules.group_ids:
+                    return
+                group_messages = self.message_map.group_messages
+                deleted = [(group_messages[deleted_id], deleted_id)
+                           for deleted_id in event.deleted_ids if deleted_id in group_messages]
+            else:
+                # Handlers see every chat; skip deletes from chats we do not monitor
+                source_id = normalize_peer_id(event.chat_id)
+                if source_id not in rules.source_ids:
+                    return
+                deleted = [(source_id, deleted_id) for deleted_id in event.deleted_ids]
+            if not deleted:
+                return
+            self.metrics.inc('events_received_total', kind='delete')
+            if self.recorder:
+                self.recorder.record('delete', event)
+            
+            for source_id, deleted_id in deleted:
+                # Drop it from digests that have not been sent yet
+                for digest in self.digest_pending.values():
+                    digest.remove(source_id, deleted_id)
+                
+                # Find and remove the message from our map
+                forwarded_messages = await self.lookup_forwarded(source_id, deleted_id, remove=True)
+                if not forwarded_messages:
+                    continue
+                self.request_save()
                 
-                if not message_key:
+                # Sent digests lose this message but keep the others
+                for target_id, target_message_id in forwarded_messages:
+                    if target_message_id < 0:
+                        await self.update_digest(target_id, -target_message_id, source_id, deleted_id)
+                forwarded_messages = [copy for copy in forwarded_messages if copy[1] > 0]
+                if not forwarded_messages:
                     continue
                 
-                logger.info(f"Deleting forwarded message {deleted_id}")
-                print(f"{colors.BRIGHT_YELLOW}🗑️ Deleting forwarded message...{colors.RESET}")
+                forward_logger.info("Deleting forwarded message %s", deleted_id)
+                self.live_print(f"{colors.BRIGHT_YELLOW}🗑️ Deleting forwarded message...{colors.RESET}")
                 
                 # Delete all forwarded messages
-                forwarded_messages = self.message_map[message_key]
-                for forwarded_msg in forwarded_messages:
+                for target_id, target_message_id in forwarded_messages:
+                    if self.breaker.is_open(target_id):
+                        self.metrics.inc('deletes_total', target=str(target_id), result='skipped')
+                        continue
                     try:
-                        target_entity = await self.client.get_entity(forwarded_msg['channel_id'])
-                        await self.client.delete_messages(
+                        target_entity = await self.resolve_entity(target_id)
+                        await self.scheduler.run(
+                            'delete', target_id,
+                            self.client.delete_messages,
                             target_entity,
-                            forwarded_msg['message_id']
+                            target_message_id
                         )
-                        print(f"{colors.BRIGHT_GREEN}✅ Message deleted from target channel{colors.RESET}")
+                        self.metrics.inc('deletes_total', target=str(target_id), result='ok')
+                        self.live_print(f"{colors.BRIGHT_GREEN}✅ Message deleted from target channel{colors.RESET}")
                     except Exception as e:
-                        logger.error(f"Error deleting message: {e}")
-                        print(f"{colors.BRIGHT_RED}❌ Error deleting message: {e}{colors.RESET}")
-                
-                # Remove from message map
-                del self.message_map[message_key]
-                self.save_config()
-                
+                        self.note_rpc_error(e)
+                        self.metrics.inc('deletes_total', target=str(target_id), result='error')
+                        forward_logger.error("Error deleting message: %s", e)
+                        self.live_print(f"{colors.BRIGHT_RED}❌ Error deleting message: {e}{colors.RESET}")
+        
         except Exception as e:
-            logger.error(f"Error handling message delete: {e}")
+            forward_logger.error("Error handling message delete: %s", e)
+        finally:
+            self.running_handlers.pop(handler_task, None)
+            self.metrics.observe('handler_seconds', time.perf_counter() - handler_start, handler='delete')
     
     async def start_forwarder(self):
         """Start the message forwarder with enhanced UI"""
@@ -1305,7 +3664,7 @@ class TelegramForwarder:
             self.safe_input(f"\n{colors.BRIGHT_RED}Press Enter to continue...{colors.RESET}")
             return
         
-        if not self.keywords:
+        if not self.keywords and not any(route.get('keywords') for route in self.routes.values()):
             self.print_error("Please set keywords first!")
             self.safe_input(f"\n{colors.BRIGHT_RED}Press Enter to continue...{colors.RESET}")
             return
@@ -1321,6 +3680,10 @@ class TelegramForwarder:
             print(f"{colors.BRIGHT_WHITE}   • {ch['title']} ({ch['input']}){colors.RESET}")
         
         print(f"\n{colors.BRIGHT_YELLOW}🔍 Keywords: {', '.join(self.keywords)}{colors.RESET}")
+        if self.routes:
+            print(f"{colors.BRIGHT_YELLOW}🧭 Custom routes: {len(self.routes)} source channels with their own keywords/targets{colors.RESET}")
+        if self.rules.digests:
+            print(f"{colors.BRIGHT_YELLOW}📰 Digest mode: {len(self.rules.digests)} target channels get batched messages{colors.RESET}")
         
         premium_status = "Yes" if self.is_premium else "No"
         premium_color = self.get_status_color(premium_status)
@@ -1338,33 +3701,159 @@ class TelegramForwarder:
         print(f"\n{colors.BRIGHT_YELLOW}Press Ctrl+C to stop...{colors.RESET}")
         print(f"{colors.BRIGHT_CYAN}{'═' * 60}{colors.RESET}")
         
-        # Register event handlers
-        source_channel_ids = [ch['id'] for ch in self.source_channels]
+        if not self.client.is_connected():
+            await self.client.connect()  # A previous run disconnected on the way out
+        self.stopping = False
+        self.stop_reason = None
+        self.shutdown_event = asyncio.Event()
         
-        self.client.add_event_handler(
-            self.handle_new_message,
-            events.NewMessage(chats=source_channel_ids)
-        )
+        # Resolve targets, build the emoji index, etc. before the first event arrives
+        await self.warm_up(get_setting('WARMUP_TIMEOUT', 15))
         
-        self.client.add_event_handler(
-            self.handle_message_edit,
-            events.MessageEdited(chats=source_channel_ids)
-        )
+        # Register event handlers once. They are not bound to a fixed chat list:
+        # each handler checks self.rules, so channel changes apply without re-registering.
+        if not self.handlers_registered:
+            self.client.add_event_handler(self.handle_new_message, events.NewMessage())
+            self.client.add_event_handler(self.handle_message_edit, events.MessageEdited())
+            self.client.add_event_handler(self.handle_message_delete, events.MessageDeleted())
+            self.handlers_registered = True
+        if self.pending_forwards:
+            print(f"{colors.BRIGHT_CYAN}📨 Finishing {len(self.pending_forwards)} forwards interrupted by the last shutdown{colors.RESET}")
+            self.background_tasks.append(asyncio.create_task(self.resume_pending_forwards()))
         
-        self.client.add_event_handler(
-            self.handle_message_delete,
-            events.MessageDeleted(chats=source_channel_ids)
-        )
+        # Orderly shutdown on SIGTERM and Ctrl+C: finish messages in flight, save, disconnect
+        stop_signals = []
+        for signal_name in ('SIGTERM', 'SIGINT'):
+            stop_signal = getattr(signal, signal_name, None)
+            if stop_signal is None:
+                continue
+            try:
+                asyncio.get_running_loop().add_signal_handler(stop_signal, self.request_shutdown, signal_name)
+                stop_signals.append(stop_signal)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C cancels us instead, and the finally block below still drains
+
+        # Hot reload: watch the config file and reload on SIGHUP
+        reload_interval = get_setting('CONFIG_RELOAD_INTERVAL', 2)
+        if reload_interval:
+            self.background_tasks.append(asyncio.create_task(self.watch_config_file(reload_interval)))
+        reload_signal = getattr(signal, 'SIGHUP', None)
+        if reload_signal is not None:
+            try:
+                asyncio.get_running_loop().add_signal_handler(
+                    reload_signal, lambda: asyncio.ensure_future(self.reload_config())
+                )
+            except (NotImplementedError, RuntimeError):
+                pass  # Signals are not available on this platform/loop
+        
+        # Memory diagnostics: a report on SIGUSR1 and/or every MEMORY_REPORT_INTERVAL minutes
+        trace_frames = get_setting('MEMORY_TRACE_FRAMES', 0)
+        if trace_frames:
+            self.memory_profiler = MemoryProfiler(trace_frames)
+            self.memory_profiler.start()
+        memory_signal = getattr(signal, 'SIGUSR1', None)
+        if memory_signal is not None:
+            try:
+                asyncio.get_running_loop().add_signal_handler(memory_signal, self.write_memory_report)
+            except (NotImplementedError, RuntimeError):
+                memory_signal = None
+        memory_interval = get_setting('MEMORY_REPORT_INTERVAL', 0)
+        if memory_interval:
+            self.background_tasks.append(asyncio.create_task(self.report_memory_periodically(memory_interval * 60)))
+        
+        if get_setting('METRICS_ENABLED', False):
+            try:
+                self.metrics_server = MetricsServer(
+                    self.metrics,
+                    get_setting('METRICS_HOST', '127.0.0.1'),
+                    get_setting('METRICS_PORT', 9464)
+                )
+                await self.metrics_server.start()
+                print(f"{colors.BRIGHT_CYAN}📈 Metrics: http://{self.metrics_server.host}:{self.metrics_server.port}/metrics{colors.RESET}")
+            except Exception as e:
+                logger.error("Could not start metrics endpoint: %s", e)
+                self.metrics_server = None
+        
+        self.background_tasks.append(asyncio.create_task(self.monitor_event_loop()))
+        stall_seconds = get_setting('LOOP_STALL_SECONDS', 1.0)
+        if stall_seconds:
+            self.watchdog = LoopWatchdog(self.stall_file, self.metrics, threshold=stall_seconds)
+            self.watchdog.start()
+        self.background_tasks.append(asyncio.create_task(
+            self.flush_state_periodically(get_setting('STATE_FLUSH_INTERVAL', 5))
+        ))
+        dashboard_interval = get_setting('DASHBOARD_REFRESH_SECONDS', 0)
+        if dashboard_interval:
+            self.background_tasks.append(asyncio.create_task(self.refresh_dashboard(dashboard_interval)))
         
+        record_file = get_setting('RECORD_EVENTS_FILE')
+        if record_file:
+            self.recorder = EventRecorder(
+                record_file,
+                hash_text=get_setting('RECORD_HASH_TEXT', True),
+                executor=self.io_executor
+            )
+            print(f"{colors.BRIGHT_CYAN}⏺️ Recording events to {record_file}{colors.RESET}")
+        
+        connection = asyncio.ensure_future(self.client.run_until_disconnected())
         try:
-            await self.client.run_until_disconnected()
+            shutdown = asyncio.ensure_future(self.shutdown_event.wait())
+            try:
+                await asyncio.wait((connection, shutdown), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                shutdown.cancel()
+            if connection.done():
+                connection.result()  # Raises what ended the connection
+            else:
+                print(f"\n{colors.BRIGHT_YELLOW}🛑 Forwarder stopping ({self.stop_reason})...{colors.RESET}")
         except KeyboardInterrupt:
             print(f"\n{colors.BRIGHT_YELLOW}🛑 Forwarder stopped by user{colors.RESET}")
             self.safe_input(f"\n{colors.BRIGHT_GREEN}Press Enter to return to menu...{colors.RESET}")
         except Exception as e:
-            logger.error(f"Error in forwarder: {e}")
+            logger.error("Error in forwarder: %s", e)
             print(f"{colors.BRIGHT_RED}❌ Error in forwarder: {e}{colors.RESET}")
             self.safe_input(f"\n{colors.BRIGHT_RED}Press Enter to return to menu...{colors.RESET}")
+        finally:
+            # Stop taking new messages and let the ones in flight finish
+            await self.drain_handlers(get_setting('SHUTDOWN_TIMEOUT', 20))
+            for task in self.background_tasks:
+                task.cancel()
+            self.background_tasks = []
+            if self.watchdog:
+                self.watchdog.stop()
+                self.watchdog = None
+            for handled_signal in (reload_signal, memory_signal, *stop_signals):
+                if handled_signal is not None:
+                    try:
+                        asyncio.get_running_loop().remove_signal_handler(handled_signal)
+                    except (NotImplementedError, RuntimeError):
+                        pass
+            # Send what digests have collected, then make sure everything is on disk
+            try:
+                await self.flush_all_digests()
+            except Exception as e:
+                logger.error("Error sending pending digests: %s", e)
+            await self.flush_state()
+            await asyncio.get_running_loop().run_in_executor(self.io_executor, self.message_map.close_spill)
+            if self.metrics_server:
+                await self.metrics_server.stop()
+                self.metrics_server = None
+            if self.recorder:
+                self.recorder.close()
+                self.recorder = None
+            if self.memory_profiler:
+                self.memory_profiler.stop()
+                self.memory_profiler = None
+            # Disconnect last, once everything is sent and saved
+            connection.cancel()
+            try:
+                await connection
+            except (asyncio.CancelledError, Exception):
+                pass
+            if self.stop_reason:
+                print(f"{colors.BRIGHT_GREEN}✅ Stopped cleanly: state saved, {len(self.pending_forwards)} forwards left for the next start{colors.RESET}")
+            if self.stop_reason == 'SIGINT':
+                self.safe_input(f"\n{colors.BRIGHT_GREEN}Press Enter to return to menu...{colors.RESET}")
     
     def show_menu(self):
         """Show the enhanced interactive main menu"""
@@ -1445,14 +3934,218 @@ class TelegramForwarder:
             if keyword_count > 5:
                 keywords_display += f" ... (+{keyword_count - 5} more)"
             print(f"    {colors.BRIGHT_GREEN}{keywords_display}{colors.RESET}")
+        if self.routes:
+            print(f"{colors.BRIGHT_WHITE}🧭 Custom Routes: {colors.BRIGHT_YELLOW}{len(self.routes)}{colors.RESET}")
+        if self.digests:
+            print(f"{colors.BRIGHT_WHITE}📰 Digest Targets: {colors.BRIGHT_YELLOW}{len(self.digests)}{colors.RESET}")
         
         # System features
         print(f"{colors.BRIGHT_WHITE}🛡️ Duplicate Prevention: {colors.BRIGHT_YELLOW}{len(self.message_hashes)} hashes cached{colors.RESET}")
         print(f"{colors.BRIGHT_WHITE}🎨 Formatting: {colors.BRIGHT_GREEN}HARDCODED (Markdown: ON, Preserve: ON){colors.RESET}")
         print(f"{colors.BRIGHT_WHITE}🎯 Forward Method: {colors.BRIGHT_GREEN}Copy without forward tags + auto-premium emoji{colors.RESET}")
         
+        # Live statistics once the forwarder has seen traffic
+        if self.metrics.total('events_received_total'):
+            print()
+            self.print_live_stats()
+        
         print()
     
+    @staticmethod
+    def format_ratio(part, whole):
+        """Format a ratio as a percentage, or n/a when there is no data"""
+        return f"{100.0 * part / whole:.1f}%" if whole else "n/a"
+    
+    def print_live_stats(self, out=print):
+        """Print rolling statistics from the in-memory counters"""
+        metrics = self.metrics
+        uptime = timedelta(seconds=int(time.time() - metrics.started))
+        out(f"{colors.BOLD}{colors.BRIGHT_CYAN}📈 Live Statistics (last 60s, uptime {uptime}){colors.RESET}")
+        
+        events_total = metrics.total('events_received_total')
+        out(f"{colors.BRIGHT_WHITE}📬 Events: {colors.BRIGHT_YELLOW}{metrics.recent('events_received_total')}/min{colors.RESET} "
+              f"{colors.DIM}({events_total} total){colors.RESET}")
+        
+        # Messages per minute per source, busiest first
+        titles = {str(ch['id']): ch['title'] for ch in self.source_channels}
+        per_source = sorted(metrics.recent_by('source_messages_total', 'source').items(), key=lambda item: -item[1])
+        per_source = [(source, count) for source, count in per_source if count]
+        out(f"{colors.BRIGHT_WHITE}📥 Messages/min per source:{colors.RESET}")
+        if per_source:
+            for source, count in per_source[:5]:
+                out(f"    {colors.BRIGHT_GREEN}• {titles.get(source, source)}: {count}{colors.RESET}")
+            if len(per_source) > 5:
+                out(f"    {colors.DIM}... and {len(per_source) - 5} more{colors.RESET}")
+        else:
+            out(f"    {colors.DIM}No messages in the last minute{colors.RESET}")
+        
+        # Forward success ratio per target
+        out(f"{colors.BRIGHT_WHITE}📤 Forward success per target:{colors.RESET}")
+        for ch in self.target_channels:
+            label = str(ch['id'])
+            ok = metrics.recent('forwards_total', target=label, result='ok')
+            attempts = metrics.recent('forwards_total', target=label)
+            ok_total = metrics.value('forwards_total', target=label, result='ok')
+            ratio = self.format_ratio(ok, attempts)
+            ratio_color = colors.GREEN if not attempts or ok == attempts else colors.YELLOW if ok else colors.RED
+            limit = self.send_limiter.limit(ch['id'])
+            circuit = f" {colors.BRIGHT_RED}🔌 skipped after permanent errors{colors.RESET}" if self.breaker.is_open(ch['id']) else ''
+            out(f"    {colors.BRIGHT_WHITE}• {ch['title']}: {ratio_color}{ratio}{colors.RESET} "
+                  f"{colors.DIM}({ok}/{attempts} last min, {ok_total} total, {limit:.1f} sends at once){colors.RESET}{circuit}")
+        
+        out(f"{colors.BRIGHT_WHITE}📦 Queue backlog: {colors.BRIGHT_YELLOW}{metrics.total('queue_depth')}{colors.RESET}")
+        lanes = [
+            f"{lane} {metrics.value('lane_depth', lane=lane)} ({metrics.mean('lane_wait_seconds', lane=lane) * 1000:.0f} ms)"
+            for lane in OutboundScheduler.LANES
+        ]
+        out(f"{colors.BRIGHT_WHITE}🚦 Lanes waiting (avg wait): {colors.BRIGHT_YELLOW}{', '.join(lanes)}{colors.RESET}")
+        out(f"{colors.BRIGHT_WHITE}🌊 Flood wait: {colors.BRIGHT_YELLOW}{metrics.recent('flood_wait_seconds_total')}s last min{colors.RESET} "
+              f"{colors.DIM}({metrics.total('flood_wait_seconds_total')}s total){colors.RESET}")
+        
+        dedup_rate = self.format_ratio(metrics.recent('dedup_hits_total'), metrics.recent('keyword_matches_total'))
+        out(f"{colors.BRIGHT_WHITE}🛡️ Dedup hit rate: {colors.BRIGHT_YELLOW}{dedup_rate}{colors.RESET}")
+        if self.media_dedup != 'off':
+            out(f"{colors.BRIGHT_WHITE}🖼️ Media reposts caught: {colors.BRIGHT_YELLOW}{metrics.recent('media_dedup_hits_total')} last min{colors.RESET} "
+                  f"{colors.DIM}({metrics.total('media_dedup_hits_total')} total, {len(self.media_index)} files tracked){colors.RESET}")
+        
+        rejects = sorted(metrics.recent_by('filter_rejects_total', 'filter').items(), key=lambda item: -item[1])
+        rejects = [f"{name} {count}" for name, count in rejects if count]
+        out(f"{colors.BRIGHT_WHITE}🚫 Filtered last min: {colors.BRIGHT_YELLOW}{', '.join(rejects) or 'none'}{colors.RESET}")
+        
+        cache_rates = []
+        for cache in ('entity', 'emoji', 'media'):
+            hits = metrics.value('cache_lookups_total', cache=cache, result='hit')
+            misses = metrics.value('cache_lookups_total', cache=cache, result='miss')
+            cache_rates.append(f"{cache} {self.format_ratio(hits, hits + misses)}")
+        out(f"{colors.BRIGHT_WHITE}🗂️ Cache hit rate: {colors.BRIGHT_YELLOW}{', '.join(cache_rates)}{colors.RESET}")
+        
+        fast = metrics.value('render_paths_total', path='fast')
+        rendered = metrics.total('render_paths_total')
+        out(f"{colors.BRIGHT_WHITE}⚡ Rendered without emoji work: {colors.BRIGHT_YELLOW}{self.format_ratio(fast, rendered)}{colors.RESET} "
+              f"{colors.DIM}({fast}/{rendered} messages){colors.RESET}")
+        
+        lag_ms = metrics.value('event_loop_lag_seconds') * 1000
+        lag_color = colors.GREEN if lag_ms < 50 else colors.YELLOW if lag_ms < 250 else colors.RED
+        out(f"{colors.BRIGHT_WHITE}🐢 Event loop lag: {lag_color}{lag_ms:.1f} ms{colors.RESET}")
+    
+    def memory_structures(self):
+        """(name, entries, approximate bytes) of the caches and maps that can grow while running"""
+        message_map = self.message_map
+        # The saved copy and the pending changes share their records with the entries
+        map_bytes = (approximate_size(message_map.entries) + sys.getsizeof(message_map.saved)
+                     + sys.getsizeof(message_map.changes))
+        structures = [
+            ('message_map', len(message_map), map_bytes),
+            ('message_hashes', len(self.message_hashes), approximate_size(self.message_hashes)),
+            ('custom_emoji_cache', len(self.custom_emoji_cache), approximate_size(self.custom_emoji_cache)),
+            ('emoji_index', len(self.emoji_index or {}), approximate_size(self.emoji_index or {})),
+            ('entity_cache', len(self.entity_cache), approximate_size(self.entity_cache)),
+            ('media_index', len(self.media_index), approximate_size(self.media_index.expiry)),
+            ('digest_sent', len(self.digest_sent), approximate_size(self.digest_sent)),
+            ('digest_pending', sum(len(digest.items) for digest in self.digest_pending.values()),
+             approximate_size(self.digest_pending)),
+        ]
+        if self.media_cache:
+            structures.append(('media_cache', len(self.media_cache.entries), approximate_size(self.media_cache.entries)))
+        # Telethon keeps the access hash of every user and chat it has seen
+        telethon_cache = getattr(getattr(self.client, '_mb_entity_cache', None), 'hash_map', None)
+        if telethon_cache is not None:
+            structures.append(('telethon_entity_cache', len(telethon_cache), approximate_size(telethon_cache)))
+        structures.append(('metric_series', sum(len(series) for series in self.metrics.counters.values())
+                           + sum(len(series) for series in self.metrics.gauges.values())
+                           + sum(len(series) for series in self.metrics.histograms.values()),
+                           approximate_size(self.metrics.rolling)))
+        return structures
+    
+    def write_memory_report(self):
+        """Append structure sizes, and with tracing on the tracemalloc growth, to MEMORY_REPORT_FILE"""
+        # Sizes are read here on the loop thread, where the structures change
+        lines = [f"{'structure':<24}{'entries':>10}{'approx KB':>12}\n"]
+        for name, entries, size in self.memory_structures():
+            lines.append(f"{name:<24}{entries:>10}{size / 1024:>12.0f}\n")
+            self.metrics.set_gauge('structure_items', entries, structure=name)
+            self.metrics.set_gauge('structure_bytes', size, structure=name)
+        lines.append(f"{'asyncio tasks':<24}{len(asyncio.all_tasks()):>10}\n")
+        profiler = self.memory_profiler
+        
+        def finish():
+            # take_snapshot() holds the GIL, so the loop still waits for it; comparing
+            # and formatting the snapshots runs here without holding up the loop
+            try:
+                if profiler:
+                    lines.extend(profiler.report())
+                append_report(self.memory_file, "memory report", lines)
+            except Exception as e:
+                # The SIGUSR1 handler does not wait for this, so report failures here
+                logger.error("Error writing memory report: %s", e)
+        
+        logger.info("Writing memory report to %s", self.memory_file)
+        return asyncio.get_running_loop().run_in_executor(self.io_executor, finish)
+    
+    async def report_memory_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.write_memory_report()
+    
+    async def monitor_event_loop(self, interval=1.0):
+        """Measure how late the event loop wakes up from a timed sleep, and report slow handlers"""
+        loop = asyncio.get_running_loop()
+        slow_seconds = get_setting('SLOW_HANDLER_SECONDS', 30)
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.metrics.set_gauge('event_loop_lag_seconds', max(0.0, loop.time() - started - interval))
+            if slow_seconds and self.running_handlers:
+                self.report_slow_handlers(slow_seconds)
+    
+    def report_slow_handlers(self, slow_seconds):
+        """Write where each handler running longer than slow_seconds is waiting, once per call"""
+        now = time.perf_counter()
+        for task, running in self.running_handlers.items():
+            kind, started, event, reported = running
+            if reported or now - started < slow_seconds:
+                continue
+            running[3] = True
+            self.metrics.inc('slow_handlers_total', handler=kind)
+            message = getattr(event, 'message', None)
+            title = (f"{kind} handler running for {now - started:.1f}s "
+                     f"(chat {getattr(event, 'chat_id', None)}, message {getattr(message, 'id', None)})")
+            lines = awaiting_stack(task.get_coro())
+            # Where outbound requests are queued: usually the reason a handler is slow
+            queued = {lane: sum(len(waiters) for waiters in queue.values()) for lane, queue in self.scheduler.queues.items()}
+            lines.append(f"outbound: {self.scheduler.active} in flight, queued {queued}\n")
+            logger.warning("Slow %s, stack written to %s", title, self.stall_file)
+            self.io_executor.submit(append_report, self.stall_file, title, lines)
+    
+    async def refresh_dashboard(self, interval):
+        """Print the live statistics periodically while the forwarder runs"""
+        while True:
+            await asyncio.sleep(interval)
+            self.live_print(f"{colors.BRIGHT_CYAN}{'═' * 60}{colors.RESET}")
+            self.print_live_stats(out=self.live_print)
+            self.live_print(f"{colors.BRIGHT_CYAN}{'═' * 60}{colors.RESET}")
+    
+    async def run_headless(self):
+        """Start forwarding right away with the saved login and channels, for services and containers"""
+        self.headless = True
+        self.animations = False
+        self.load_config()
+        if not self.api_id or not self.api_hash:
+            logger.error("No saved API credentials: run once without --start to log in")
+            raise SystemExit(1)
+        self.client = TelegramClient(self.session_file, self.api_id, self.api_hash)
+        try:
+            await self.client.connect()
+            if not await self.client.is_user_authorized():
+                logger.error("The saved session is not logged in: run once without --start to log in")
+                raise SystemExit(1)
+            me = await self.client.get_me()
+            self.is_premium = me.premium if hasattr(me, 'premium') else False
+            await self.start_forwarder()
+        finally:
+            await self.client.disconnect()
+            self.io_executor.shutdown(wait=True)
+    
     async def run(self):
         """Main program loop with enhanced UI"""
         self.load_config()
@@ -1480,6 +4173,17 @@ class TelegramForwarder:
                     await self.login_telegram()
                 elif choice == '2':
                     await self.start_forwarder()
+                    if self.stop_reason == 'SIGTERM':
+                        # Stopped by the system (service manager, container), not from the keyboard: exit
+                        self.io_executor.shutdown(wait=True)
+                        break
+                    # Stopping disconnects the client, and the channel menus need it connected
+                    if self.client and not self.client.is_connected():
+                        try:
+                            await self.client.connect()
+                        except Exception as e:
+                            logger.error("Could not reconnect after stopping: %s", e)
+                            self.print_error(f"Could not reconnect to Telegram: {e}")
                 elif choice == '3':
                     if not self.client:
                         self.print_error("Please login first!")
@@ -1510,6 +4214,7 @@ class TelegramForwarder:
                     print(f"{colors.BRIGHT_CYAN}📞 For support: @ItsHarshX{colors.RESET}")
                     if self.client:
                         await self.client.disconnect()
+                    self.io_executor.shutdown(wait=True)
                     break
                 else:
                     self.print_error("Invalid choice. Please try again.")
@@ -1519,17 +4224,22 @@ class TelegramForwarder:
                 print(f"\n{colors.BRIGHT_YELLOW}👋 Goodbye!{colors.RESET}")
                 if self.client:
                     await self.client.disconnect()
+                self.io_executor.shutdown(wait=True)
                 break
             except Exception as e:
-                logger.error(f"Unexpected error in main loop: {e}")
+                logger.error("Unexpected error in main loop: %s", e)
                 self.print_error(f"An unexpected error occurred: {e}")
                 self.safe_input(f"\n{colors.BRIGHT_RED}Press Enter to continue...{colors.RESET}")
                 # Don't break, let the user try again
 
 async def main():
     """Main function"""
+    setup_logging()
     forwarder = TelegramForwarder()
-    await forwarder.run()
+    if '--start' in sys.argv[1:]:
+        await forwarder.run_headless()
+    else:
+        await forwarder.run()
 
 if __name__ == "__main__":
     asyncio.run(main())
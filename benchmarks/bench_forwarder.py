@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for NiftyForwarder
+Replays a synthetic stream of text, media, albums, edits and deletes through
+TelegramForwarder against a fake client and reports throughput, latency and memory
+
+Usage: python benchmarks/bench_forwarder.py [--events 2000] [--latency 0.002] [--json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_client import (FakeClient, make_message, make_photo, make_document,
+                         new_message_event, edited_message_event, deleted_message_event)
+import NiftyForwarder
+
+KEYWORDS = ['alert', 'signal', 'breakout']
+WORDS = ['market', 'price', 'update', 'volume', 'trend', 'news', 'chart', 'level', 'target', 'stop']
+
+
+def build_forwarder(client, sources, targets, premium=False, state_dir=None):
+    """Create a TelegramForwarder wired to the fake client"""
+    state_dir = state_dir or tempfile.mkdtemp()
+    forwarder = NiftyForwarder.TelegramForwarder()
+    forwarder.config_file = os.path.join(state_dir, 'forwarder_config.json')
+    if forwarder.media_cache:
+        forwarder.media_cache.directory = os.path.join(state_dir, 'media_cache')
+    forwarder.client = client
+    forwarder.is_premium = premium
+    forwarder.keywords = list(KEYWORDS)
+    forwarder.source_channels = [
+        {'id': 1000 + i, 'title': f"Source {i}", 'input': f"@source{i}"} for i in range(sources)
+    ]
+    forwarder.target_channels = [
+        {'id': 2000 + i, 'title': f"Target {i}", 'input': f"@target{i}"} for i in range(targets)
+    ]
+    forwarder.rebuild_rules()
+    return forwarder
+
+
+def synthetic_stream(count, sources, seed=0, match_ratio=0.7):
+    """Yield (kind, event) pairs with a realistic mix of update types"""
+    rng = random.Random(seed)
+    next_id = {1000 + i: 1 for i in range(sources)}
+    sent = []  # (chat_id, message_id) already emitted, for edits and deletes
+    produced = 0
+
+    def text_body():
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 40))]
+        if rng.random() < match_ratio:
+            words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+        words.append(f"#{rng.randrange(10 ** 9)}")  # Keeps content hashes distinct
+        return ' '.join(words)
+
+    while produced < count:
+        chat_id = 1000 + rng.randrange(sources)
+        roll = rng.random()
+
+        if roll < 0.10 and sent:
+            # Edit of an earlier message
+            edit_chat, edit_id = rng.choice(sent)
+            message = make_message(edit_chat, edit_id, text_body(), edit_date=datetime.now(timezone.utc))
+            yield 'edit', edited_message_event(message)
+            produced += 1
+        elif roll < 0.20 and sent:
+            # Delete of an earlier message
+            delete_chat, delete_id = sent.pop(rng.randrange(len(sent)))
+            yield 'delete', deleted_message_event(delete_chat, [delete_id])
+            produced += 1
+        elif roll < 0.30:
+            # Album: several media messages sharing a grouped_id
+            grouped_id = rng.randrange(10 ** 12)
+            for index in range(rng.randint(2, 5)):
+                message_id = next_id[chat_id]
+                next_id[chat_id] += 1
+                caption = text_body() if index == 0 else ''
+                message = make_message(chat_id, message_id, caption,
+                                       media=make_photo(rng.randrange(10 ** 12)), grouped_id=grouped_id)
+                sent.append((chat_id, message_id))
+                yield 'album', new_message_event(message)
+                produced += 1
+        else:
+            message_id = next_id[chat_id]
+            next_id[chat_id] += 1
+            if roll < 0.45:
+                media = make_photo(rng.randrange(10 ** 12))
+            elif roll < 0.55:
+                media = make_document(rng.randrange(10 ** 12), size=rng.randint(10 ** 4, 5 * 10 ** 7))
+            else:
+                media = None
+            message = make_message(chat_id, message_id, text_body(), media=media, bold=rng.random() < 0.5)
+            sent.append((chat_id, message_id))
+            yield ('media' if media else 'text'), new_message_event(message)
+            produced += 1
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_benchmark(args):
+    """Replay the synthetic stream and collect timings"""
+    client = FakeClient(latency=args.latency, jitter=args.jitter,
+                        flood_every=args.flood_every, flood_seconds=args.flood_seconds, seed=args.seed,
+                        restricted=args.restricted)
+    forwarder = build_forwarder(client, args.sources, args.targets, premium=args.premium)
+    handlers = {
+        'text': forwarder.handle_new_message,
+        'media': forwarder.handle_new_message,
+        'album': forwarder.handle_new_message,
+        'edit': forwarder.handle_message_edit,
+        'delete': forwarder.handle_message_delete,
+    }
+    events = list(synthetic_stream(args.events, args.sources, seed=args.seed))
+    latencies = {kind: [] for kind in handlers}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def dispatch(kind, event):
+        async with semaphore:
+            start = time.perf_counter()
+            await handlers[kind](event)
+            latencies[kind].append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.concurrency > 1:
+            await asyncio.gather(*(dispatch(kind, event) for kind, event in events))
+        else:
+            for kind, event in events:
+                await dispatch(kind, event)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'events': len(events),
+        'elapsed_seconds': round(elapsed, 4),
+        'events_per_second': round(len(events) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(all_latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(all_latencies, 0.99) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'per_kind': {
+            kind: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+                'mean_ms': round(statistics.fmean(values) * 1000, 3) if values else 0.0,
+            }
+            for kind, values in latencies.items()
+        },
+        'rpc_calls': dict(client.calls),
+    }
+
+
+def print_report(result):
+    """Human-readable summary"""
+    print(f"Events:      {result['events']} in {result['elapsed_seconds']}s "
+          f"({result['events_per_second']} events/s)")
+    print(f"Latency:     p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+    print(f"Peak memory: {result['peak_memory_kb']} KiB (tracemalloc)")
+    print()
+    print(f"{'kind':<8}{'count':>8}{'p50 ms':>12}{'p99 ms':>12}{'mean ms':>12}")
+    for kind, stats in result['per_kind'].items():
+        print(f"{kind:<8}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p99_ms']:>12}{stats['mean_ms']:>12}")
+    print()
+    print("RPC calls:   " + ', '.join(f"{name}={count}" for name, count in sorted(result['rpc_calls'].items())))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline NiftyForwarder benchmark")
+    parser.add_argument('--events', type=int, default=2000, help="number of synthetic events")
+    parser.add_argument('--sources', type=int, default=20, help="number of source channels")
+    parser.add_argument('--targets', type=int, default=3, help="number of target channels")
+    parser.add_argument('--latency', type=float, default=0.0, help="fake RPC latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random RPC latency in seconds")
+    parser.add_argument('--flood-every', type=int, default=0, help="raise FloodWaitError on every Nth send")
+    parser.add_argument('--flood-seconds', type=int, default=1, help="seconds reported by injected flood waits")
+    parser.add_argument('--concurrency', type=int, default=1, help="events handled concurrently")
+    parser.add_argument('--premium', action='store_true', help="exercise the premium emoji path")
+    parser.add_argument('--restricted', action='store_true',
+                        help="sources restrict forwarding, so media has to be transferred again")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print machine-readable JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    NiftyForwarder.logger.setLevel(logging.CRITICAL)
+    NiftyForwarder.console_logger.setLevel(logging.CRITICAL)
+    result = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
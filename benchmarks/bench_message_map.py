@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for the message map
+Compares bytes per mapping of the old representation ("chan_msgid" string keys
+mapping to lists of dicts) with MessageMap, and times lookups in both
+
+Usage: python benchmarks/bench_message_map.py [--mappings 200000] [--targets 3] [--json]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NiftyForwarder
+
+
+def synthetic_mappings(count, targets, seed=0):
+    """(source id, message id, [(target id, target message id), ...]) like a busy forwarder produces"""
+    rng = random.Random(seed)
+    sources = [1_000_000_000 + rng.randrange(10 ** 9) for _ in range(20)]
+    target_ids = [-1_000_000_000_000 - rng.randrange(10 ** 9) for _ in range(targets)]
+    next_target_id = {target_id: 1 for target_id in target_ids}
+    for message_id in range(1, count + 1):
+        copies = []
+        for target_id in target_ids:
+            copies.append((target_id, next_target_id[target_id]))
+            next_target_id[target_id] += 1
+        yield rng.choice(sources), 100_000 + message_id, copies
+
+
+def build_legacy(mappings):
+    """The representation used before MessageMap"""
+    legacy = {}
+    for source_id, message_id, copies in mappings:
+        legacy[f"{source_id}_{message_id}"] = [
+            {'channel_id': target_id, 'message_id': target_message_id}
+            for target_id, target_message_id in copies
+        ]
+    return legacy
+
+
+def build_compact(mappings):
+    message_map = NiftyForwarder.MessageMap()
+    for source_id, message_id, copies in mappings:
+        message_map.add(source_id, message_id, copies)
+    message_map.saved_json(message_map.take_changes())  # A flushed map also keeps the copy it last wrote
+    return message_map
+
+
+def measure(build, mappings):
+    """Bytes retained by the structure build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    structure = build(mappings)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return structure, retained
+
+
+def time_lookups(lookup, keys):
+    started = time.perf_counter()
+    for key in keys:
+        lookup(*key)
+    return (time.perf_counter() - started) / len(keys) * 1e9
+
+
+def run_benchmark(args):
+    mappings = list(synthetic_mappings(args.mappings, args.targets, seed=args.seed))
+    keys = [(source_id, message_id) for source_id, message_id, _ in mappings]
+    random.Random(args.seed).shuffle(keys)
+    keys = keys[:min(len(keys), 100_000)]
+
+    legacy, legacy_bytes = measure(build_legacy, mappings)
+    compact, compact_bytes = measure(build_compact, mappings)
+
+    legacy_ns = time_lookups(lambda source_id, message_id: legacy.get(f"{source_id}_{message_id}"), keys)
+    compact_ns = time_lookups(compact.get, keys)
+
+    return {
+        'mappings': args.mappings,
+        'targets_per_mapping': args.targets,
+        'legacy_bytes_per_mapping': round(legacy_bytes / args.mappings, 1),
+        'compact_bytes_per_mapping': round(compact_bytes / args.mappings, 1),
+        'reduction': round(legacy_bytes / compact_bytes, 2) if compact_bytes else 0.0,
+        'legacy_total_mib': round(legacy_bytes / 2 ** 20, 1),
+        'compact_total_mib': round(compact_bytes / 2 ** 20, 1),
+        'legacy_lookup_ns': round(legacy_ns, 1),
+        'compact_lookup_ns': round(compact_ns, 1),
+    }
+
+
+def print_report(result):
+    """Human-readable summary"""
+    print(f"Mappings:    {result['mappings']} x {result['targets_per_mapping']} targets")
+    print(f"Before:      {result['legacy_bytes_per_mapping']} bytes/mapping "
+          f"({result['legacy_total_mib']} MiB), lookup {result['legacy_lookup_ns']} ns")
+    print(f"After:       {result['compact_bytes_per_mapping']} bytes/mapping "
+          f"({result['compact_total_mib']} MiB), lookup {result['compact_lookup_ns']} ns")
+    print(f"Reduction:   {result['reduction']}x")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NiftyForwarder message map memory benchmark")
+    parser.add_argument('--mappings', type=int, default=200_000, help="number of forwarded source messages")
+    parser.add_argument('--targets', type=int, default=3, help="target copies per source message")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print machine-readable JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    NiftyForwarder.logger.setLevel(logging.CRITICAL)
+    result = run_benchmark(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
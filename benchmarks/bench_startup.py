@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for NiftyForwarder
+Starts fresh interpreters that import the module, create the forwarder, run the
+warm-up against a fake client and forward one message, and reports how long
+each phase took after process start (median over all runs)
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--latency 0.05] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PHASES = ('import', 'construct', 'warm-up', 'first forward')
+
+
+async def restart_and_forward(started, latency, targets):
+    """Child process: the steps a restarted forwarder takes before its first forward"""
+    import asyncio
+    import contextlib
+    import io
+
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    sys.path.insert(0, BENCH_DIR)
+    marks = {}
+    # Imported only to time the module import itself
+    import NiftyForwarder  # noqa: F401
+    marks['import'] = time.time() - started
+
+    from fake_client import FakeClient, make_message, new_message_event
+    from bench_forwarder import build_forwarder, KEYWORDS
+    client = FakeClient(latency=latency)
+    forwarder = build_forwarder(client, sources=1, targets=targets)
+    marks['construct'] = time.time() - started
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await forwarder.warm_up(deadline=5)
+    marks['warm-up'] = time.time() - started
+
+    await forwarder.handle_new_message(new_message_event(make_message(1000, 1, f"{KEYWORDS[0]} after restart")))
+    if not client.calls['send_message']:
+        raise SystemExit("the first message was not forwarded")
+    marks['first forward'] = time.time() - started
+    forwarder.io_executor.shutdown(wait=True)
+    await asyncio.sleep(0)
+    return marks
+
+
+def run_once(args):
+    """Time one fresh process; the clock starts before the interpreter does"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', repr(time.time()),
+               '--latency', str(args.latency), '--targets', str(args.targets)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(args):
+    runs = [run_once(args) for _ in range(args.runs)]
+    return {
+        'runs': args.runs,
+        'rpc_latency_ms': args.latency * 1000,
+        'targets': args.targets,
+        'median_ms': {phase: round(statistics.median(run[phase] for run in runs) * 1000, 1) for phase in PHASES},
+        'max_ms': {phase: round(max(run[phase] for run in runs) * 1000, 1) for phase in PHASES},
+    }
+
+
+def print_report(result):
+    """Human-readable summary"""
+    print(f"Runs:        {result['runs']} fresh processes, {result['targets']} targets, "
+          f"{result['rpc_latency_ms']:.0f} ms per fake RPC")
+    print()
+    print(f"{'phase':<16}{'median ms':>12}{'max ms':>12}")
+    for phase in PHASES:
+        print(f"{phase:<16}{result['median_ms'][phase]:>12}{result['max_ms'][phase]:>12}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NiftyForwarder time-to-first-forward benchmark")
+    parser.add_argument('--runs', type=int, default=5, help="number of fresh processes")
+    parser.add_argument('--latency', type=float, default=0.05, help="fake RPC latency in seconds")
+    parser.add_argument('--targets', type=int, default=3, help="number of target channels")
+    parser.add_argument('--json', action='store_true', help="print machine-readable JSON")
+    parser.add_argument('--child', type=float, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child is not None:
+        import asyncio
+        print(json.dumps(asyncio.run(restart_and_forward(args.child, args.latency, args.targets))))
+        return
+    result = run_benchmark(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+In-process fake Telethon client and message builders for offline benchmarks
+Nothing here talks to Telegram
+"""
+
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon import utils
+from telethon.errors import FloodWaitError, ChatForwardsRestrictedError
+from telethon.tl.types import PeerChannel, PeerChat, MessageEntityBold, MessageEntityItalic
+
+
+class FakeClient:
+    """Stand-in for TelegramClient with configurable latency and flood waits"""
+
+    def __init__(self, latency=0.0, jitter=0.0, flood_every=0, flood_seconds=1, seed=0, restricted=False):
+        self.latency = latency  # Base seconds per RPC
+        self.jitter = jitter  # Extra random seconds per RPC (0..jitter)
+        self.flood_every = flood_every  # Raise FloodWaitError on every Nth send (0 = never)
+        self.flood_seconds = flood_seconds
+        self.restricted = restricted  # Sending media by reference fails like in a protected chat
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.next_message_id = 1
+        self.send_count = 0
+
+    async def _rpc(self, name, can_flood=False):
+        """Simulate the network round trip of one request"""
+        self.calls[name] += 1
+        delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+        if can_flood and self.flood_every:
+            self.send_count += 1
+            if self.send_count % self.flood_every == 0:
+                self.calls['flood_wait'] += 1
+                raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+    def _new_message(self, entity):
+        """Create the object Telethon would return for a sent message"""
+        message = SimpleNamespace(id=self.next_message_id, peer_id=PeerChannel(entity.id))
+        self.next_message_id += 1
+        return message
+
+    async def __call__(self, request):
+        """Raw API calls (sticker sets etc.) return empty results; file parts are accepted"""
+        name = type(request).__name__
+        await self._rpc(name)
+        if name in ('SaveFilePartRequest', 'SaveBigFilePartRequest'):
+            self.calls['uploaded_bytes'] += len(request.bytes)
+            return True
+        return SimpleNamespace(sets=[], documents=[])
+
+    async def get_entity(self, peer):
+        await self._rpc('get_entity')
+        peer_id = abs(peer) if isinstance(peer, int) else abs(hash(peer)) % 10 ** 9
+        return SimpleNamespace(id=peer_id, title=f"Channel {peer_id}")
+
+    async def get_me(self):
+        await self._rpc('get_me')
+        return SimpleNamespace(id=1, first_name='Bench', premium=False, bot=False)
+
+    async def get_messages(self, peer, ids=None):
+        await self._rpc('get_messages')
+        return None
+
+    async def send_message(self, entity, message='', **kwargs):
+        await self._rpc('send_message', can_flood=True)
+        return self._new_message(entity)
+
+    async def send_file(self, entity, file, caption=None, **kwargs):
+        await self._rpc('send_file', can_flood=True)
+        if self.restricted and hasattr(file, 'file_reference'):
+            raise ChatForwardsRestrictedError(request=None)
+        if isinstance(file, (list, tuple)):
+            return [self._new_message(entity) for _ in file]
+        return self._new_message(entity)
+
+    async def edit_message(self, entity, message=None, text=None, **kwargs):
+        await self._rpc('edit_message', can_flood=True)
+        return SimpleNamespace(id=message)
+
+    async def delete_messages(self, entity, message_ids, **kwargs):
+        await self._rpc('delete_messages', can_flood=True)
+        return []
+
+    async def download_media(self, media, file=None, **kwargs):
+        """Writes a small placeholder when given a path, like the media cache does"""
+        await self._rpc('download_media')
+        if isinstance(file, str):
+            with open(file, 'wb') as f:
+                f.write(bytes(64 * 1024))
+            return file
+        return None
+    
+    async def iter_download(self, file, offset=0, stride=None, limit=None, request_size=512 * 1024,
+                            file_size=None, **kwargs):
+        """Yield zero-filled chunks the way Telethon's ranged downloads do"""
+        size = file_size if file_size is not None else file.size
+        stride = stride or request_size
+        produced = 0
+        while offset < size and (limit is None or produced < limit):
+            await self._rpc('GetFileRequest')
+            chunk = bytes(min(request_size, size - offset))
+            self.calls['downloaded_bytes'] += len(chunk)
+            yield chunk
+            offset += stride
+            produced += 1
+
+    def add_event_handler(self, callback, event=None):
+        self.calls['add_event_handler'] += 1
+
+    def remove_event_handler(self, callback, event=None):
+        self.calls['remove_event_handler'] += 1
+
+    async def disconnect(self):
+        self.calls['disconnect'] += 1
+
+
+def make_photo(photo_id):
+    """Media payload shaped like MessageMediaPhoto"""
+    return SimpleNamespace(photo=SimpleNamespace(id=photo_id, file_reference=b''))
+
+
+def make_document(document_id, size=512 * 1024, mime_type='video/mp4'):
+    """Media payload shaped like MessageMediaDocument"""
+    return SimpleNamespace(document=SimpleNamespace(
+        id=document_id, size=size, mime_type=mime_type, attributes=[], file_reference=b''
+    ))
+
+
+def make_message(chat_id, message_id, text='', media=None, grouped_id=None,
+                 edit_date=None, bold=False, date=None, group=False):
+    """Build a message object with the attributes the forwarder reads
+    
+    With group=True it comes from a basic group instead of a channel.
+    """
+    peer = PeerChat(chat_id) if group else PeerChannel(chat_id)
+    entities = None
+    if bold and text:
+        entities = [MessageEntityBold(offset=0, length=min(5, len(text))),
+                    MessageEntityItalic(offset=0, length=min(3, len(text)))]
+    return SimpleNamespace(
+        id=message_id,
+        peer_id=peer,
+        chat_id=utils.get_peer_id(peer),
+        text=text,
+        message=text,
+        raw_text=text,
+        entities=entities,
+        media=media,
+        grouped_id=grouped_id,
+        date=date or datetime.now(timezone.utc),
+        edit_date=edit_date,
+        fwd_from=None,
+        via_bot_id=None,
+        sender=None,
+        sender_id=None,
+        post=not group,
+    )
+
+
+def new_message_event(message):
+    """Event payload for events.NewMessage"""
+    return SimpleNamespace(message=message, chat_id=message.chat_id)
+
+
+def edited_message_event(message):
+    """Event payload for events.MessageEdited"""
+    return SimpleNamespace(message=message, chat_id=message.chat_id)
+
+
+def deleted_message_event(chat_id, deleted_ids):
+    """Event payload for events.MessageDeleted
+    
+    chat_id=None is a delete from a basic group or private chat, which Telegram
+    sends without the chat.
+    """
+    return SimpleNamespace(deleted_ids=list(deleted_ids),
+                           chat_id=None if chat_id is None else utils.get_peer_id(PeerChannel(chat_id)))
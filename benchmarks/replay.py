@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Replay an event recording made with RECORD_EVENTS_FILE against a fake client
+
+Usage: python benchmarks/replay.py events.jsonl.gz [--speed 0] [--latency 0.02] [--json]
+
+--speed 0 replays as fast as possible, 1 keeps the original timing, 2 runs twice as fast.
+Keyword matching is reproduced from the recording: messages that matched when they
+were recorded carry a marker keyword, so hashed recordings replay the same way.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import logging
+import math
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon import utils
+from telethon.tl import types
+
+from fake_client import (FakeClient, make_message, make_photo, make_document,
+                         new_message_event, edited_message_event)
+from bench_forwarder import build_forwarder, percentile, print_report
+import NiftyForwarder
+
+MARKER = 'replaymatch'
+
+
+def load_recording(path):
+    """Read the header and event records of a recording"""
+    header = {}
+    records = []
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'v' in record:
+                # Every flush session starts with a header; keep the first one
+                header = header or record
+                continue
+            records.append(record)
+    return header, records
+
+
+def rebuild_entity(name, offset, length, document_id):
+    """Recreate a message entity from its recorded form"""
+    entity_type = getattr(types, name, None)
+    if entity_type is None:
+        return None
+    extra = {
+        'MessageEntityCustomEmoji': {'document_id': document_id or 0},
+        'MessageEntityTextUrl': {'url': 'https://example.com'},
+        'MessageEntityPre': {'language': ''},
+        'MessageEntityMentionName': {'user_id': 0},
+    }.get(name, {})
+    try:
+        return entity_type(offset=offset, length=length, **extra)
+    except TypeError:
+        return None
+
+
+def rebuild_media(description):
+    """Recreate media from its recorded form"""
+    if not description:
+        return None
+    kind = description.get('t')
+    if kind == 'photo':
+        return make_photo(description.get('id'))
+    if kind == 'document':
+        return make_document(description.get('id'), size=description.get('size') or 0,
+                             mime_type=description.get('mime') or 'application/octet-stream')
+    if kind == 'webpage':
+        return types.MessageMediaWebPage(webpage=types.WebPageEmpty(id=0, url=description.get('url')))
+    return SimpleNamespace()
+
+
+def rebuild_message(record):
+    """Turn a new/edit record back into a message object"""
+    if 'x' in record:
+        text = record['x'] or ''
+    elif record.get('h'):
+        digest = record['h']
+        text = (digest * math.ceil(record['n'] / len(digest)))[:record['n']]
+    else:
+        text = ''
+
+    shift = 0
+    if record.get('kw'):
+        text = f"{MARKER} {text}"
+        shift = len(MARKER) + 1
+
+    entities = [
+        entity for entity in (
+            rebuild_entity(name, offset + shift, length, document_id)
+            for name, offset, length, document_id in record.get('e', [])
+        ) if entity is not None
+    ] or None
+
+    date = datetime.fromtimestamp(record['d'], tz=timezone.utc) if record.get('d') else None
+    edit_date = datetime.fromtimestamp(record['ed'], tz=timezone.utc) if record.get('ed') else None
+    message = make_message(record['c'], record['m'], text, media=rebuild_media(record.get('md')),
+                           grouped_id=record.get('g'), edit_date=edit_date, date=date)
+    message.entities = entities
+    if record.get('f'):
+        message.fwd_from = SimpleNamespace(date=date)
+    return message
+
+
+def rebuild_event(record):
+    """Turn a record into the event object its handler expects"""
+    if record['k'] == 'delete':
+        return SimpleNamespace(deleted_ids=record['ids'], chat_id=record.get('c'))
+    message = rebuild_message(record)
+    if record['k'] == 'edit':
+        return edited_message_event(message)
+    return new_message_event(message)
+
+
+def source_ids(records):
+    """Source channel ids seen in the recording"""
+    ids = set()
+    for record in records:
+        if record['k'] == 'delete':
+            if record.get('c') is not None:
+                ids.add(utils.resolve_id(record['c'])[0])
+        elif record.get('c') is not None:
+            ids.add(record['c'])
+    return sorted(ids)
+
+
+async def run_replay(args):
+    """Feed a recording through TelegramForwarder's handlers"""
+    header, records = load_recording(args.recording)
+    client = FakeClient(latency=args.latency, jitter=args.jitter,
+                        flood_every=args.flood_every, flood_seconds=args.flood_seconds)
+    forwarder = build_forwarder(client, 0, args.targets)
+    forwarder.keywords = [MARKER]
+    forwarder.source_channels = [
+        {'id': channel_id, 'title': f"Source {channel_id}", 'input': str(channel_id)}
+        for channel_id in source_ids(records)
+    ]
+    forwarder.rebuild_rules()
+    handlers = {
+        'new': forwarder.handle_new_message,
+        'edit': forwarder.handle_message_edit,
+        'delete': forwarder.handle_message_delete,
+    }
+    events = [(record['k'], record['t'], rebuild_event(record)) for record in records]
+    latencies = {kind: [] for kind in handlers}
+
+    async def dispatch(kind, event):
+        start = time.perf_counter()
+        await handlers[kind](event)
+        latencies[kind].append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.speed > 0:
+            # Keep the recorded spacing, handling events concurrently like Telethon does
+            tasks = []
+            for kind, offset, event in events:
+                delay = offset / args.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(dispatch(kind, event)))
+            await asyncio.gather(*tasks)
+        else:
+            for kind, _, event in events:
+                await dispatch(kind, event)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'recording': args.recording,
+        'hashed': header.get('hashed'),
+        'events': len(events),
+        'elapsed_seconds': round(elapsed, 4),
+        'events_per_second': round(len(events) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(all_latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(all_latencies, 0.99) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'per_kind': {
+            kind: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+                'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            }
+            for kind, values in latencies.items()
+        },
+        'rpc_calls': dict(client.calls),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded NiftyForwarder event stream")
+    parser.add_argument('recording', help="file written by RECORD_EVENTS_FILE")
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="0 = as fast as possible, 1 = original timing, N = N times faster")
+    parser.add_argument('--targets', type=int, default=3, help="number of fake target channels")
+    parser.add_argument('--latency', type=float, default=0.0, help="fake RPC latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random RPC latency in seconds")
+    parser.add_argument('--flood-every', type=int, default=0, help="raise FloodWaitError on every Nth send")
+    parser.add_argument('--flood-seconds', type=int, default=1, help="seconds reported by injected flood waits")
+    parser.add_argument('--json', action='store_true', help="print machine-readable JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    NiftyForwarder.logger.setLevel(logging.CRITICAL)
+    NiftyForwarder.console_logger.setLevel(logging.CRITICAL)
+    result = asyncio.run(run_replay(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
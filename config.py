@@ -45,14 +45,85 @@ FORWARD_FROM_PRIVATE_CHATS = True
 IGNORE_MEDIA = False  # Set to True to ignore media messages
 IGNORE_FORWARDS = False  # Set to True to ignore already forwarded messages
 IGNORE_BOTS = False  # Set to True to ignore messages from bots
+MIN_MESSAGE_LENGTH = 0  # Skip messages with shorter text (0 = no limit)
+MAX_MESSAGE_LENGTH = 0  # Skip messages with longer text (0 = no limit)
+
+# Files that must be transferred again (e.g. from chats that restrict forwarding)
+# are streamed in parallel parts without a temp file when at least this large
+STREAM_TRANSFER_MIN_SIZE = 10 * 1024 * 1024
+STREAM_TRANSFER_WORKERS = 4  # Parts in flight; memory use is about 512 KB per worker
+
+# Smaller files are downloaded once and kept for other targets and retries
+MEDIA_CACHE_DIR = 'media_cache'
+MEDIA_CACHE_MAX_MB = 256  # Least recently used files are deleted above this (0 = no cache)
+
+# Same photo/video reposted by several sources: 'off', 'skip' (drop the repost) or 'text' (send caption only)
+MEDIA_DEDUP = 'off'
+MEDIA_DEDUP_TTL_HOURS = 24  # How long a forwarded file counts as recent
 
 # Rate limiting (seconds between forwards)
 FORWARD_DELAY = 1  # Delay between forwarding to different channels
 
+# Sends, edits and deletes in flight at once; deletes and edits are served before new messages
+OUTBOUND_CONCURRENCY = 8
+
+# Concurrent sends per target are learned: raised while sends are fast, halved on flood waits
+SEND_CONCURRENCY_START = 2  # For targets without a learned limit yet
+SEND_CONCURRENCY_MAX = 8
+SEND_SLOW_SECONDS = 3  # A send slower than this counts like a flood wait
+
+# Stop sending to a target after this many permanent errors in a row (deleted, no rights, banned)
+CIRCUIT_BREAKER_THRESHOLD = 3
+CIRCUIT_PROBE_SECONDS = 300  # Try one message every N seconds to see if the target works again
+
+# ===== METRICS SETTINGS =====
+# Local Prometheus-compatible endpoint (http://METRICS_HOST:METRICS_PORT/metrics)
+METRICS_ENABLED = False
+METRICS_HOST = '127.0.0.1'  # Keep on localhost unless you put it behind a proxy
+METRICS_PORT = 9464
+
+# Print live statistics every N seconds while forwarding (0 = only in the menu)
+DASHBOARD_REFRESH_SECONDS = 60
+
+# Max seconds to spend filling caches (target entities, emoji index) before handling messages
+WARMUP_TIMEOUT = 15
+
+# Seconds between checks of forwarder_config.json for hand edits (0 = only reload on SIGHUP)
+CONFIG_RELOAD_INTERVAL = 2
+
+# Seconds between write-behind flushes of forwarder state (message map, hashes)
+STATE_FLUSH_INTERVAL = 5
+
+# Forget source->target message mappings after N days (0 = keep them all in memory)
+MESSAGE_MAP_MAX_AGE_DAYS = 0
+MESSAGE_MAP_SPILL_FILE = 'message_map.sqlite'  # Old mappings go here so edits/deletes still work (None = drop)
+
+# ===== EVENT RECORDING =====
+# Record incoming new/edit/delete events for replay with benchmarks/replay.py
+RECORD_EVENTS_FILE = None  # Example: 'events.jsonl.gz'
+RECORD_HASH_TEXT = True  # Store a digest instead of the message text
+
+# Seconds to let messages in flight finish on SIGTERM or Ctrl+C; the rest is sent after the restart
+SHUTDOWN_TIMEOUT = 20
+
+# ===== STALL DIAGNOSTICS =====
+# Stacks are written to STALL_REPORT_FILE when the event loop is blocked or a handler is slow
+LOOP_STALL_SECONDS = 1.0  # Event loop blocked this long (0 = no watchdog thread)
+SLOW_HANDLER_SECONDS = 30  # New/edit/delete handler still running after this long (0 = off)
+STALL_REPORT_FILE = 'stalls.txt'
+
+# ===== MEMORY DIAGNOSTICS =====
+# Sizes of the forwarder's caches and maps are written to MEMORY_REPORT_FILE on `kill -USR1 <pid>`
+MEMORY_REPORT_FILE = 'memory.txt'
+MEMORY_REPORT_INTERVAL = 0  # Also write a report every N minutes (0 = only on the signal)
+MEMORY_TRACE_FRAMES = 0  # Trace allocations with tracemalloc, N frames deep, and report what grew (0 = off, slower)
+
 # ===== LOGGING SETTINGS =====
 LOG_LEVEL = 'INFO'  # DEBUG, INFO, WARNING, ERROR, CRITICAL
 LOG_TO_FILE = True
-LOG_FILE_NAME = 'NiftyForwarder.log'
+LOG_FILE_NAME = 'NiftyForwarder.log'  # Written as JSON lines by a background thread
+LOG_SAMPLE_LIMIT = 60  # Max INFO/DEBUG records per category per interval (0 = no sampling)
+LOG_SAMPLE_INTERVAL = 60  # Sampling window in seconds
 
 # ===== EXAMPLE CONFIGURATIONS =====
 """
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from telethon.errors import ChatWriteForbiddenError
+
+from fake_client import FakeClient, make_message, new_message_event
+from bench_forwarder import build_forwarder
+from NiftyForwarder import CircuitBreaker, MetricsRegistry
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.breaker = CircuitBreaker(self.metrics, threshold=3, probe_seconds=300)
+    
+    def open_circuit(self, destination):
+        for _ in range(3):
+            opened = self.breaker.failure(destination, permanent=True)
+        return opened
+    
+    def test_opens_after_threshold_permanent_errors(self):
+        self.assertFalse(self.breaker.failure(2000, permanent=True))
+        self.assertFalse(self.breaker.failure(2000, permanent=True))
+        self.assertTrue(self.breaker.failure(2000, permanent=True))
+        self.assertTrue(self.breaker.is_open(2000))
+        self.assertFalse(self.breaker.allow(2000))
+        self.assertTrue(self.breaker.allow(2001))
+        self.assertEqual(self.metrics.value('circuit_open', target='2000'), 1)
+    
+    def test_other_errors_neither_count_nor_reset(self):
+        self.breaker.failure(2000, permanent=True)
+        self.breaker.failure(2000, permanent=True)
+        self.assertFalse(self.breaker.failure(2000, permanent=False))
+        self.assertTrue(self.breaker.failure(2000, permanent=True))
+    
+    def test_success_resets_the_count(self):
+        self.breaker.failure(2000, permanent=True)
+        self.breaker.failure(2000, permanent=True)
+        self.assertFalse(self.breaker.success(2000))
+        self.assertFalse(self.breaker.failure(2000, permanent=True))
+        self.assertFalse(self.breaker.is_open(2000))
+    
+    def test_one_probe_per_interval(self):
+        self.open_circuit(2000)
+        self.breaker.opened[2000] = time.monotonic() - 301
+        self.assertTrue(self.breaker.allow(2000))
+        self.assertFalse(self.breaker.allow(2000))  # The probe is still in flight
+        
+        self.assertFalse(self.breaker.failure(2000, permanent=True))
+        self.assertTrue(self.breaker.is_open(2000))
+        self.assertFalse(self.breaker.allow(2000))  # A failed probe waits another interval
+        
+        self.breaker.opened[2000] = time.monotonic() - 301
+        self.assertTrue(self.breaker.allow(2000))
+        self.assertTrue(self.breaker.success(2000))
+        self.assertFalse(self.breaker.is_open(2000))
+        self.assertTrue(self.breaker.allow(2000))
+        self.assertEqual(self.metrics.value('circuit_open', target='2000'), 0)
+    
+    def test_cancelled_probe_lets_the_next_one_through(self):
+        self.open_circuit(2000)
+        self.breaker.opened[2000] = time.monotonic() - 301
+        self.assertTrue(self.breaker.allow(2000))
+        self.breaker.cancel_probe(2000)
+        self.assertTrue(self.breaker.is_open(2000))
+        self.assertTrue(self.breaker.allow(2000))
+
+
+class ForwardCircuitTest(unittest.TestCase):
+    """Forwards skip a target whose sends keep failing permanently"""
+    
+    def setUp(self):
+        self.client = FakeClient()
+        self.forwarder = build_forwarder(self.client, sources=1, targets=2)
+        self.forbidden = {2000}
+        self.delivered = []
+        send_message = self.client.send_message
+        
+        async def send_or_refuse(entity, message='', **kwargs):
+            if entity.id in self.forbidden:
+                raise ChatWriteForbiddenError(request=None)
+            self.delivered.append(entity.id)
+            return await send_message(entity, message, **kwargs)
+        
+        self.client.send_message = send_or_refuse
+    
+    def tearDown(self):
+        self.forwarder.io_executor.shutdown(wait=True)
+    
+    def forward(self, first, count):
+        async def scenario():
+            for message_id in range(first, first + count):
+                message = make_message(1000, message_id, f"alert price #{message_id}")
+                await self.forwarder.handle_new_message(new_message_event(message))
+        
+        asyncio.run(scenario())
+    
+    def test_failing_target_is_skipped_until_a_probe_succeeds(self):
+        self.forward(1, 3)
+        self.assertTrue(self.forwarder.breaker.is_open(2000))
+        self.assertFalse(self.forwarder.breaker.is_open(2001))
+        
+        self.delivered.clear()
+        self.forward(4, 2)
+        self.assertEqual(self.delivered, [2001, 2001])
+        self.assertEqual(self.forwarder.metrics.value('forwards_total', target='2000', result='skipped'), 2)
+        
+        self.forbidden.clear()
+        self.forwarder.breaker.opened[2000] = time.monotonic() - self.forwarder.breaker.probe_seconds - 1
+        self.forward(6, 1)
+        self.assertFalse(self.forwarder.breaker.is_open(2000))
+        self.assertEqual(sorted(self.delivered[2:]), [2000, 2001])
+
+
+if __name__ == '__main__':
+    unittest.main()
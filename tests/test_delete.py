@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_client import FakeClient, make_message, new_message_event, deleted_message_event
+from bench_forwarder import build_forwarder
+
+
+class ChatlessDeleteTest(unittest.TestCase):
+    """Deletes from basic groups and private chats arrive without a chat id"""
+    
+    def setUp(self):
+        self.client = FakeClient()
+        self.forwarder = build_forwarder(self.client, sources=2, targets=1)
+    
+    def tearDown(self):
+        self.forwarder.io_executor.shutdown(wait=True)
+    
+    def forward(self, chat_id, message_id, group=False):
+        message = make_message(chat_id, message_id, f"alert price #{chat_id}_{message_id}", group=group)
+        asyncio.run(self.forwarder.handle_new_message(new_message_event(message)))
+    
+    def delete(self, chat_id, message_id):
+        asyncio.run(self.forwarder.handle_message_delete(deleted_message_event(chat_id, [message_id])))
+    
+    def test_basic_group_delete_removes_copies(self):
+        self.forward(1000, 7, group=True)
+        self.assertEqual(self.forwarder.rules.group_ids, {1000})
+        self.delete(None, 7)
+        self.assertEqual(self.client.calls['delete_messages'], 1)
+        self.assertNotIn((1000, 7), self.forwarder.message_map)
+        self.assertEqual(self.forwarder.message_map.group_messages, {})
+    
+    def test_skipped_without_basic_group_sources(self):
+        self.forward(1000, 7)
+        self.assertEqual(self.forwarder.rules.group_ids, frozenset())
+        self.delete(None, 7)  # A private chat message with the same id
+        self.assertEqual(self.client.calls['delete_messages'], 0)
+        self.assertIn((1000, 7), self.forwarder.message_map)
+    
+    def test_channel_copies_not_matched_by_chatless_delete(self):
+        self.forward(1000, 3, group=True)
+        self.forward(1001, 7)
+        self.delete(None, 7)
+        self.assertEqual(self.client.calls['delete_messages'], 0)
+        self.assertIn((1001, 7), self.forwarder.message_map)
+        self.delete(1001, 7)
+        self.assertEqual(self.client.calls['delete_messages'], 1)
+    
+    def test_group_flag_is_saved_and_indexed_after_restart(self):
+        self.forward(1000, 7, group=True)
+        self.forwarder.save_config()
+        restarted = build_forwarder(self.client, sources=0, targets=0)
+        restarted.config_file = self.forwarder.config_file
+        try:
+            restarted.load_config()
+            self.assertEqual(restarted.rules.group_ids, {1000})
+            self.assertEqual(restarted.message_map.group_messages, {7: 1000})
+        finally:
+            restarted.io_executor.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_client import FakeClient, make_message, new_message_event, deleted_message_event
+from bench_forwarder import build_forwarder
+from NiftyForwarder import Digest, DigestItem
+
+
+class DigestTest(unittest.TestCase):
+    def test_fits_within_one_message(self):
+        digest = Digest(2000)
+        item = DigestItem(1000, 1, "Source 0", "x" * 3000)
+        self.assertTrue(digest.fits(item))
+        digest.items.append(item)
+        self.assertFalse(digest.fits(DigestItem(1000, 2, "Source 0", "x" * 1100)))
+        self.assertTrue(digest.fits(DigestItem(1000, 3, "Source 0", "short")))
+
+
+class DigestBatchingTest(unittest.TestCase):
+    """A target in digest mode gets one message per batch of matched texts"""
+    
+    def setUp(self):
+        self.client = FakeClient()
+        self.forwarder = build_forwarder(self.client, sources=1, targets=1)
+        self.forwarder.digests = {'2000': {'interval': 60, 'max_items': 3}}
+        self.forwarder.rebuild_rules()
+    
+    def tearDown(self):
+        self.forwarder.io_executor.shutdown(wait=True)
+    
+    async def forward(self, message_id):
+        message = make_message(1000, message_id, f"alert price #{message_id}")
+        await self.forwarder.handle_new_message(new_message_event(message))
+    
+    def test_full_batch_is_sent_as_one_message(self):
+        async def scenario():
+            for message_id in (1, 2, 3):
+                await self.forward(message_id)
+        
+        asyncio.run(scenario())
+        self.assertEqual(self.client.calls['send_message'], 1)
+        self.assertEqual(self.forwarder.digest_pending, {})
+        (digest,) = self.forwarder.digest_sent.values()
+        self.assertEqual([item.message_id for item in digest.items], [1, 2, 3])
+        self.assertEqual(self.forwarder.message_map.get(1000, 2), [(2000, -digest.message_id)])
+    
+    def test_deleting_a_sent_message_edits_the_digest(self):
+        async def scenario():
+            for message_id in (1, 2, 3):
+                await self.forward(message_id)
+            await self.forwarder.handle_message_delete(deleted_message_event(1000, [2]))
+        
+        asyncio.run(scenario())
+        self.assertEqual(self.client.calls['edit_message'], 1)
+        self.assertEqual(self.client.calls['delete_messages'], 0)
+        (digest,) = self.forwarder.digest_sent.values()
+        self.assertEqual([item.message_id for item in digest.items], [1, 3])
+    
+    def test_deleting_a_pending_message_drops_it_from_the_batch(self):
+        async def scenario():
+            await self.forward(1)
+            await self.forward(2)
+            await self.forwarder.handle_message_delete(deleted_message_event(1000, [1]))
+            pending = [item.message_id for item in self.forwarder.digest_pending[2000].items]
+            await self.forwarder.flush_all_digests()
+            return pending
+        
+        self.assertEqual(asyncio.run(scenario()), [2])
+        self.assertEqual(self.client.calls['send_message'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
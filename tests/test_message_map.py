@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from NiftyForwarder import MessageMap
+
+
+class MessageMapTest(unittest.TestCase):
+    def test_keys_pack_source_and_message_id(self):
+        message_map = MessageMap()
+        message_map.add(1001, 7, [(2000, 55), (2001, 56)])
+        self.assertEqual(list(message_map.entries), [(1001 << 32) | 7])
+        self.assertEqual(message_map.get(1001, 7), [(2000, 55), (2001, 56)])
+        self.assertIsNone(message_map.get(1007, 1))
+        self.assertEqual(message_map.pop(1001, 7), [(2000, 55), (2001, 56)])
+        self.assertEqual(len(message_map), 0)
+    
+    def test_saved_json_applies_changes_and_loads_back(self):
+        message_map = MessageMap()
+        message_map.add(1000, 1, [(2000, 10)], stamp=100)
+        message_map.add(1000, 2, [(2000, 11)], stamp=101)
+        message_map.saved_json(message_map.take_changes())
+        message_map.pop(1000, 1)
+        message_map.add(1000, 3, [(2000, 12)], stamp=102)
+        data = message_map.saved_json(message_map.take_changes())
+        self.assertEqual(data, {'1000_2': [101, 2000, 11], '1000_3': [102, 2000, 12]})
+        
+        loaded = MessageMap()
+        loaded.load_json(data)
+        self.assertEqual(loaded.get(1000, 3), [(2000, 12)])
+        self.assertEqual(loaded.take_changes(), {})
+    
+    def test_load_json_accepts_the_old_layout(self):
+        message_map = MessageMap()
+        message_map.load_json({'1000_5': [{'channel_id': 2000, 'message_id': 9}]})
+        self.assertEqual(message_map.get(1000, 5), [(2000, 9)])
+    
+    def test_unwritten_changes_are_restored(self):
+        message_map = MessageMap()
+        message_map.add(1000, 1, [(2000, 10)])
+        changes = message_map.take_changes()
+        message_map.pop(1000, 1)
+        message_map.restore_changes(changes)
+        self.assertEqual(message_map.saved_json(message_map.take_changes()), {})
+    
+    def test_evicted_entries_are_found_in_the_spill_file(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), 'message_map.sqlite')
+        message_map = MessageMap(max_age=60, spill_path=spill_path)
+        message_map.add(1000, 1, [(2000, 10)], stamp=100)
+        message_map.add(1000, 2, [(2000, 11)], stamp=200)
+        try:
+            evicted = message_map.evict_older_than(150)
+            self.assertEqual(len(evicted), 1)
+            message_map.spill(evicted)
+            self.assertNotIn((1000, 1), message_map)
+            self.assertIn((1000, 2), message_map)
+            self.assertEqual(message_map.load_spilled(1000, 1, remove=True), [(2000, 10)])
+            self.assertIsNone(message_map.load_spilled(1000, 1))
+        finally:
+            message_map.close_spill()
+    
+    def test_group_index_covers_only_basic_group_sources(self):
+        message_map = MessageMap()
+        message_map.add(1000, 7, [(2000, 10)], stamp=100)
+        message_map.add(1001, 8, [(2000, 11)], stamp=100)
+        message_map.index_groups(frozenset({1000}))
+        self.assertEqual(message_map.group_messages, {7: 1000})
+        message_map.add(1000, 9, [(2000, 12)], stamp=200)
+        self.assertEqual(message_map.group_messages, {7: 1000, 9: 1000})
+        message_map.pop(1000, 7)
+        message_map.evict_older_than(300)
+        self.assertEqual(message_map.group_messages, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
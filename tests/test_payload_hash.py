@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.tl.types import MessageEntityBold, MessageEntityTextUrl
+
+import NiftyForwarder
+
+
+def make_message(text, bold_length):
+    """A fresh message with its own entity objects, like each edit event brings"""
+    return SimpleNamespace(text=text, entities=[
+        MessageEntityBold(0, bold_length),
+        MessageEntityTextUrl(6, 4, 'https://example.com')
+    ])
+
+
+class PayloadHashTest(unittest.TestCase):
+    def setUp(self):
+        self.forwarder = NiftyForwarder.TelegramForwarder()
+    
+    def tearDown(self):
+        self.forwarder.io_executor.shutdown(wait=True)
+    
+    def render_hash(self, message):
+        return NiftyForwarder.payload_hash(*asyncio.run(self.forwarder.render_message(message)))
+    
+    def test_same_message_rendered_twice_has_same_hash(self):
+        self.assertEqual(self.render_hash(make_message("alert link", 5)),
+                         self.render_hash(make_message("alert link", 5)))
+    
+    def test_formatting_change_changes_hash(self):
+        self.assertNotEqual(self.render_hash(make_message("alert link", 5)),
+                            self.render_hash(make_message("alert link", 4)))
+    
+    def test_text_change_changes_hash(self):
+        self.assertNotEqual(self.render_hash(make_message("alert link", 5)),
+                            self.render_hash(make_message("alert lino", 5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_client import FakeClient
+from NiftyForwarder import MetricsRegistry, OutboundScheduler
+
+
+class OutboundSchedulerTest(unittest.TestCase):
+    """With one slot, queued requests run in lane and destination order"""
+    
+    def run_queued(self, requests, cancel=()):
+        """Queue (lane, destination) requests behind a busy slot; return the order they ran in"""
+        async def scenario():
+            client = FakeClient()
+            scheduler = OutboundScheduler(MetricsRegistry(), limit=1)
+            order = []
+            
+            async def send(index, destination):
+                order.append(index)
+                await client.send_message(await client.get_entity(destination), str(index))
+            
+            blocker = asyncio.Event()
+            tasks = [asyncio.create_task(scheduler.run('new', 0, blocker.wait))]
+            await asyncio.sleep(0)
+            for index, (lane, destination) in enumerate(requests):
+                tasks.append(asyncio.create_task(scheduler.run(lane, destination, send, index, destination)))
+                await asyncio.sleep(0)
+            for index in cancel:
+                tasks[index + 1].cancel()
+            blocker.set()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            self.assertFalse([result for result in results if isinstance(result, Exception)])  # Cancelled ones are not
+            self.assertEqual(scheduler.active, 0)
+            self.assertEqual(scheduler.waiting, 0)
+            self.assertEqual(client.calls['send_message'], len(requests) - len(cancel))
+            return order
+        
+        return asyncio.run(scenario())
+    
+    def test_lanes_run_in_priority_order(self):
+        order = self.run_queued([('backfill', 1), ('new', 1), ('edit', 1), ('delete', 1)])
+        self.assertEqual(order, [3, 2, 1, 0])
+    
+    def test_lower_lanes_get_their_weight_per_round(self):
+        requests = [('delete', 1)] * 12 + [('new', 1)] * 2
+        order = self.run_queued(requests)
+        self.assertEqual(order, list(range(8)) + [12, 13] + list(range(8, 12)))
+    
+    def test_destinations_take_turns_within_a_lane(self):
+        order = self.run_queued([('new', 1), ('new', 1), ('new', 2)])
+        self.assertEqual(order, [0, 2, 1])
+    
+    def test_cancelled_waiters_are_skipped(self):
+        order = self.run_queued([('edit', 1), ('edit', 1), ('new', 1)], cancel=[0])
+        self.assertEqual(order, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
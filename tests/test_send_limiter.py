@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from telethon.errors import FloodWaitError
+
+from fake_client import FakeClient
+from NiftyForwarder import MetricsRegistry, SendLimiter
+
+
+class SendLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient()
+        self.limiter = SendLimiter(MetricsRegistry(), initial=2, maximum=4, slow_seconds=3.0)
+    
+    async def send(self, destination):
+        entity = await self.client.get_entity(destination)
+        async with self.limiter.slot(destination):
+            return await self.limiter.measure(destination, self.client.send_message, entity, "alert")
+    
+    def test_slot_waits_while_the_destination_is_at_its_limit(self):
+        async def scenario():
+            release = asyncio.Event()
+            
+            async def hold():
+                async with self.limiter.slot(2000):
+                    await release.wait()
+            
+            holders = [asyncio.create_task(hold()) for _ in range(3)]
+            await asyncio.sleep(0)
+            active = self.limiter.active[2000]
+            waiting = len(self.limiter.waiters[2000])
+            release.set()
+            await asyncio.gather(*holders)
+            return active, waiting
+        
+        self.assertEqual(asyncio.run(scenario()), (2, 1))
+        self.assertEqual(self.limiter.active[2000], 0)
+        self.assertNotIn(2000, self.limiter.waiters)
+    
+    def test_clean_sends_raise_the_limit(self):
+        async def scenario():
+            for _ in range(6):
+                await self.send(2000)
+        
+        asyncio.run(scenario())
+        self.assertGreater(self.limiter.limit(2000), 3)
+        self.assertLessEqual(self.limiter.limit(2000), 4)
+        self.assertEqual(self.limiter.limit(2001), 2)  # Other destinations keep their own limit
+    
+    def test_flood_wait_halves_the_limit_once(self):
+        self.client.flood_every = 1
+        self.limiter.limits[2000] = 4.0
+        
+        async def scenario():
+            for _ in range(2):
+                with self.assertRaises(FloodWaitError):
+                    await self.send(2000)
+        
+        asyncio.run(scenario())
+        self.assertEqual(self.limiter.limit(2000), 2.0)  # The second flood wait is part of the same burst
+    
+    def test_cancelled_waiter_does_not_keep_a_slot(self):
+        self.limiter.limits[2000] = 1.0
+        
+        async def scenario():
+            release = asyncio.Event()
+            
+            async def hold():
+                async with self.limiter.slot(2000):
+                    await release.wait()
+            
+            holder = asyncio.create_task(hold())
+            waiter = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            release.set()
+            await asyncio.gather(holder, waiter, return_exceptions=True)
+        
+        asyncio.run(scenario())
+        self.assertEqual(self.limiter.active[2000], 0)
+    
+    def test_saved_limits_are_clamped_on_load(self):
+        self.limiter.load({'2000': 99, '2001': 0.2, 'bad': 'x'})
+        self.assertEqual(self.limiter.to_json(), {'2000': 4, '2001': 1.0})
+
+
+if __name__ == '__main__':
+    unittest.main()